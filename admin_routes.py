@@ -1,18 +1,30 @@
-from flask import render_template, request, redirect, url_for, flash, session, make_response
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session, Response, stream_with_context
 from flask_login import login_required, current_user
-from werkzeug.security import check_password_hash
-from werkzeug.utils import secure_filename
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime
-import csv
-import io
+import json
 import os
-import random
-from app import app, db
-from models import Admin, Quiz, QuizSubmission, User, Winner
+import shutil
+import tempfile
+from app import db, quiz_cache, submission_queue, submission_index, photo_pipeline, fragment_cache, password_hasher, identity_cache, live_broker, sqlite_tuning, replica_router, submission_partitions
+from models import Admin, LeaderboardBucket, Quiz, Question, User, Winner
 from forms import AdminLoginForm, CreateQuizForm
+from passwords import HashingBusy
+from quiz_cache import QuizQuestion, QuizSnapshot
+from routes import write_results_snapshot
+import instrumentation
+import leaderboard
+import live
+import quiz_questions
 import secrets
 import string
 
+bp = Blueprint('admin', __name__)
+
+# Starting point of the create quiz form
+BLANK_QUESTIONS = [QuizQuestion('', ('', ''), 0)] * 2
+
 # Allowed file extensions for uploads
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -24,48 +36,98 @@ def admin_required(f):
     def admin_decorated_function(*args, **kwargs):
         if not session.get('admin_logged_in'):
             flash('Admin access required.', 'danger')
-            return redirect(url_for('admin_login'))
+            return redirect(url_for('admin.admin_login'))
         return f(*args, **kwargs)
     admin_decorated_function.__name__ = f.__name__
     return admin_decorated_function
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@bp.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if session.get('admin_logged_in'):
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('admin.admin_dashboard'))
     
     form = AdminLoginForm()
     if form.validate_on_submit():
         admin = Admin.query.filter_by(email=form.username.data).first()
-        if admin and check_password_hash(admin.password_hash, form.password.data):
+        try:
+            valid = admin and password_hasher.check_and_upgrade(admin, form.password.data)
+        except HashingBusy:
+            flash('Too many logins right now, please try again in a moment.', 'warning')
+            return render_template('admin_login.html', form=form), 503
+        if valid:
+            db.session.commit()  # Saves a re-hashed password
             session['admin_logged_in'] = True
             session['admin_id'] = admin.id
             flash('Admin login successful!', 'success')
-            return redirect(url_for('admin_dashboard'))
+            return redirect(url_for('admin.admin_dashboard'))
         else:
             flash('Invalid credentials', 'danger')
     
     return render_template('admin_login.html', form=form)
 
-@app.route('/admin/logout')
+@bp.route('/admin/logout')
 @admin_required
 def admin_logout():
     session.pop('admin_logged_in', None)
     session.pop('admin_id', None)
     flash('Admin logged out successfully.', 'info')
-    return redirect(url_for('admin_login'))
+    return redirect(url_for('admin.admin_login'))
 
-@app.route('/admin/dashboard')
+@bp.route('/admin/dashboard')
 @admin_required
+@replica_router.read_only
 def admin_dashboard():
-    # Get all quizzes
-    quizzes = Quiz.query.order_by(Quiz.created_at.desc()).all()
+    # Submission counts for every quiz in one GROUP BY over the leaderboard
+    # buckets, which also count the submissions of archived quizzes
+    counts = db.session.query(
+        LeaderboardBucket.quiz_id,
+        func.sum(LeaderboardBucket.entries).label('submission_count')
+    ).group_by(LeaderboardBucket.quiz_id).subquery()
+    
+    # Get all quizzes as (quiz, submission_count) with winner names joined in
+    quizzes = db.session.query(Quiz, func.coalesce(counts.c.submission_count, 0))\
+        .outerjoin(counts, counts.c.quiz_id == Quiz.id)\
+        .options(joinedload(Quiz.winner).load_only(User.name), selectinload(Quiz.archive))\
+        .order_by(Quiz.created_at.desc()).all()
     
     # Get current time for status checking
     now = datetime.utcnow()
     
     return render_template('admin_dashboard.html', quizzes=quizzes, now=now)
 
+@bp.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Latency histograms and cache counters for this worker process"""
+    return {
+        'pid': os.getpid(),
+        'endpoints': instrumentation.metrics.snapshot(),
+        'quiz_cache': quiz_cache.stats(),
+        'submission_queue_depth': submission_queue.depth(),
+        'submission_queue_failed': submission_queue.failed(),
+        'submission_index': submission_index.stats(),
+        'fragment_cache': fragment_cache.stats(),
+        'password_hasher': password_hasher.stats(),
+        'identity_cache': identity_cache.stats(),
+        'live': live_broker.stats(),
+        'sqlite': sqlite_tuning.stats(),
+        'replica': replica_router.stats(),
+        'partitions': submission_partitions.stats(),
+    }
+
+@bp.route('/admin/query-plans')
+@admin_required
+def query_plans():
+    """EXPLAIN of the hot queries, flagging full table scans and sorts (flask --app main explain-queries)"""
+    import query_plans
+    
+    reports = query_plans.audit()
+    return {
+        'dialect': db.engine.dialect.name,
+        'flagged': sum(1 for report in reports if not report.ok),
+        'queries': [report._asdict() for report in reports],
+    }
+
 def generate_quiz_url():
     """Generate a unique URL for quiz access"""
     while True:
@@ -73,7 +135,7 @@ def generate_quiz_url():
         if not Quiz.query.filter_by(quiz_url=url).first():
             return url
 
-@app.route('/admin/create-quiz', methods=['GET', 'POST'])
+@bp.route('/admin/create-quiz', methods=['GET', 'POST'])
 @admin_required
 def create_quiz():
     if request.method == 'POST':
@@ -81,92 +143,87 @@ def create_quiz():
         title = request.form.get('title')
         start_time = datetime.fromisoformat(request.form.get('start_time'))
         end_time = datetime.fromisoformat(request.form.get('end_time'))
-        question1 = request.form.get('question1')
-        question2 = request.form.get('question2')
-        
-        # Get question 1 options
-        q1_options = []
-        q1_correct = int(request.form.get('question1_correct'))
-        i = 1
-        while request.form.get(f'question1_option{i}'):
-            q1_options.append(request.form.get(f'question1_option{i}'))
-            i += 1
         
-        # Get question 2 options
-        q2_options = []
-        q2_correct = int(request.form.get('question2_correct'))
-        i = 1
-        while request.form.get(f'question2_option{i}'):
-            q2_options.append(request.form.get(f'question2_option{i}'))
-            i += 1
+        # Read question{n} fields for as many questions as were posted
+        try:
+            questions = quiz_questions.parse_form(request.form)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return render_template('create_quiz.html', questions=BLANK_QUESTIONS)
         
         # Create quiz
         quiz = Quiz(
             title=title,
             start_time=start_time,
             end_time=end_time,
-            question1=question1,
-            question1_options=q1_options,
-            question1_correct=q1_correct,
-            question2=question2,
-            question2_options=q2_options,
-            question2_correct=q2_correct,
             quiz_url=generate_quiz_url()
         )
         
         db.session.add(quiz)
+        quiz_questions.store(quiz, questions)
         db.session.commit()
+        quiz_cache.invalidate()
+        live_broker.publish(live.QUIZZES_CHANNEL, 'quiz', live.quiz_state(quiz, 'scheduled'))
         
         flash('Quiz created successfully!', 'success')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('admin.admin_dashboard'))
     
-    return render_template('create_quiz.html')
+    return render_template('create_quiz.html', questions=BLANK_QUESTIONS)
 
-@app.route('/admin/edit-quiz/<int:quiz_id>', methods=['GET', 'POST'])
+@bp.route('/admin/edit-quiz/<int:quiz_id>', methods=['GET', 'POST'])
 @admin_required
 def edit_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
+    quiz = Quiz.query.options(selectinload(Quiz.questions).selectinload(Question.options)).get_or_404(quiz_id)
+    
+    # Re-scoring only updates the hot partition
+    if quiz.archive:
+        flash(f'This quiz is archived. Restore it with "flask --app main restore-quiz {quiz_id}" to edit it.', 'warning')
+        return redirect(url_for('admin.admin_dashboard'))
     
     if request.method == 'POST':
         quiz.title = request.form.get('title')
         quiz.start_time = datetime.fromisoformat(request.form.get('start_time'))
         quiz.end_time = datetime.fromisoformat(request.form.get('end_time'))
-        quiz.question1 = request.form.get('question1')
-        quiz.question2 = request.form.get('question2')
         
-        # Update question 1 options
-        q1_options = []
-        q1_correct = int(request.form.get('question1_correct'))
-        i = 1
-        while request.form.get(f'question1_option{i}'):
-            q1_options.append(request.form.get(f'question1_option{i}'))
-            i += 1
-        quiz.question1_options = q1_options
-        quiz.question1_correct = q1_correct
-        
-        # Update question 2 options
-        q2_options = []
-        q2_correct = int(request.form.get('question2_correct'))
-        i = 1
-        while request.form.get(f'question2_option{i}'):
-            q2_options.append(request.form.get(f'question2_option{i}'))
-            i += 1
-        quiz.question2_options = q2_options
-        quiz.question2_correct = q2_correct
+        try:
+            questions = quiz_questions.parse_form(request.form)
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return render_template('edit_quiz.html', quiz=quiz,
+                                 questions=QuizSnapshot.from_model(quiz).questions)
+        old_answer_key = tuple(question.correct_option for question in quiz.questions)
+        quiz_questions.store(quiz, questions)
         
         db.session.commit()
+        quiz_cache.invalidate()
         flash('Quiz updated successfully!', 'success')
-        return redirect(url_for('admin_dashboard'))
+        
+        # Stored scores were computed with the old answer key
+        if tuple(question.correct for question in questions) != old_answer_key:
+            submission_queue.flush(quiz_id)
+            import rescoring  # Loads NumPy, so only on first use
+            result = rescoring.rescore_quiz(quiz_id, current_app.config['RESCORE_CHUNK_SIZE'])
+            quiz_cache.invalidate()  # The winner may have changed
+            flash(f'Answer key changed: re-scored {result.submissions} submissions '
+                  f'({result.changed} scores changed).', 'info')
+        # Carousel shows quiz titles; leaderboards show scores and question counts
+        fragment_cache.invalidate('winners', 'results')
+        if quiz.results_published:
+            write_results_snapshot(quiz_id)
+        live_broker.publish(live.QUIZZES_CHANNEL, 'quiz', live.quiz_state(quiz, 'updated'))
+        return redirect(url_for('admin.admin_dashboard'))
     
-    return render_template('edit_quiz.html', quiz=quiz)
+    return render_template('edit_quiz.html', quiz=quiz,
+                         questions=QuizSnapshot.from_model(quiz).questions)
 
-@app.route('/admin/winners')
+@bp.route('/admin/winners')
 @admin_required
 def manage_winners():
     winners = Winner.query.order_by(Winner.display_order).all()
     return render_template('manage_winners.html', winners=winners)
 
-@app.route('/admin/winner/add', methods=['GET', 'POST'])
+@bp.route('/admin/winner/add', methods=['GET', 'POST'])
 @admin_required
 def add_winner():
     if request.method == 'POST':
@@ -175,23 +232,8 @@ def add_winner():
         if 'photo' in request.files:
             file = request.files['photo']
             if file and file.filename != '' and allowed_file(file.filename):
-                # Create uploads directory if it doesn't exist
-                upload_dir = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
-                os.makedirs(upload_dir, exist_ok=True)
-                
-                # Generate secure filename
-                filename = secure_filename(file.filename)
-                # Add timestamp to avoid conflicts
-                timestamp = str(int(datetime.utcnow().timestamp()))
-                name, ext = os.path.splitext(filename)
-                filename = f"{name}_{timestamp}{ext}"
-                
-                # Save file
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                
-                # Store relative path for database
-                photo_url = f"uploads/{filename}"
+                # Stored under its content hash; resized variants are made in the background
+                photo_url = photo_pipeline.save_upload(file)
         
         winner = Winner(
             name=request.form.get('name'),
@@ -202,20 +244,22 @@ def add_winner():
         )
         db.session.add(winner)
         db.session.commit()
+        photo_pipeline.refresh([winner.photo_url])
+        fragment_cache.invalidate('winners')
         flash('Winner added successfully!', 'success')
-        return redirect(url_for('manage_winners'))
+        return redirect(url_for('admin.manage_winners'))
     
     quizzes = Quiz.query.filter_by(is_locked=True).all()
     return render_template('add_winner.html', quizzes=quizzes)
 
-@app.route('/admin/create_sample_winners')
+@bp.route('/admin/create_sample_winners')
 @admin_required
 def create_sample_winners():
     # Check if winners already exist
     existing_winners = Winner.query.count()
     if existing_winners > 0:
         flash('Sample winners already exist!', 'info')
-        return redirect(url_for('manage_winners'))
+        return redirect(url_for('admin.manage_winners'))
     
     # Create sample winners
     sample_winners = [
@@ -239,135 +283,194 @@ def create_sample_winners():
         }
     ]
     
+    winners = []
     for winner_data in sample_winners:
         winner = Winner(
             name=winner_data['name'],
             achievement=winner_data['achievement'],
-            photo_url=winner_data['photo_url'],
+            photo_url=photo_pipeline.ingest(winner_data['photo_url']),
             display_order=winner_data['display_order'],
             is_active=True
         )
         db.session.add(winner)
+        winners.append(winner)
     
     db.session.commit()
+    photo_pipeline.refresh(winner.photo_url for winner in winners)
+    fragment_cache.invalidate('winners')
     flash('Sample winners created successfully!', 'success')
-    return redirect(url_for('manage_winners'))
+    return redirect(url_for('admin.manage_winners'))
 
-@app.route('/admin/winner/<int:winner_id>/delete')
+@bp.route('/admin/winner/<int:winner_id>/delete')
 @admin_required
 def delete_winner(winner_id):
     winner = Winner.query.get_or_404(winner_id)
     db.session.delete(winner)
     db.session.commit()
+    photo_pipeline.forget(winner.photo_url)
+    fragment_cache.invalidate('winners')
     flash('Winner removed successfully!', 'success')
-    return redirect(url_for('manage_winners'))
+    return redirect(url_for('admin.manage_winners'))
+
+@bp.route('/admin/users/import', methods=['GET', 'POST'])
+@admin_required
+def import_users():
+    """Upload a CSV/JSONL of users; the response streams one JSON progress line per batch"""
+    if request.method == 'POST':
+        import user_import
+        
+        file = request.files.get('file')
+        if not file or not file.filename:
+            return {'error': 'Choose a CSV or JSONL file to import.'}, 400
+        fmt = request.form.get('format') or user_import.format_for(file.filename)
+        if fmt not in user_import.IMPORT_FORMATS:
+            return {'error': f'Unknown import format "{fmt}".'}, 400
+        
+        # Werkzeug closes the upload when the request ends, before the
+        # streamed response is generated, so keep a copy of our own
+        upload = tempfile.TemporaryFile()
+        shutil.copyfileobj(file.stream, upload)
+        upload.seek(0)
+        rejects = []
+        
+        def progress():
+            records = user_import.read_records(upload, fmt)
+            sent = 0
+            try:
+                for report in user_import.iter_import(records, on_reject=rejects.append):
+                    # New rejects go out with each progress line, up to as many as the report keeps
+                    batch = [reject._asdict() for reject in rejects[:report.keep_rejects - sent]]
+                    sent += len(batch)
+                    rejects.clear()
+                    yield json.dumps({'progress': report.as_dict(), 'rejects': batch}) + '\n'
+            except UnicodeDecodeError:
+                yield json.dumps({'error': 'The file is not UTF-8 text.'}) + '\n'
+            finally:
+                upload.close()
+        
+        return Response(stream_with_context(progress()), mimetype='application/x-ndjson')
+    
+    return render_template('import_users.html')
 
-@app.route('/admin/quiz/<int:quiz_id>/submissions')
+@bp.route('/admin/quiz/<int:quiz_id>/submissions')
 @admin_required
+@replica_router.read_only
+@submission_partitions.route_by_quiz
 def view_submissions(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     
-    # Get all submissions for this quiz
-    submissions = db.session.query(QuizSubmission, User).join(User).filter(
-        QuizSubmission.quiz_id == quiz_id
-    ).order_by(QuizSubmission.score.desc(), QuizSubmission.time_taken.asc()).all()
+    # One keyset page of submissions, with user name and email loaded alongside
+    results = leaderboard.page_from_request(quiz_id, user_fields=(User.name, User.email))
     
-    return render_template('view_submissions.html', quiz=quiz, submissions=submissions)
+    if request.args.get('format') == 'json':
+        sheets = quiz_questions.answer_sheets([submission.id for _, submission in results.entries])
+        return {
+            'entries': [{
+                'rank': rank,
+                'name': submission.user.name,
+                'email': submission.user.email,
+                'score': submission.score,
+                'correct_answers': submission.correct_answers,
+                'answers': sheets[submission.id],
+                'time_taken': submission.time_taken,
+                'bonus_awarded': submission.bonus_awarded,
+                'submitted_at': submission.submitted_at.isoformat(),
+            } for rank, submission in results.entries],
+            'next_cursor': results.next_cursor,
+        }
+    
+    return render_template('view_submissions.html', quiz=quiz,
+                         questions=quiz_cache.get_quiz_or_404(quiz_id).questions,
+                         entries=results.entries,
+                         next_cursor=results.next_cursor,
+                         total_submissions=leaderboard.total_submissions(quiz_id),
+                         live_cursor=live_broker.cursor())
+
+@bp.route('/admin/quiz/<int:quiz_id>/live')
+@admin_required
+def live_submissions(quiz_id):
+    """New submissions and state changes of one quiz as Server-Sent Events (?format=json long-polls)"""
+    channels = [live.QUIZZES_CHANNEL, live.quiz_channel(quiz_id)]
+    if request.args.get('format') == 'json':
+        return live_broker.long_poll(channels)
+    return live_broker.stream(channels)
 
-@app.route('/admin/quiz/<int:quiz_id>/lock')
+@bp.route('/admin/quiz/<int:quiz_id>/lock')
 @admin_required
 def lock_quiz(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     
     if quiz.is_locked:
         flash('Quiz is already locked.', 'warning')
-        return redirect(url_for('admin_dashboard'))
-    
-    # Lock the quiz
-    quiz.is_locked = True
+        return redirect(url_for('admin.admin_dashboard'))
     
-    # Determine winner
-    submissions = QuizSubmission.query.filter_by(quiz_id=quiz_id)\
-        .order_by(QuizSubmission.score.desc(), QuizSubmission.time_taken.asc()).all()
+    # Lock the quiz first: from this commit on, inserts drop new submissions
+    # for it (see submissions.insert_submissions). Submissions queued until
+    # then are written on leaving the block, so the winner is picked from
+    # all of them and nothing lands after it.
+    with submission_queue.closing(quiz_id):
+        quiz.is_locked = True
+        db.session.commit()
+        quiz_cache.invalidate()
     
-    if submissions:
-        # Get highest score
-        highest_score = submissions[0].score
-        top_submissions = [s for s in submissions if s.score == highest_score]
-        
-        if len(top_submissions) == 1:
-            # Clear winner
-            winner = top_submissions[0]
-        else:
-            # Tie-breaker: fastest time
-            fastest_time = min(s.time_taken for s in top_submissions)
-            fastest_submissions = [s for s in top_submissions if s.time_taken == fastest_time]
-            
-            if len(fastest_submissions) == 1:
-                # Fastest time wins
-                winner = fastest_submissions[0]
-            else:
-                # Random selection among tied submissions
-                winner = random.choice(fastest_submissions)
-        
+    # Determine winner: highest score, then fastest time, then random
+    winner = leaderboard.pick_winner(quiz_id)
+    if winner:
         quiz.winner_id = winner.user_id
     
     db.session.commit()
+    live_broker.publish(live.QUIZZES_CHANNEL, 'quiz', live.quiz_state(quiz, 'locked'))
     
     flash('Quiz locked successfully! Winner has been determined.', 'success')
-    return redirect(url_for('view_submissions', quiz_id=quiz_id))
+    return redirect(url_for('admin.view_submissions', quiz_id=quiz_id))
 
-@app.route('/admin/quiz/<int:quiz_id>/publish-results')
+@bp.route('/admin/quiz/<int:quiz_id>/publish-results')
 @admin_required
 def publish_results(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     
     if not quiz.is_locked:
         flash('Quiz must be locked before publishing results.', 'warning')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('admin.admin_dashboard'))
     
     quiz.results_published = True
     db.session.commit()
+    quiz_cache.invalidate()
+    fragment_cache.invalidate('results')
+    write_results_snapshot(quiz_id)
+    live_broker.publish(live.QUIZZES_CHANNEL, 'quiz', live.quiz_state(quiz, 'published'))
     
     flash('Results published successfully!', 'success')
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('admin.admin_dashboard'))
 
-@app.route('/admin/quiz/<int:quiz_id>/export-csv')
-@admin_required
-def export_csv(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-    
-    # Get all submissions with user data
-    submissions = db.session.query(QuizSubmission, User).join(User).filter(
-        QuizSubmission.quiz_id == quiz_id
-    ).order_by(QuizSubmission.score.desc(), QuizSubmission.time_taken.asc()).all()
-    
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
+def stream_export_response(basename, quiz_id=None):
+    """Stream an export in the requested format (?format=csv|jsonl|parquet, ?gzip=1)"""
+    import exports  # Loads PyArrow, so only on first use
     
-    # Write headers
-    writer.writerow([
-        'Name', 'Email', 'Answer 1', 'Answer 2', 'Score', 
-        'Time Taken (seconds)', 'Bonus Awarded', 'Submitted At'
-    ])
+    fmt = request.args.get('format', 'csv')
+    if not exports.format_available(fmt):
+        flash(f'Export format "{fmt}" is not available.', 'danger')
+        return redirect(url_for('admin.admin_dashboard'))
     
-    # Write data
-    for submission, user in submissions:
-        writer.writerow([
-            user.name,
-            user.email,
-            chr(65 + submission.answer1),  # Convert to A, B, C, D
-            chr(65 + submission.answer2),
-            submission.score,
-            submission.time_taken,
-            'Yes' if submission.bonus_awarded else 'No',
-            submission.submitted_at.strftime('%Y-%m-%d %H:%M:%S')
-        ])
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Disposition'] = f'attachment; filename={quiz.title}_results.csv'
-    response.headers['Content-type'] = 'text/csv'
+    compress = request.args.get('gzip') == '1'
+    body = exports.stream_export(fmt, quiz_id=quiz_id, compress=compress,
+                                 chunk_size=current_app.config['EXPORT_CHUNK_SIZE'])
+    filename = exports.export_filename(basename, fmt, compress)
+    mimetype = 'application/gzip' if filename.endswith('.gz') else exports.MIMETYPES[fmt]
     
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
     return response
+
+@bp.route('/admin/quiz/<int:quiz_id>/export-csv')
+@admin_required
+@replica_router.read_only
+def export_csv(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    return stream_export_response(f'{quiz.title}_results', quiz_id=quiz_id)
+
+@bp.route('/admin/export-history')
+@admin_required
+@replica_router.read_only
+def export_history():
+    return stream_export_response('submissions_history')
@@ -5,6 +5,19 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from jinja2 import FileSystemBytecodeCache
+from quiz_cache import QuizCache
+from submission_queue import SubmissionQueue
+from submission_index import SubmissionIndex
+from photos import PhotoPipeline
+from fragment_cache import FragmentCache
+from passwords import PasswordHasher
+from identity import IdentityCache
+from live import LiveBroker
+from sqlite_tuning import SQLiteTuning
+from replicas import ReplicaRouter, RoutingSession, REPLICA_BIND
+from partitions import SubmissionPartitions
+import instrumentation
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,67 +25,202 @@ logging.basicConfig(level=logging.DEBUG)
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 login_manager = LoginManager()
+quiz_cache = QuizCache()
+submission_queue = SubmissionQueue()
+submission_index = SubmissionIndex()
+photo_pipeline = PhotoPipeline()
+fragment_cache = FragmentCache()
+password_hasher = PasswordHasher()
+identity_cache = IdentityCache()
+live_broker = LiveBroker()
+sqlite_tuning = SQLiteTuning()
+replica_router = ReplicaRouter()
+submission_partitions = SubmissionPartitions()
 
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "quiz-competition-secret-key-2024")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///quiz_competition.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-
-# File upload configuration
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# File types accepted for winner photo uploads
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Ensure upload directory exists
-upload_dir = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
-os.makedirs(upload_dir, exist_ok=True)
+@login_manager.user_loader
+def load_user(user_id):
+    # A cached Identity (id, name, email) rather than a User row per request
+    return identity_cache.load(user_id)
 
-# Initialize extensions
-db.init_app(app)
-login_manager.init_app(app)
-login_manager.login_view = 'login'  # type: ignore
-login_manager.login_message = 'Please log in to access this page.'
+def create_app(config=None):
+    """Build the Flask app; ``config`` overrides the environment-derived settings.
 
-# Add chr function to Jinja2 globals
-app.jinja_env.globals['chr'] = chr
+    Nothing here touches the database, so a worker boots without waiting
+    on it. Schema changes and the admin account are one-shot commands
+    (see cli.py): ``flask --app main migrate`` and ``flask --app main seed``.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "quiz-competition-secret-key-2024")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-@login_manager.user_loader
-def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    # configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///quiz_competition.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+
+    # Optional read replica for the read-heavy pages, and seconds it may trail
+    # the primary: a browser that just wrote reads from the primary that long
+    # (see replicas.py)
+    if os.environ.get("DATABASE_REPLICA_URL"):
+        app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: os.environ["DATABASE_REPLICA_URL"]}
+    app.config['REPLICA_MAX_LAG'] = float(os.environ.get("REPLICA_MAX_LAG", 5))
+
+    # SQLite only: journal mode, synchronous level (NORMAL loses at most the
+    # last commits on power loss, FULL none), milliseconds to wait for a lock,
+    # and whether writes from all workers queue for one writer lock instead of
+    # retrying on "database is locked" (see sqlite_tuning.py)
+    app.config['SQLITE_JOURNAL_MODE'] = os.environ.get("SQLITE_JOURNAL_MODE", "wal")
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get("SQLITE_SYNCHRONOUS", "normal")
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+    app.config['SQLITE_SERIALIZE_WRITES'] = os.environ.get("SQLITE_SERIALIZE_WRITES", "1") == "1"
+
+    # Submissions of locked, published quizzes move to an archive partition
+    # this many days after the quiz ended (flask --app main archive-quizzes),
+    # so open quizzes only query the hot tables; on SQLite the archive is a
+    # second file, by default next to the database (see partitions.py)
+    app.config['SUBMISSION_ARCHIVE_AFTER_DAYS'] = int(os.environ.get("SUBMISSION_ARCHIVE_AFTER_DAYS", 7))
+    app.config['SUBMISSION_ARCHIVE_PATH'] = os.environ.get("SUBMISSION_ARCHIVE_PATH")
+
+    # Submission ingestion: "direct" commits each submission in the request;
+    # "batched" queues scored submissions in a local file and a background
+    # writer inserts them in multi-row batches (see submission_queue.py)
+    app.config["SUBMISSION_INGESTION"] = os.environ.get("SUBMISSION_INGESTION", "direct")
+    app.config["SUBMISSION_BATCH_SIZE"] = int(os.environ.get("SUBMISSION_BATCH_SIZE", 500))
+    app.config["SUBMISSION_FLUSH_INTERVAL"] = float(os.environ.get("SUBMISSION_FLUSH_INTERVAL", 0.5))
+
+    # Quiz snapshot cache: seconds a snapshot lives, and how often workers
+    # check the shared version file for admin changes
+    app.config['QUIZ_CACHE_TTL'] = int(os.environ.get("QUIZ_CACHE_TTL", 30))
+    app.config['QUIZ_CACHE_VERSION_CHECK'] = float(os.environ.get("QUIZ_CACHE_VERSION_CHECK", 1))
+
+    # Rendered template fragments (winners carousel, published leaderboards)
+    # kept per worker; admin changes bump per-namespace version files
+    app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get("FRAGMENT_CACHE_SIZE", 256))
+    app.config['FRAGMENT_CACHE_VERSION_CHECK'] = float(os.environ.get("FRAGMENT_CACHE_VERSION_CHECK", 1))
+
+    # In-memory "has submitted" bitmaps for open quizzes: seconds between
+    # catch-up queries for submissions made in other workers
+    app.config['SUBMISSION_INDEX_REFRESH'] = float(os.environ.get("SUBMISSION_INDEX_REFRESH", 1))
+
+    # Leaderboard pagination (results and admin submissions pages)
+    app.config['LEADERBOARD_PAGE_SIZE'] = 50
+    app.config['LEADERBOARD_MAX_PAGE_SIZE'] = 200
+
+    # Request instrumentation: statements slower than this are logged, and
+    # Server-Timing headers expose per-request DB time to the browser
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get("SLOW_QUERY_MS", 100))
+    app.config['SERVER_TIMING_HEADER'] = True
+
+    # Debug aid: fail any request that runs more SQL statements than this
+    # (e.g. QUERY_BUDGET=10 to catch N+1 queries); unset to disable
+    app.config['QUERY_BUDGET'] = int(os.environ["QUERY_BUDGET"]) if os.environ.get("QUERY_BUDGET") else None
+
+    # Public pages (published results, winner landing): seconds a browser or
+    # reverse proxy may reuse a copy before revalidating with its ETag. With
+    # RESULTS_SNAPSHOTS=1, publishing a quiz also pre-renders its results page
+    # to disk for anonymous visitors
+    app.config['PAGE_CACHE_MAX_AGE'] = int(os.environ.get("PAGE_CACHE_MAX_AGE", 60))
+    app.config['RESULTS_SNAPSHOT_DIR'] = (os.path.join(app.instance_path, 'results_snapshots')
+                                          if os.environ.get("RESULTS_SNAPSHOTS") == "1" else None)
+
+    # Logged-in identities: seconds one is trusted from the worker's LRU or the
+    # session cookie before the user row is read again, and LRU size
+    app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get("IDENTITY_CACHE_TTL", 300))
+    app.config['IDENTITY_CACHE_SIZE'] = 10000
+
+    # Password hashing: Werkzeug method string (cost parameters included;
+    # stored hashes with other parameters are upgraded at the next login) and
+    # the process pool that runs hashes off the request thread (0 = inline)
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    app.config['PASSWORD_HASH_QUEUE_LIMIT'] = int(os.environ.get("PASSWORD_HASH_QUEUE_LIMIT", 256))
+
+    # Live updates: how pages receive them ("poll": bounded JSON long polls;
+    # "sse": Server-Sent Events streams, which hold a request thread each and
+    # need the threaded workers of gunicorn.conf.py), how often each worker
+    # checks the shared event journal, open streams allowed per worker and
+    # seconds a stream stays open before the browser reconnects
+    app.config['LIVE_TRANSPORT'] = os.environ.get("LIVE_TRANSPORT", "poll")
+    app.config['LIVE_POLL_INTERVAL'] = float(os.environ.get("LIVE_POLL_INTERVAL", 0.5))
+    app.config['LIVE_MAX_SUBSCRIBERS'] = int(os.environ.get("LIVE_MAX_SUBSCRIBERS", 1000))
+    app.config['LIVE_STREAM_TIMEOUT'] = int(os.environ.get("LIVE_STREAM_TIMEOUT", 300))
+
+    # Rows fetched per round trip when streaming exports
+    app.config['EXPORT_CHUNK_SIZE'] = 1000
+
+    # Bulk user import: processes hashing passwords (0 = inline) and users
+    # inserted per statement
+    app.config['USER_IMPORT_WORKERS'] = int(os.environ.get("USER_IMPORT_WORKERS", os.cpu_count() or 1))
+    app.config['USER_IMPORT_BATCH_SIZE'] = 1000
+
+    # Rows read and updated per statement when re-scoring a quiz
+    app.config['RESCORE_CHUNK_SIZE'] = 5000
+
+    # File upload configuration
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+
+    # Winner photos: responsive widths and formats written next to each
+    # content-addressed upload by a background worker pool (needs Pillow)
+    app.config['PHOTO_WIDTHS'] = (128, 256, 512)
+    app.config['PHOTO_FORMATS'] = ('avif', 'webp')
+    app.config['PHOTO_WORKERS'] = int(os.environ.get("PHOTO_WORKERS", 2))
+    # Log photo index entries (JSON, "quiz.photos" logger) on winner pages
+    app.config['PHOTO_DEBUG'] = os.environ.get("PHOTO_DEBUG") == "1"
+
+    # Compiled templates are kept on disk (filled by `flask precompile-templates`
+    # or by the first render), so new workers skip parsing Jinja source
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get("TEMPLATE_CACHE_DIR",
+                                                      os.path.join(app.instance_path, 'jinja_cache'))
+
+    if config:
+        app.config.update(config)
+
+    # Ensure upload directory exists
+    upload_dir = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+    os.makedirs(upload_dir, exist_ok=True)
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+    # Initialize extensions
+    db.init_app(app)
+    sqlite_tuning.init_app(app)
+    replica_router.init_app(app)
+    submission_partitions.init_app(app)
+    login_manager.init_app(app)
+    quiz_cache.init_app(app)
+    submission_queue.init_app(app)
+    submission_index.init_app(app)
+    instrumentation.init_app(app)
+    photo_pipeline.init_app(app)
+    fragment_cache.init_app(app)
+    password_hasher.init_app(app)
+    identity_cache.init_app(app)
+    live_broker.init_app(app)
+    login_manager.login_view = 'main.login'  # type: ignore
+    login_manager.login_message = 'Please log in to access this page.'
+
+    # Add chr function to Jinja2 globals
+    app.jinja_env.globals['chr'] = chr
 
-with app.app_context():
     # Import models to ensure they're registered
     import models
+    identity_cache.watch(models.User)
+
+    # Routes are imported here rather than at module import, so importing
+    # app (models, helpers, benchmarks) does not pull in every view
+    from routes import bp as main_bp
+    from admin_routes import bp as admin_bp
+    app.register_blueprint(main_bp)
+    app.register_blueprint(admin_bp)
 
-    # Create tables
-    db.create_all()
-
-    # Create admin user if it doesn't exist
-    from models import Admin
-    from werkzeug.security import generate_password_hash
-
-    # Create the Algo admin user if it doesn't exist
-    admin = Admin.query.filter_by(username='Algo admin').first()
-    if not admin:
-        admin = Admin(
-            username='Algo admin',
-            email='kaviiarasan.sv@gktech.ai',
-            password_hash=generate_password_hash('algogkt@123')
-        )
-        db.session.add(admin)
-        db.session.commit()
-        print("Algo admin user created with email: kaviiarasan.sv@gktech.ai")
-
-# Import routes
-from routes import *
-from admin_routes import *
\ No newline at end of file
+    import cli
+    cli.init_app(app)
+    return app
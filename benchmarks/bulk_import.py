@@ -0,0 +1,73 @@
+"""Benchmark for the bulk user import.
+
+Writes a CSV of N users (a few duplicate and invalid rows included, as in
+real exports from HR systems), then times user_import.import_users() for
+each hashing pool size: parsing, de-duplication, hashing and the batched
+inserts. Reports users imported per second and the projected time for
+100k users.
+
+    python benchmarks/bulk_import.py --users 5000
+    python benchmarks/bulk_import.py --users 20000 --workers 0 2 4 8
+    python benchmarks/bulk_import.py --hash-method pbkdf2:sha256:100000
+
+By default a fresh SQLite file is used; pass --database-url to run
+against Postgres (the database should be empty). Each pool size imports
+its own set of emails.
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+
+import common
+
+
+def write_users(path, users, run):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'email', 'password'])
+        for i in range(users):
+            writer.writerow([f'Employee {i}', f'employee-{run}-{i}@example.com', f'password-{i}'])
+            if i % 500 == 0:
+                writer.writerow([f'Employee {i}', f'employee-{run}-{i}@example.com', f'password-{i}'])
+                writer.writerow(['X', f'not-an-email-{i}', 'short'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=5000, help='users in the generated file')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count() or 1],
+                        help='hashing pool sizes to compare (0 = inline)')
+    parser.add_argument('--batch-size', type=int, help='users per INSERT (default: USER_IMPORT_BATCH_SIZE)')
+    parser.add_argument('--hash-method', help='hash method for imported passwords (default: PASSWORD_HASH_METHOD)')
+    parser.add_argument('--database-url', help='database to import into (default: fresh temporary SQLite file)')
+    args = parser.parse_args()
+
+    app = common.load_app(args.database_url)
+    import user_import
+
+    directory = tempfile.mkdtemp(prefix='quiz-bench-import-')
+    method = args.hash_method or app.config['PASSWORD_HASH_METHOD']
+    print(f'Hash method {method}, {os.cpu_count()} cores')
+    print(f"\n{'workers':<10}{'read':>10}{'imported':>10}{'rejected':>10}{'seconds':>10}"
+          f"{'users/s':>10}{'100k users':>12}")
+    for workers in args.workers:
+        path = os.path.join(directory, f'users-{workers}.csv')
+        write_users(path, args.users, f'w{workers}')
+        with app.app_context(), open(path, 'rb') as stream:
+            report = user_import.import_users(user_import.read_records(stream, 'csv'), workers=workers,
+                                              batch_size=args.batch_size, hash_method=args.hash_method)
+        summary = report.as_dict()
+        rate = summary['users_per_second'] or 0
+        projected = f'{100000 / rate / 60:.1f} min' if rate else '-'
+        print(f"{workers:<10}{summary['read']:>10}{summary['imported']:>10}{summary['rejected']:>10}"
+              f"{summary['seconds']:>10}{rate:>10}{projected:>12}")
+        if summary['imported'] != args.users:
+            print(f'Expected {args.users} imported users', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
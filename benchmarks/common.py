@@ -0,0 +1,76 @@
+"""Helpers shared by the benchmark scripts in this directory."""
+import json
+import logging
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(database_url=None):
+    """Create the Flask app against ``database_url`` (a fresh temp SQLite file by default) and migrate it.
+
+    create_app() reads DATABASE_URL, so this must run before anything else
+    creates the app.
+    """
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='quiz-bench-'), 'bench.db')
+        database_url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = database_url
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    from app import create_app
+    import cli
+    app = create_app()
+    with app.app_context():
+        cli.migrate()
+        cli.seed()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('quiz.requests').setLevel(logging.WARNING)
+    logging.getLogger('instrumentation').setLevel(logging.ERROR)
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples_ms, wall_seconds):
+    values = sorted(samples_ms)
+    return {
+        'requests': len(values),
+        'throughput_rps': round(len(values) / wall_seconds, 1) if wall_seconds else None,
+        'p50_ms': round(percentile(values, 0.50), 2) if values else None,
+        'p95_ms': round(percentile(values, 0.95), 2) if values else None,
+        'p99_ms': round(percentile(values, 0.99), 2) if values else None,
+        'max_ms': round(values[-1], 2) if values else None,
+    }
+
+
+def print_table(title, rows):
+    """Print {name: summary} as a fixed-width table"""
+    columns = ['requests', 'errors', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    print(f'\n{title}')
+    print(f"{'name':<20}" + ''.join(f'{c:>16}' for c in columns))
+    for name, summary in rows.items():
+        print(f'{name:<20}' + ''.join(f"{'-' if summary.get(c) is None else summary.get(c):>16}" for c in columns))
+
+
+def compare(results, baseline_path, tolerance, metric='p95_ms'):
+    """Return names whose ``metric`` regressed by more than ``tolerance`` against a saved run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, summary in results.items():
+        before = baseline.get(name, {}).get(metric)
+        after = summary.get(metric)
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f'{name}: {metric} {before} -> {after}')
+    return regressions
@@ -0,0 +1,93 @@
+"""Benchmark for a login burst, as when a quiz opens.
+
+Seeds N users whose passwords are hashed with PASSWORD_HASH_METHOD, then
+posts /login for every user from a thread pool, once per requested
+hashing pool size (0 hashes inline on the request thread). Reports login
+throughput overall and per core used for hashing.
+
+    python benchmarks/login_burst.py --users 200 --concurrency 32
+    python benchmarks/login_burst.py --workers 0 1 2 4
+    python benchmarks/login_burst.py --method pbkdf2:sha256:600000
+
+By default a fresh SQLite file is used; pass --database-url to run
+against Postgres (the database should be empty).
+"""
+import argparse
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+
+PASSWORD = 'bench-password'
+
+
+def seed(app, users):
+    from app import db, password_hasher
+    from models import User
+    from sqlalchemy import insert
+
+    with app.app_context():
+        # One hash shared by every account keeps seeding fast; logins still verify it
+        password_hash = password_hasher.hash(PASSWORD)
+        run = secrets.token_hex(4)
+        emails = [f'login-{run}-{i}@example.com' for i in range(users)]
+        db.session.execute(insert(User), [
+            {'email': email, 'name': f'Bench User {i}', 'password_hash': password_hash}
+            for i, email in enumerate(emails)
+        ])
+        db.session.commit()
+    return emails
+
+
+def login(app, email):
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post('/login', data={'email': email, 'password': PASSWORD})
+    return (time.perf_counter() - started) * 1000, response.status_code == 302
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='users logging in')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent request threads')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count() or 1],
+                        help='hashing pool sizes to compare (0 = inline)')
+    parser.add_argument('--method', help='PASSWORD_HASH_METHOD to use (default: the app setting)')
+    parser.add_argument('--database-url', help='database to seed (default: fresh temporary SQLite file)')
+    args = parser.parse_args()
+
+    app = common.load_app(args.database_url)
+    if args.method:
+        app.config['PASSWORD_HASH_METHOD'] = args.method
+    app.config['PASSWORD_HASH_QUEUE_LIMIT'] = max(app.config['PASSWORD_HASH_QUEUE_LIMIT'], args.concurrency)
+    emails = seed(app, args.users)
+
+    from app import password_hasher
+    rows = {}
+    print(f"Hash method {app.config['PASSWORD_HASH_METHOD']}, {os.cpu_count()} cores")
+    for workers in args.workers:
+        password_hasher.shutdown()
+        app.config['PASSWORD_HASH_WORKERS'] = workers
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda email: login(app, email), emails))
+        wall = time.perf_counter() - started
+
+        summary = common.summarize([ms for ms, _ in results], wall)
+        summary['errors'] = sum(1 for _, ok in results if not ok)
+        cores = min(workers or 1, os.cpu_count() or 1)
+        summary['per_core_rps'] = round(summary['throughput_rps'] / cores, 1)
+        rows[f'workers={workers}'] = summary
+    password_hasher.shutdown()
+
+    common.print_table(f'{args.users} logins, {args.concurrency} concurrent', rows)
+    for name, summary in rows.items():
+        print(f"{name:<20}{summary['per_core_rps']:>16} logins/s per core")
+    return 1 if any(summary['errors'] for summary in rows.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Benchmark for open-quiz queries before and after archiving old quizzes.
+
+Seeds a history of closed, published quizzes plus one open quiz, all with
+the same participants, and times the open quiz's queries (page: a
+leaderboard page, lookup: a participant's submission, index: warming the
+submission index, export: the quiz's export) and the dashboard. Then
+archives the history with submission_partitions and runs them again, so
+only the hot partition is left under the open quiz.
+
+    python benchmarks/partitions.py --quizzes 50 --submissions 5000
+    python benchmarks/partitions.py --quizzes 200 --submissions 2000 --repeat 500
+
+By default a fresh SQLite file is used; pass --database-url to run
+against Postgres (the database should be empty).
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import common
+
+
+def seed(app, quizzes, submissions):
+    from app import db
+    from models import User, Quiz, QuizSubmission, Answer
+    from quiz_cache import QuizQuestion
+    from sqlalchemy import insert
+    import leaderboard
+    import quiz_questions
+    import scoring
+
+    answer_key = (0, 1)
+    with app.app_context():
+        db.session.execute(insert(User), [
+            {'id': user_id, 'email': f'history-{user_id}@example.com', 'name': f'User {user_id}',
+             'password_hash': '-'}
+            for user_id in range(1, submissions + 1)
+        ])
+        now = datetime.utcnow()
+        submission_id = 0
+        quiz_ids = []
+        # The open quiz comes last, so it holds the newest submissions
+        for n in range(quizzes + 1):
+            is_open = n == quizzes
+            ended = now + timedelta(hours=1) if is_open else now - timedelta(days=400 - n)
+            quiz = Quiz(title=f'History quiz {n}', start_time=ended - timedelta(hours=1), end_time=ended,
+                        is_locked=not is_open, results_published=not is_open)
+            db.session.add(quiz)
+            quiz_questions.store(quiz, [QuizQuestion(f'Question {p}?', ('A', 'B', 'C', 'D'), correct)
+                                        for p, correct in enumerate(answer_key, 1)])
+            db.session.commit()
+
+            rows, answers = [], []
+            for user_id in range(1, submissions + 1):
+                submission_id += 1
+                sheet = tuple(random.randrange(4) for _ in answer_key)
+                time_taken = random.randint(20, 180)
+                score, bonus_awarded = scoring.score_sheet(answer_key, sheet, time_taken)
+                rows.append({'id': submission_id, 'user_id': user_id, 'quiz_id': quiz.id, 'time_taken': time_taken,
+                             'score': score, 'bonus_awarded': bonus_awarded, 'submitted_at': ended,
+                             **quiz_questions.legacy_answer_columns(sheet)})
+                answers.extend({'submission_id': submission_id, 'position': position, 'selected': selected}
+                               for position, selected in enumerate(sheet))
+            db.session.execute(insert(QuizSubmission), rows)
+            db.session.execute(insert(Answer), answers)
+            db.session.commit()
+            quiz_ids.append(quiz.id)
+        leaderboard.rebuild()
+        return quiz_ids[-1]
+
+
+def run_queries(app, quiz_id, users, repeat):
+    from app import db
+    from models import QuizSubmission
+    import exports
+    import leaderboard
+
+    client = app.test_client()
+    rows = {}
+
+    def measure(name, call, times):
+        samples = []
+        started = time.perf_counter()
+        for _ in range(times):
+            began = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - began) * 1000)
+        rows[name] = common.summarize(samples, time.perf_counter() - started)
+
+    with app.app_context():
+        measure('page', lambda: leaderboard.page(quiz_id, per_page=50), repeat)
+        measure('lookup', lambda: leaderboard.submission_of(quiz_id, random.randint(1, users)), repeat)
+        measure('index', lambda: db.session.query(QuizSubmission.id, QuizSubmission.user_id)
+                .filter(QuizSubmission.quiz_id == quiz_id).all(), max(1, repeat // 20))
+        measure('export', lambda: sum(len(rows) for rows in exports.iter_rows(quiz_id)),
+                max(1, repeat // 50))
+        db.session.remove()
+
+    def dashboard():
+        with client.session_transaction() as session:
+            session['_user_id'] = str(random.randint(1, users))
+            session['_fresh'] = True
+        client.get('/dashboard')
+    measure('dashboard', dashboard, repeat)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quizzes', type=int, default=50, help='closed quizzes in the history')
+    parser.add_argument('--submissions', type=int, default=5000, help='participants, each taking every quiz')
+    parser.add_argument('--repeat', type=int, default=200, help='runs of each query')
+    parser.add_argument('--database-url', help='database to seed (default: fresh temporary SQLite file)')
+    args = parser.parse_args()
+
+    app = common.load_app(args.database_url)
+    started = time.perf_counter()
+    quiz_id = seed(app, args.quizzes, args.submissions)
+    print(f'Seeded {args.quizzes + 1} quizzes x {args.submissions} submissions '
+          f'in {time.perf_counter() - started:.1f}s')
+
+    rows = {f'{name}: before': summary for name, summary in run_queries(
+        app, quiz_id, args.submissions, args.repeat).items()}
+
+    from app import submission_partitions
+    with app.app_context():
+        started = time.perf_counter()
+        for archived_id in submission_partitions.archivable():
+            submission_partitions.archive_quiz(archived_id)
+        copied = time.perf_counter() - started
+        submission_partitions.drop_hot_copies()
+        submission_partitions.compact()
+    print(f'Archived {args.quizzes} quizzes: copied in {copied:.1f}s, '
+          f'{time.perf_counter() - started:.1f}s with the hot deletes')
+
+    after = run_queries(app, quiz_id, args.submissions, args.repeat)
+    for name, summary in after.items():
+        rows[f'{name}: after'] = summary
+    rows = dict(sorted(rows.items(), key=lambda item: item[0].rsplit(':', 1)[0]))
+    common.print_table(f'Open quiz queries with {args.quizzes} closed quizzes in the same tables, then archived', rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Load test for the quiz-taking hot path.
+
+Seeds N users and an open quiz, then replays the burst seen when a quiz
+opens: every participant logs in, opens the dashboard, takes and submits
+the quiz and views the confirmation page. The admin then locks the quiz
+and publishes results, and every participant opens the results page.
+Requests go through the Flask test client from a thread pool, so the
+numbers cover the full app stack minus the network and WSGI server.
+
+    python benchmarks/quiz_burst.py --users 500 --concurrency 16
+    python benchmarks/quiz_burst.py --questions 200
+    python benchmarks/quiz_burst.py --save baseline.json
+    python benchmarks/quiz_burst.py --compare baseline.json --tolerance 0.2
+
+By default a fresh SQLite file is used; pass --database-url to run
+against Postgres (the database should be empty).
+"""
+import argparse
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import common
+
+PASSWORD = 'bench-password'
+
+
+def seed(app, users, questions):
+    from app import db
+    from models import User, Quiz
+    from quiz_cache import QuizQuestion
+    import quiz_questions
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        # One hash shared by every account keeps seeding fast; logins still verify it
+        password_hash = generate_password_hash(PASSWORD)
+        run = secrets.token_hex(4)
+        emails = [f'bench-{run}-{i}@example.com' for i in range(users)]
+        db.session.execute(insert(User), [
+            {'email': email, 'name': f'Bench User {i}', 'password_hash': password_hash}
+            for i, email in enumerate(emails)
+        ])
+        now = datetime.utcnow()
+        quiz = Quiz(
+            title=f'Benchmark quiz {run}',
+            start_time=now - timedelta(minutes=1),
+            end_time=now + timedelta(hours=1),
+            quiz_url=run
+        )
+        db.session.add(quiz)
+        quiz_questions.store(quiz, [
+            QuizQuestion(f'Which option is correct answer {n}?', ('A', 'B', 'C', 'D'), n % 4)
+            for n in range(1, questions + 1)
+        ])
+        db.session.commit()
+        return quiz.id, emails
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, name, call, expected):
+        started = time.perf_counter()
+        response = call()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.samples[name].append(elapsed_ms)
+            if response.status_code not in expected:
+                self.errors[name] += 1
+        return response
+
+
+def participant(app, recorder, quiz_id, questions, email):
+    client = app.test_client()
+    recorder.request('login', lambda: client.post('/login', data={'email': email, 'password': PASSWORD}), (302,))
+    recorder.request('dashboard', lambda: client.get('/dashboard'), (200,))
+    recorder.request('take_quiz', lambda: client.get(f'/quiz/{quiz_id}'), (200,))
+    answers = {f'answer{n}': random.randint(0, 3) for n in range(1, questions + 1)}
+    answers['time_taken'] = random.randint(20, 120)
+    recorder.request('submit_quiz', lambda: client.post(f'/quiz/{quiz_id}/submit', data=answers), (302,))
+    recorder.request('quiz_submitted', lambda: client.get(f'/quiz/{quiz_id}/submitted'), (200,))
+    return client
+
+
+def run(args):
+    app = common.load_app(args.database_url)
+    quiz_id, emails = seed(app, args.users, args.questions)
+    recorder = Recorder()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        clients = list(pool.map(lambda email: participant(app, recorder, quiz_id, args.questions, email), emails))
+    burst_seconds = time.perf_counter() - started
+
+    admin = app.test_client()
+    with admin.session_transaction() as session:
+        session['admin_logged_in'] = True
+    recorder.request('lock_quiz', lambda: admin.get(f'/admin/quiz/{quiz_id}/lock'), (302,))
+    recorder.request('publish_results', lambda: admin.get(f'/admin/quiz/{quiz_id}/publish-results'), (302,))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda client: recorder.request('view_results', lambda: client.get(f'/results/{quiz_id}'), (200,)), clients))
+    results_seconds = time.perf_counter() - started
+
+    report = {}
+    for name, samples in recorder.samples.items():
+        wall = results_seconds if name == 'view_results' else burst_seconds
+        report[name] = common.summarize(samples, wall)
+        report[name]['errors'] = recorder.errors[name]
+    return report, burst_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='participants to seed and simulate')
+    parser.add_argument('--questions', type=int, default=2, help='questions in the seeded quiz')
+    parser.add_argument('--concurrency', type=int, default=8, help='worker threads sending requests')
+    parser.add_argument('--database-url', help='database to seed (default: fresh temporary SQLite file)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--save', metavar='FILE', help='save the report for later --compare runs')
+    parser.add_argument('--compare', metavar='FILE', help='fail if p95 latency regressed against a saved report')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 regression for --compare (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    report, burst_seconds = run(args)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        common.print_table(f'{args.users} participants, {args.questions} questions, {args.concurrency} threads, burst took {burst_seconds:.2f}s', report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failed = sum(summary['errors'] for summary in report.values())
+    if failed:
+        print(f'\n{failed} requests returned an unexpected status', file=sys.stderr)
+    if args.compare:
+        regressions = common.compare(report, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
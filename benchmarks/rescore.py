@@ -0,0 +1,109 @@
+"""Benchmark for re-scoring a quiz after an answer-key correction.
+
+Seeds one quiz with N submissions and their answer sheets, flips the
+correct option of the first question and times rescoring.rescore_quiz():
+loading the answers, recomputing score and bonus, the chunked UPDATE of
+changed rows, the leaderboard rebuild and the winner check.
+
+    python benchmarks/rescore.py --submissions 1000000
+    python benchmarks/rescore.py --submissions 100000 --questions 50
+    python benchmarks/rescore.py --pure-python
+
+By default a fresh SQLite file is used; pass --database-url to run
+against Postgres (the database should be empty).
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import common
+
+SEED_CHUNK = 50000
+
+
+def seed(app, submissions, questions):
+    from app import db
+    from models import User, Quiz, QuizSubmission, Answer
+    from quiz_cache import QuizQuestion
+    from sqlalchemy import insert
+    import quiz_questions
+    import scoring
+
+    with app.app_context():
+        now = datetime.utcnow()
+        quiz = Quiz(title='Re-scoring benchmark', start_time=now - timedelta(hours=2),
+                    end_time=now - timedelta(hours=1), is_locked=True)
+        db.session.add(quiz)
+        answer_key = tuple(random.randrange(4) for _ in range(questions))
+        quiz_questions.store(quiz, [
+            QuizQuestion(f'Question {n}?', ('A', 'B', 'C', 'D'), correct)
+            for n, correct in enumerate(answer_key, 1)
+        ])
+        db.session.commit()
+
+        # Ids are assigned here so answer rows need no RETURNING round trip
+        for start in range(1, submissions + 1, SEED_CHUNK):
+            ids = range(start, min(start + SEED_CHUNK, submissions + 1))
+            users, rows, answers = [], [], []
+            for user_id in ids:
+                # Mostly right answers, so the bonus and the winner both move
+                sheet = tuple(correct if random.random() < 0.8 else (correct + 1) % 4 for correct in answer_key)
+                time_taken = random.randint(20, 180)
+                score, bonus_awarded = scoring.score_sheet(answer_key, sheet, time_taken)
+                users.append({'id': user_id, 'email': f'rescore-{user_id}@example.com',
+                              'name': f'User {user_id}', 'password_hash': '-'})
+                rows.append({'id': user_id, 'user_id': user_id, 'quiz_id': quiz.id, 'time_taken': time_taken,
+                             'score': score, 'bonus_awarded': bonus_awarded, 'submitted_at': now,
+                             **quiz_questions.legacy_answer_columns(sheet)})
+                answers.extend({'submission_id': user_id, 'position': position, 'selected': selected}
+                               for position, selected in enumerate(sheet))
+            db.session.execute(insert(User), users)
+            db.session.execute(insert(QuizSubmission), rows)
+            db.session.execute(insert(Answer), answers)
+            db.session.commit()
+
+        import leaderboard
+        leaderboard.rebuild(quiz.id)
+        quiz.winner_id = leaderboard.pick_winner(quiz.id).user_id
+        db.session.commit()
+        return quiz.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submissions', type=int, default=100000, help='submissions to seed and re-score')
+    parser.add_argument('--questions', type=int, default=2, help='questions in the seeded quiz')
+    parser.add_argument('--database-url', help='database to seed (default: fresh temporary SQLite file)')
+    parser.add_argument('--pure-python', action='store_true', help='re-score without NumPy')
+    args = parser.parse_args()
+
+    app = common.load_app(args.database_url)
+    started = time.perf_counter()
+    quiz_id = seed(app, args.submissions, args.questions)
+    print(f'Seeded {args.submissions} submissions x {args.questions} questions in {time.perf_counter() - started:.1f}s')
+
+    from app import db
+    from models import Question
+    import rescoring
+    if args.pure_python:
+        rescoring.numpy = None
+
+    with app.app_context():
+        question = Question.query.filter_by(quiz_id=quiz_id, position=0).one()
+        question.correct_option = (question.correct_option + 1) % 4
+        db.session.commit()
+
+        started = time.perf_counter()
+        result = rescoring.rescore_quiz(quiz_id, app.config['RESCORE_CHUNK_SIZE'])
+        elapsed = time.perf_counter() - started
+
+    engine = 'pure Python' if rescoring.numpy is None else f'NumPy {rescoring.numpy.__version__}'
+    print(f'Re-scored {result.submissions} submissions ({result.changed} changed) '
+          f'with {engine} in {elapsed:.2f}s; winner is user {result.winner_id}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
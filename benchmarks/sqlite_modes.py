@@ -0,0 +1,183 @@
+"""Benchmark for SQLite under concurrent writes and reads.
+
+Runs the same burst against a fresh SQLite file in each configuration:
+the old defaults (rollback journal, synchronous=FULL), WAL alone, and WAL
+with the shared writer lock (the default). Several worker processes, as
+gunicorn would run, each have threads that log in and submit the quiz
+while reader threads keep loading the admin submissions page. Reports submission and page latency and errors (mostly
+"database is locked") per configuration.
+
+    python benchmarks/sqlite_modes.py --users 400 --processes 4 --threads 8
+    python benchmarks/sqlite_modes.py --synchronous full
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import common
+
+PASSWORD = 'bench-password'
+# Cheap hash so logins don't dominate; the app is configured to keep it
+HASH_METHOD = 'pbkdf2:sha256:1'
+
+# Old defaults, WAL alone, and the default WAL + writer lock
+MODES = {
+    'delete/full': {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full',
+                    'SQLITE_SERIALIZE_WRITES': False},
+    'wal': {'SQLITE_JOURNAL_MODE': 'wal', 'SQLITE_SYNCHRONOUS': 'normal', 'SQLITE_SERIALIZE_WRITES': False},
+    'wal+lock': {'SQLITE_JOURNAL_MODE': 'wal', 'SQLITE_SYNCHRONOUS': 'normal', 'SQLITE_SERIALIZE_WRITES': True},
+}
+
+
+def make_app(database_url, config):
+    os.environ['DATABASE_URL'] = database_url
+    if common.ROOT not in sys.path:
+        sys.path.insert(0, common.ROOT)
+    from app import create_app
+
+    app = create_app({
+        'PASSWORD_HASH_METHOD': HASH_METHOD,
+        'PASSWORD_HASH_WORKERS': 0,
+        'LIVE_JOURNAL_PATH': os.path.join(os.path.dirname(database_url[len('sqlite:///'):]), 'live.db'),
+        'WTF_CSRF_ENABLED': False,
+        **config,
+    })
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('quiz.requests').setLevel(logging.WARNING)
+    logging.getLogger('instrumentation').setLevel(logging.ERROR)
+    # Locked-database tracebacks are expected here; they are counted as errors
+    app.logger.setLevel(logging.CRITICAL)
+    return app
+
+
+def seed(app, users):
+    from app import db
+    from models import User, Quiz
+    from quiz_cache import QuizQuestion
+    import cli
+    import quiz_questions
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        cli.migrate()
+        password_hash = generate_password_hash(PASSWORD, method=HASH_METHOD)
+        emails = [f'bench-{i}@example.com' for i in range(users)]
+        db.session.execute(insert(User), [
+            {'email': email, 'name': f'Bench User {i}', 'password_hash': password_hash}
+            for i, email in enumerate(emails)
+        ])
+        now = datetime.utcnow()
+        quiz = Quiz(title='SQLite benchmark quiz', start_time=now - timedelta(minutes=1),
+                    end_time=now + timedelta(hours=1), quiz_url='sqlite-bench')
+        db.session.add(quiz)
+        quiz_questions.store(quiz, [QuizQuestion(f'Question {n}?', ('A', 'B', 'C', 'D'), n % 4) for n in (1, 2)])
+        db.session.commit()
+        return quiz.id, emails
+
+
+def worker(database_url, config, quiz_id, emails, threads, readers):
+    """One worker process: submitters for ``emails`` plus reader threads until they finish"""
+    app = make_app(database_url, config)
+    samples = {'submit': [], 'read': []}
+    errors = {'submit': 0, 'read': 0}
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def record(kind, call, expected):
+        started = time.perf_counter()
+        try:
+            ok = call().status_code in expected
+        except Exception:
+            ok = False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            samples[kind].append(elapsed_ms)
+            if not ok:
+                errors[kind] += 1
+
+    def submit(email):
+        client = app.test_client()
+        client.post('/login', data={'email': email, 'password': PASSWORD})
+        data = {'answer1': random.randint(0, 3), 'answer2': random.randint(0, 3), 'time_taken': random.randint(20, 120)}
+        record('submit', lambda: client.post(f'/quiz/{quiz_id}/submit', data=data), (302,))
+
+    def read(n):
+        admin = app.test_client()
+        with admin.session_transaction() as session:
+            session['admin_logged_in'] = True
+        while not done.is_set():
+            record('read', lambda: admin.get(f'/admin/quiz/{quiz_id}/submissions'), (200,))
+
+    with ThreadPoolExecutor(max_workers=threads + readers) as pool:
+        reading = [pool.submit(read, n) for n in range(readers)]
+        list(pool.map(submit, emails))
+        done.set()
+        for future in reading:
+            future.result()
+
+    from app import sqlite_tuning
+    return samples, errors, sqlite_tuning.stats()
+
+
+def run_mode(name, config, args):
+    directory = tempfile.mkdtemp(prefix='quiz-bench-sqlite-')
+    database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    try:
+        quiz_id, emails = seed(make_app(database_url, config), args.users)
+        context = multiprocessing.get_context('spawn')
+        started = time.perf_counter()
+        with context.Pool(args.processes) as pool:
+            results = pool.starmap(worker, [
+                (database_url, config, quiz_id, emails[n::args.processes], args.threads, args.readers)
+                for n in range(args.processes)
+            ])
+        wall = time.perf_counter() - started
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    rows = {}
+    for kind in ('submit', 'read'):
+        samples = [sample for result in results for sample in result[0][kind]]
+        rows[f'{name}: {kind}'] = dict(common.summarize(samples, wall),
+                                      errors=sum(result[1][kind] for result in results))
+    lock_waits = sum(result[2]['waits'] for result in results)
+    return rows, lock_waits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=300, help='participants submitting the quiz')
+    parser.add_argument('--processes', type=int, default=4, help='worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='submitting threads per process')
+    parser.add_argument('--readers', type=int, default=2, help='reader threads per process')
+    parser.add_argument('--synchronous', help='override SQLITE_SYNCHRONOUS for the WAL modes')
+    parser.add_argument('--busy-timeout', type=int, default=5000, help='SQLITE_BUSY_TIMEOUT in ms')
+    args = parser.parse_args()
+
+    rows = {}
+    for name, config in MODES.items():
+        config = dict(config, SQLITE_BUSY_TIMEOUT=args.busy_timeout)
+        if args.synchronous and config['SQLITE_JOURNAL_MODE'] == 'wal':
+            config['SQLITE_SYNCHRONOUS'] = args.synchronous
+        mode_rows, lock_waits = run_mode(name, config, args)
+        rows.update(mode_rows)
+        if config['SQLITE_SERIALIZE_WRITES']:
+            print(f'{name}: {lock_waits} writes waited for the writer lock')
+
+    common.print_table(f'{args.users} submissions from {args.processes} processes x {args.threads} threads, '
+                       f'{args.readers} readers per process', rows)
+    return 1 if any(row['errors'] for row in rows.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Benchmark for worker boot time.
+
+Starts fresh Python processes that import the app, call create_app() and
+serve one request, as a new gunicorn worker would. Each run reports how
+long the import + create_app() took, how long the first request took, and
+how many database connections were opened before the first request (the
+factory should open none). Runs are repeated with cold templates and with
+templates precompiled by `flask --app main precompile-templates`.
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --path /login --database-url postgresql://...
+
+By default a fresh SQLite file is migrated once and shared by every run.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import common
+
+# Runs in each child process; prints one JSON line
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+connections = []
+event.listen(Pool, 'connect', lambda *args: connections.append(time.perf_counter()))
+from app import create_app
+app = create_app()
+booted = time.perf_counter()
+boot_connections = len(connections)
+app.config['WTF_CSRF_ENABLED'] = False
+response = app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+print(json.dumps({
+    'boot_ms': (booted - started) * 1000,
+    'first_request_ms': (served - booted) * 1000,
+    'boot_connections': boot_connections,
+    'status': response.status_code,
+}))
+'''
+
+
+def boot(path, env):
+    output = subprocess.run([sys.executable, '-c', CHILD, path], cwd=common.ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    boot_ms = sorted(sample['boot_ms'] for sample in samples)
+    first_ms = sorted(sample['first_request_ms'] for sample in samples)
+    return {
+        'runs': len(samples),
+        'boot_p50_ms': round(common.percentile(boot_ms, 0.50), 1),
+        'boot_p95_ms': round(common.percentile(boot_ms, 0.95), 1),
+        'first_req_p50_ms': round(common.percentile(first_ms, 0.50), 1),
+        'first_req_p95_ms': round(common.percentile(first_ms, 0.95), 1),
+        'boot_connections': max(sample['boot_connections'] for sample in samples),
+        'errors': sum(1 for sample in samples if sample['status'] >= 500),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='processes to start per mode')
+    parser.add_argument('--path', default='/', help='URL of the first request')
+    parser.add_argument('--database-url', help='database to use (default: fresh temporary SQLite file)')
+    args = parser.parse_args()
+
+    # Migrate once up front, the way a deploy would, so workers boot against a ready schema
+    app = common.load_app(args.database_url)
+    template_cache = tempfile.mkdtemp(prefix='quiz-bench-jinja-')
+    env = dict(os.environ, DATABASE_URL=app.config['SQLALCHEMY_DATABASE_URI'],
+               TEMPLATE_CACHE_DIR=template_cache)
+
+    rows = {}
+    for mode in ('cold templates', 'precompiled'):
+        shutil.rmtree(template_cache)
+        os.makedirs(template_cache)
+        if mode == 'precompiled':
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'precompile-templates'],
+                           cwd=common.ROOT, env=env, capture_output=True, check=True)
+        samples = []
+        for _ in range(args.runs):
+            if mode == 'cold templates':
+                # Every cold run starts without bytecode, like a first deploy
+                shutil.rmtree(template_cache)
+                os.makedirs(template_cache)
+            samples.append(boot(args.path, env))
+        rows[mode] = summarize(samples)
+    shutil.rmtree(template_cache, ignore_errors=True)
+
+    columns = ['runs', 'boot_p50_ms', 'boot_p95_ms', 'first_req_p50_ms', 'first_req_p95_ms',
+               'boot_connections', 'errors']
+    print(f'\nWorker boot, first request GET {args.path}')
+    print(f"{'':<20}" + ''.join(f'{column:>18}' for column in columns))
+    for name, summary in rows.items():
+        print(f'{name:<20}' + ''.join(f'{summary[column]!s:>18}' for column in columns))
+    return 1 if any(summary['errors'] or summary['boot_connections'] for summary in rows.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
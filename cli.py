@@ -0,0 +1,264 @@
+"""One-shot setup commands, run once per deploy rather than by every worker at boot.
+
+    flask --app main migrate               # tables, late indexes, data backfills
+    flask --app main seed                  # the Algo admin account
+    flask --app main precompile-templates  # Jinja bytecode for every template
+    flask --app main import-users FILE     # bulk-create users from CSV or JSONL
+    flask --app main explain-queries       # check the hot queries still use indexes
+    flask --app main sync-replica          # copy a SQLite primary into its local replica
+    flask --app main archive-quizzes       # move finished quizzes' submissions to the archive
+    flask --app main restore-quiz ID       # move an archived quiz back, e.g. to edit it
+"""
+import csv
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db, password_hasher
+
+ADMIN_USERNAME = 'Algo admin'
+ADMIN_EMAIL = 'kaviiarasan.sv@gktech.ai'
+ADMIN_PASSWORD = 'algogkt@123'
+
+
+def migrate():
+    """Bring the schema and data up to date; safe to run repeatedly"""
+    import models
+    import leaderboard
+    import quiz_questions
+    from app import submission_partitions
+
+    db.create_all()
+
+    # create_all() skips existing tables, so add indexes introduced later
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    # Submission and answer tables of archived quizzes
+    submission_partitions.create_archive()
+
+    # Count submissions made before the leaderboard buckets existed
+    leaderboard.backfill()
+
+    # Move two-question quizzes into the Question/Option/Answer tables
+    quiz_questions.backfill()
+
+
+def seed():
+    """Create the Algo admin user if it doesn't exist; returns True if it was created"""
+    from models import Admin
+
+    if Admin.query.filter_by(username=ADMIN_USERNAME).first():
+        return False
+    db.session.add(Admin(
+        username=ADMIN_USERNAME,
+        email=ADMIN_EMAIL,
+        password_hash=password_hasher.hash(ADMIN_PASSWORD)
+    ))
+    db.session.commit()
+    return True
+
+
+def precompile_templates(app):
+    """Compile every template so workers load bytecode instead of parsing Jinja; returns the count"""
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Create missing tables and indexes and run data backfills."""
+    started = time.perf_counter()
+    migrate()
+    click.echo(f'Database is up to date ({time.perf_counter() - started:.2f}s).')
+
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """Create the admin account if it is missing."""
+    if seed():
+        click.echo(f'Algo admin user created with email: {ADMIN_EMAIL}')
+    else:
+        click.echo('Algo admin user already exists.')
+
+
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_templates_command():
+    """Write Jinja bytecode for every template to TEMPLATE_CACHE_DIR."""
+    count = precompile_templates(current_app)
+    click.echo(f"Compiled {count} templates into {current_app.config['TEMPLATE_CACHE_DIR']}.")
+
+
+@click.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format (default: from the file extension).')
+@click.option('--batch-size', type=int, help='Users per INSERT (default: USER_IMPORT_BATCH_SIZE).')
+@click.option('--workers', type=int, help='Hashing processes, 0 for inline (default: USER_IMPORT_WORKERS).')
+@click.option('--hash-method', help='Werkzeug hash method for imported passwords; upgraded at first login.')
+@click.option('--generate-passwords', is_flag=True, help='Give users without a password a random one.')
+@click.option('--credentials', type=click.Path(dir_okay=False),
+              help='CSV file receiving name, email and generated password of those users.')
+@click.option('--rejects', type=click.Path(dir_okay=False), help='CSV file receiving every rejected row.')
+@with_appcontext
+def import_users_command(path, fmt, batch_size, workers, hash_method, generate_passwords, credentials, rejects):
+    """Create users in bulk from a CSV (name,email,password header) or JSONL file."""
+    import user_import
+
+    if generate_passwords and not credentials:
+        raise click.UsageError('--generate-passwords needs --credentials to write the passwords to.')
+
+    def open_csv(target, header):
+        # Created owner-only, as it may hold passwords
+        handle = os.fdopen(os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', newline='')
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        return handle, writer
+
+    files = []
+    on_reject = on_created = None
+    if rejects:
+        handle, reject_writer = open_csv(rejects, ['line', 'email', 'reason'])
+        files.append(handle)
+        on_reject = reject_writer.writerow
+    if credentials:
+        handle, credential_writer = open_csv(credentials, ['name', 'email', 'password'])
+        files.append(handle)
+        on_created = lambda name, email, password: credential_writer.writerow([name, email, password])
+
+    def on_progress(report):
+        click.echo(f'{report.read} read, {report.imported} imported, {report.rejected} rejected '
+                   f'({report.imported / report.elapsed:.0f} users/s)')
+
+    try:
+        with open(path, 'rb') as stream:
+            records = user_import.read_records(stream, fmt or user_import.format_for(path))
+            report = user_import.import_users(records, batch_size=batch_size, workers=workers,
+                                              hash_method=hash_method, generate_passwords=generate_passwords,
+                                              on_progress=on_progress, on_reject=on_reject, on_created=on_created)
+    finally:
+        for handle in files:
+            handle.close()
+
+    summary = report.as_dict()
+    click.echo(f"Imported {summary['imported']} of {summary['read']} users in {summary['seconds']}s; "
+               f"{summary['rejected']} rejected.")
+    for reject in report.rejects[:10]:
+        click.echo(f'  line {reject.line}: {reject.email or "(no email)"}: {reject.reason}')
+
+
+@click.command('explain-queries')
+@click.option('--verbose', '-v', is_flag=True, help='Print every plan, not only the flagged ones.')
+@with_appcontext
+def explain_queries_command(verbose):
+    """EXPLAIN the hot queries and flag full table scans and sorts; exits 1 if any is flagged."""
+    import query_plans
+
+    reports = query_plans.audit()
+    for report in reports:
+        click.echo(f"{'ok  ' if report.ok else 'FLAG'} {report.name}")
+        if report.scans:
+            click.echo(f"     full scan of {', '.join(report.scans)}")
+        for sort in report.sorts:
+            click.echo(f'     {sort}')
+        if verbose or not report.ok:
+            for line in report.plan:
+                click.echo(f'       {line}')
+    flagged = sum(1 for report in reports if not report.ok)
+    click.echo(f'{len(reports)} queries, {flagged} flagged.')
+    if flagged:
+        raise SystemExit(1)
+
+
+@click.command('sync-replica')
+@click.option('--interval', type=float, help='Keep copying, every this many seconds.')
+@with_appcontext
+def sync_replica_command(interval):
+    """Copy the SQLite primary over the DATABASE_REPLICA_URL file, to try replica reads locally."""
+    import replicas
+
+    engines = db.engines
+    replica = engines.get(replicas.REPLICA_BIND)
+    if replica is None:
+        raise click.UsageError('No replica configured; set DATABASE_REPLICA_URL.')
+    if db.engine.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.UsageError('Only SQLite files can be synced here; use streaming replication on PostgreSQL.')
+
+    while True:
+        started = time.perf_counter()
+        replicas.sync_sqlite(db.engine.url.database, replica.url.database)
+        click.echo(f'Copied {db.engine.url.database} to {replica.url.database} '
+                   f'({time.perf_counter() - started:.2f}s).')
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+@click.command('archive-quizzes')
+@click.option('--quiz', 'quiz_ids', type=int, multiple=True,
+              help='Archive this quiz (repeatable; default: every locked, published quiz that ended '
+                   'SUBMISSION_ARCHIVE_AFTER_DAYS ago).')
+@click.option('--grace', type=float, default=5.0, show_default=True,
+              help='Seconds before the hot copies are deleted; longer than QUIZ_CACHE_VERSION_CHECK '
+                   'plus the slowest request.')
+@click.option('--vacuum', is_flag=True, help='Rewrite the SQLite archive file without free pages afterwards.')
+@with_appcontext
+def archive_quizzes_command(quiz_ids, grace, vacuum):
+    """Move the submissions and answers of finished quizzes to the archive partition."""
+    from app import submission_partitions
+
+    archived = 0
+    for quiz_id in quiz_ids or submission_partitions.archivable():
+        try:
+            moved = submission_partitions.archive_quiz(quiz_id)
+        except ValueError as e:
+            db.session.rollback()
+            click.echo(f'Skipped: {e}')
+            continue
+        archived += 1
+        click.echo(f'Quiz {quiz_id}: {moved} submissions archived.')
+
+    # Workers still routing by an older quiz snapshot read the hot copies until then
+    if archived:
+        time.sleep(grace)
+    # Also finishes a run that was interrupted before this step
+    dropped = submission_partitions.drop_hot_copies()
+    if dropped or vacuum:
+        submission_partitions.compact(vacuum=vacuum)
+    click.echo(f'{archived} quizzes archived; hot copies of {len(dropped)} deleted.')
+
+
+@click.command('restore-quiz')
+@click.argument('quiz_id', type=int)
+@click.option('--grace', type=float, default=5.0, show_default=True,
+              help='Seconds before the archive copy is deleted.')
+@with_appcontext
+def restore_quiz_command(quiz_id, grace):
+    """Move an archived quiz's submissions back to the hot tables, e.g. to edit the quiz."""
+    from app import submission_partitions
+
+    try:
+        moved = submission_partitions.restore_quiz(quiz_id)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    time.sleep(grace)
+    submission_partitions.drop_archive_copy(quiz_id)
+    click.echo(f'Quiz {quiz_id}: {moved} submissions restored.')
+
+
+def init_app(app):
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(precompile_templates_command)
+    app.cli.add_command(import_users_command)
+    app.cli.add_command(explain_queries_command)
+    app.cli.add_command(sync_replica_command)
+    app.cli.add_command(archive_quizzes_command)
+    app.cli.add_command(restore_quiz_command)
@@ -0,0 +1,17 @@
+from app import db
+
+
+def dialect_insert(model):
+    """INSERT construct with ON CONFLICT support for the current database.
+
+    Returns None on backends other than SQLite and PostgreSQL, so callers
+    can fall back to plain statements.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
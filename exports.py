@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+import zlib
+from sqlalchemy import select
+from app import db
+from models import Quiz, QuizSubmission, User
+import leaderboard
+import partitions
+import quiz_questions
+import scoring
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+CSV_HEADERS = [
+    'Name', 'Email', 'Correct Answers', 'Answers', 'Score',
+    'Time Taken (seconds)', 'Bonus Awarded', 'Submitted At'
+]
+
+FIELDS = [
+    'name', 'email', 'correct_answers', 'answers', 'score',
+    'time_taken', 'bonus_awarded', 'submitted_at'
+]
+
+
+def format_available(fmt):
+    return fmt in EXPORT_FORMATS and (fmt != 'parquet' or pyarrow is not None)
+
+
+def iter_rows(quiz_id=None, chunk_size=1000):
+    """Yield lists of submission rows, reading ``chunk_size`` rows at a time.
+
+    ``yield_per`` makes the driver use a server-side cursor where it can
+    (psycopg2), so only one chunk is held in memory. Answer sheets are
+    fetched with one query per chunk. Without a quiz_id every quiz is
+    exported, with the quiz title as an extra leading column: archived
+    quizzes first, then the hot partition.
+    """
+    from app import submission_partitions
+
+    if quiz_id is not None:
+        with submission_partitions.of_quiz(quiz_id):
+            yield from _partition_rows(quiz_id, chunk_size)
+        return
+    with partitions.archive():
+        yield from _partition_rows(None, chunk_size)
+    yield from _partition_rows(None, chunk_size)
+
+
+def _partition_rows(quiz_id, chunk_size):
+    """iter_rows() over the current partition"""
+    from app import submission_partitions
+
+    columns = [
+        QuizSubmission.id, User.name, User.email,
+        QuizSubmission.score, QuizSubmission.time_taken,
+        QuizSubmission.bonus_awarded, QuizSubmission.submitted_at,
+    ]
+    if quiz_id is None:
+        stmt = select(Quiz.title, *columns).select_from(QuizSubmission)\
+            .join(User, QuizSubmission.user_id == User.id)\
+            .join(Quiz, QuizSubmission.quiz_id == Quiz.id)\
+            .where(submission_partitions.holds(QuizSubmission.quiz_id))\
+            .order_by(QuizSubmission.quiz_id, *leaderboard.RANK_ORDER)
+    else:
+        stmt = select(*columns).select_from(QuizSubmission)\
+            .join(User, QuizSubmission.user_id == User.id)\
+            .where(QuizSubmission.quiz_id == quiz_id)\
+            .order_by(*leaderboard.RANK_ORDER)
+
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        sheets = quiz_questions.answer_sheets([row.id for row in partition])
+        rows = []
+        for row in partition:
+            *quiz, submission_id, name, email, score, time_taken, bonus_awarded, submitted_at = row
+            rows.append((*quiz, name, email, scoring.correct_count(score, bonus_awarded), sheets[submission_id],
+                         score, time_taken, bonus_awarded, submitted_at))
+        yield rows
+
+
+def _csv_chunks(chunks, with_quiz):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow((['Quiz'] if with_quiz else []) + CSV_HEADERS)
+    answer_at = 4 if with_quiz else 3
+    for rows in chunks:
+        for row in rows:
+            row = list(row)
+            row[answer_at] = ' '.join(chr(65 + selected) for selected in row[answer_at])  # Convert to A, B, C, D
+            row[-2] = 'Yes' if row[-2] else 'No'
+            row[-1] = row[-1].strftime('%Y-%m-%d %H:%M:%S')
+            writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        # Header only, when there were no rows
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _jsonl_chunks(chunks, with_quiz):
+    fields = (['quiz'] if with_quiz else []) + FIELDS
+    for rows in chunks:
+        lines = []
+        for row in rows:
+            record = dict(zip(fields, row))
+            record['bonus_awarded'] = bool(record['bonus_awarded'])
+            record['submitted_at'] = record['submitted_at'].isoformat()
+            lines.append(json.dumps(record))
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back out through drain()"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_chunks(chunks, with_quiz):
+    fields = [
+        ('name', pyarrow.string()),
+        ('email', pyarrow.string()),
+        ('correct_answers', pyarrow.int32()),
+        ('answers', pyarrow.list_(pyarrow.int32())),
+        ('score', pyarrow.int32()),
+        ('time_taken', pyarrow.int32()),
+        ('bonus_awarded', pyarrow.bool_()),
+        ('submitted_at', pyarrow.timestamp('us')),
+    ]
+    if with_quiz:
+        fields.insert(0, ('quiz', pyarrow.string()))
+    schema = pyarrow.schema(fields)
+
+    # Each chunk becomes one row group, streamed out as soon as it is written
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for rows in chunks:
+        columns = list(zip(*rows)) if rows else [[] for _ in fields]
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(fmt, quiz_id=None, compress=False, chunk_size=1000):
+    """Return a generator of encoded bytes for the export"""
+    with_quiz = quiz_id is None
+    chunks = iter_rows(quiz_id, chunk_size)
+    if fmt == 'csv':
+        body = _csv_chunks(chunks, with_quiz)
+    elif fmt == 'jsonl':
+        body = _jsonl_chunks(chunks, with_quiz)
+    elif fmt == 'parquet':
+        # Parquet is already compressed internally
+        return _parquet_chunks(chunks, with_quiz)
+    else:
+        raise ValueError(f'Unknown export format: {fmt}')
+    return _gzip(body) if compress else body
+
+
+def export_filename(basename, fmt, compress=False):
+    filename = f'{basename}.{fmt}'
+    if compress and fmt != 'parquet':
+        filename += '.gz'
+    return filename
@@ -49,11 +49,7 @@ class CreateQuizForm(FlaskForm):
     submit = SubmitField('Create Quiz')
 
 class QuizSubmissionForm(FlaskForm):
-    answer1 = SelectField('Answer for Question 1', choices=[
-        (0, 'A'), (1, 'B'), (2, 'C'), (3, 'D')
-    ], coerce=int, validators=[DataRequired()])
-    answer2 = SelectField('Answer for Question 2', choices=[
-        (0, 'A'), (1, 'B'), (2, 'C'), (3, 'D')
-    ], coerce=int, validators=[DataRequired()])
+    # The answer{n} radio fields depend on the quiz, so submit_quiz reads them
+    # with quiz_questions.answers_from_form()
     time_taken = IntegerField('Time Taken (seconds)', validators=[DataRequired(), NumberRange(min=1)])
     submit = SubmitField('Submit Quiz')
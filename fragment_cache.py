@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from markupsafe import Markup
+from replicas import recently_changed
+
+
+class FragmentCache:
+    """Per-worker LRU cache of rendered template fragments.
+
+    Entries are grouped in namespaces (e.g. ``winners``, ``results``) and
+    keyed within them. ``invalidate(namespace)`` rewrites that namespace's
+    shared version file; every worker polls it at most once per
+    ``FRAGMENT_CACHE_VERSION_CHECK`` seconds and drops the namespace's
+    fragments when the version changes. At most ``FRAGMENT_CACHE_SIZE``
+    fragments are kept, least recently used first out.
+
+    Templates wrap a block in ``{% call cached('winners', 'carousel') %}``;
+    the block is only rendered on a miss, so data it needs should be loaded
+    inside it (views pass loaders rather than query results).
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._fragments = OrderedDict()  # (namespace, version, key) -> html
+        self._versions = {}  # namespace -> (version, checked_at)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_SIZE', 256)
+        app.config.setdefault('FRAGMENT_CACHE_VERSION_CHECK', 1)
+        app.config.setdefault('FRAGMENT_CACHE_DIR', os.path.join(app.instance_path, 'fragment_cache'))
+        self.max_entries = app.config['FRAGMENT_CACHE_SIZE']
+        self.version_check_interval = app.config['FRAGMENT_CACHE_VERSION_CHECK']
+        self.version_dir = app.config['FRAGMENT_CACHE_DIR']
+        os.makedirs(self.version_dir, exist_ok=True)
+        app.jinja_env.globals['cached'] = self.cached
+        app.extensions['fragment_cache'] = self
+
+    def _version_file(self, namespace):
+        return os.path.join(self.version_dir, f'{namespace}.version')
+
+    def _read_version(self, namespace):
+        try:
+            with open(self._version_file(namespace)) as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def _drop(self, namespace):
+        for cache_key in [cache_key for cache_key in self._fragments if cache_key[0] == namespace]:
+            del self._fragments[cache_key]
+
+    def _version(self, namespace):
+        """Current version of a namespace, re-read from disk when due. Caller holds the lock."""
+        now = time.monotonic()
+        entry = self._versions.get(namespace)
+        if entry and now - entry[1] < self.version_check_interval:
+            return entry[0]
+        version = self._read_version(namespace)
+        if entry and entry[0] != version:
+            self._drop(namespace)
+            self.invalidations += 1
+        self._versions[namespace] = (version, now)
+        return version
+
+    def version(self, namespace):
+        """Current version string of a namespace (``<time_ns>-<pid>`` of its last invalidation)"""
+        with self._lock:
+            version = self._version(namespace)
+        if not version:
+            # Never invalidated yet: start a version so pages have a validator
+            version = self._start(namespace)
+            with self._lock:
+                self._versions[namespace] = (version, time.monotonic())
+        return version
+
+    def _start(self, namespace):
+        """Create the first version file of a namespace; returns the version, whichever worker wrote it"""
+        version = f'{time.time_ns()}-{os.getpid()}'
+        path = self._version_file(namespace)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        try:
+            # Exclusive create that never exposes a half-written file
+            os.link(tmp_path, path)
+        except FileExistsError:
+            # Another worker started it first; overwriting would drop its fragments
+            version = self._read_version(namespace)
+        finally:
+            os.remove(tmp_path)
+        return version
+
+    def get_or_render(self, namespace, key, render):
+        """Cached fragment for (namespace, key), rendering and storing it on a miss"""
+        with self._lock:
+            version = self._version(namespace)
+            cache_key = (namespace, version, key)
+            html = self._fragments.get(cache_key)
+            if html is not None:
+                self._fragments.move_to_end(cache_key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        if version:
+            # Changed moments ago: render from the primary, a replica may not have it yet
+            recently_changed(int(version.split('-', 1)[0]) / 1e9)
+        html = Markup(render())
+        with self._lock:
+            # Skip the write if the namespace was invalidated while rendering
+            if self._versions[namespace][0] == version:
+                self._fragments[cache_key] = html
+                self._fragments.move_to_end(cache_key)
+                while len(self._fragments) > self.max_entries:
+                    self._fragments.popitem(last=False)
+        return html
+
+    def cached(self, namespace, *key, caller):
+        """Template helper: ``{% call cached(namespace, key...) %}...{% endcall %}``"""
+        return self.get_or_render(namespace, key, caller)
+
+    def invalidate(self, *namespaces):
+        """Drop fragments of these namespaces in this worker and signal the others"""
+        for namespace in namespaces:
+            version = f'{time.time_ns()}-{os.getpid()}'
+            path = self._version_file(namespace)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(version)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._drop(namespace)
+                self._versions[namespace] = (version, time.monotonic())
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self._fragments),
+            }
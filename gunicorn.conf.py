@@ -0,0 +1,13 @@
+"""Gunicorn settings, read from the working directory by ``gunicorn main:app``.
+
+Live update long polls and streams each hold a request thread for up to
+LIVE_LONG_POLL_WAIT / LIVE_STREAM_TIMEOUT seconds, so the workers are
+threaded: with sync workers a handful of open pages would take every
+worker. Command-line flags override these.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 100))
@@ -0,0 +1,102 @@
+import glob
+import hashlib
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import current_app, request, session
+from flask_login import current_user
+from replicas import recently_changed
+
+# Strong validators for a page: ETag and Last-Modified, plus whether the
+# page is the same for everybody (anonymous viewers) and may sit in a
+# shared cache such as a reverse proxy
+Validators = namedtuple('Validators', ['etag', 'last_modified', 'public'])
+
+
+def _viewer():
+    if current_user.is_authenticated:
+        return f'user-{current_user.get_id()}'
+    if session.get('admin_logged_in'):
+        return 'admin'
+    return None
+
+
+def validators(namespace, *key):
+    """Validators for a page built from a fragment cache namespace.
+
+    The namespace's version changes whenever admins change what the page
+    shows (see FragmentCache.invalidate), so it doubles as the page
+    version; the viewer is mixed in because the navbar and rank differ per
+    user.
+    """
+    version = current_app.extensions['fragment_cache'].version(namespace)
+    viewer = _viewer()
+    digest = hashlib.sha256(repr((version, namespace, key, viewer)).encode()).hexdigest()[:20]
+    changed_at = int(version.split('-', 1)[0]) / 1e9
+    # The page is cached under this version, so it must not be built from a lagging replica
+    recently_changed(changed_at)
+    last_modified = datetime.fromtimestamp(int(changed_at), timezone.utc)
+    return Validators(digest, last_modified, viewer is None)
+
+
+def apply(response, page):
+    """Add the validators and Cache-Control to a 200 or 304 response"""
+    response.set_etag(page.etag)
+    response.last_modified = page.last_modified
+    if page.public:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['PAGE_CACHE_MAX_AGE']
+    else:
+        # Browsers may keep it, but must revalidate; shared caches must not
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(page):
+    """A 304 response if the client's copy is still current, otherwise None"""
+    # Pending flash messages would be lost if the client reused its copy
+    if session.get('_flashes'):
+        return None
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(page.etag)
+    elif request.if_modified_since:
+        fresh = request.if_modified_since >= page.last_modified
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return apply(current_app.response_class(status=304), page)
+
+
+def _snapshot_dir():
+    return current_app.config.get('RESULTS_SNAPSHOT_DIR')
+
+
+def write_snapshot(name, page, html):
+    """Store a pre-rendered anonymous page as ``<name>.<etag>.html``, replacing older ones"""
+    directory = _snapshot_dir()
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    for stale in glob.glob(os.path.join(directory, f'{glob.escape(name)}.*.html')):
+        os.remove(stale)
+    path = os.path.join(directory, f'{name}.{page.etag}.html')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+    return path
+
+
+def snapshot_response(name, page):
+    """Serve the stored snapshot matching these validators, or None if there is none"""
+    directory = _snapshot_dir()
+    if not directory or not page.public:
+        return None
+    try:
+        with open(os.path.join(directory, f'{name}.{page.etag}.html'), encoding='utf-8') as f:
+            html = f.read()
+    except OSError:
+        return None
+    return apply(current_app.response_class(html, mimetype='text/html'), page)
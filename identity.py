@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import session
+from sqlalchemy import event, inspect
+from replicas import RoutingSession, primary
+
+
+class Identity:
+    """The logged-in user as request handlers see it: id, name and email, no ORM row"""
+
+    __slots__ = ('id', 'name', 'email')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, name, email):
+        self.id = id
+        self.name = name
+        self.email = email
+
+    def get_id(self):
+        return str(self.id)
+
+
+class IdentityCache:
+    """Resolves Flask-Login's user id to an Identity without a query per request.
+
+    Lookups try, in order: this worker's LRU (``IDENTITY_CACHE_SIZE``
+    entries), then the identity stored in the signed session cookie at
+    login, then the database. Cached and session identities are trusted
+    for ``IDENTITY_CACHE_TTL`` seconds and only while the shared ``users``
+    version (kept by the fragment cache) is unchanged; renaming or deleting
+    a user bumps it, so every worker and every session reloads.
+    """
+
+    SESSION_KEY = '_identity'
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._identities = OrderedDict()  # user_id -> (identity, version, expires_at)
+        self.hits = 0
+        self.session_hits = 0
+        self.loads = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDENTITY_CACHE_SIZE', 10000)
+        app.config.setdefault('IDENTITY_CACHE_TTL', 300)
+        self.app = app
+        self.max_entries = app.config['IDENTITY_CACHE_SIZE']
+        self.ttl = app.config['IDENTITY_CACHE_TTL']
+        app.extensions['identity_cache'] = self
+
+    def _version(self):
+        return self.app.extensions['fragment_cache'].version('users')
+
+    def watch(self, user_model):
+        """Invalidate identities whenever a user's name or email changes, or a user is deleted.
+
+        The flush only marks the session; the versions change once it
+        commits, so nothing rendered meanwhile from the old row is cached
+        under the new version, and a rollback changes nothing. Bulk
+        UPDATE/DELETE statements bypass these events; call ``invalidate()``
+        after committing them.
+        """
+        if getattr(self, 'user_model', None) is user_model:
+            return  # Already listening (create_app() ran before in this process)
+
+        def updated(mapper, connection, target):
+            state = inspect(target)
+            if state.attrs.name.history.has_changes() or state.attrs.email.history.has_changes():
+                state.session.info['identity_changed'] = True
+
+        def deleted(mapper, connection, target):
+            inspect(target).session.info['identity_changed'] = True
+
+        def committed(session):
+            if session.info.pop('identity_changed', False):
+                self.invalidate()
+
+        event.listen(user_model, 'after_update', updated)
+        event.listen(user_model, 'after_delete', deleted)
+        event.listen(RoutingSession, 'after_commit', committed)
+        event.listen(RoutingSession, 'after_rollback', lambda session: session.info.pop('identity_changed', None))
+        self.user_model = user_model
+
+    def invalidate(self):
+        # Leaderboard fragments and results pages show user names too
+        self.app.extensions['fragment_cache'].invalidate('users', 'results')
+        with self._lock:
+            self._identities.clear()
+
+    def remember(self, user):
+        """Store the user's identity in the session; call after login_user()"""
+        session[self.SESSION_KEY] = [user.id, user.name, user.email, self._version(), int(time.time())]
+
+    def forget(self):
+        """Drop the session's identity; call alongside logout_user()"""
+        session.pop(self.SESSION_KEY, None)
+
+    def _store(self, identity, version, expires_at):
+        with self._lock:
+            self._identities[identity.id] = (identity, version, expires_at)
+            self._identities.move_to_end(identity.id)
+            while len(self._identities) > self.max_entries:
+                self._identities.popitem(last=False)
+
+    def load(self, user_id):
+        """Flask-Login user_loader: an Identity for ``user_id``, or None if the user is gone"""
+        from app import db
+
+        user_id = int(user_id)
+        version = self._version()
+        with self._lock:
+            entry = self._identities.get(user_id)
+            if entry and entry[1] == version and entry[2] > time.monotonic():
+                self._identities.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+
+        payload = session.get(self.SESSION_KEY)
+        if payload and payload[0] == user_id and payload[3] == version:
+            age = time.time() - payload[4]
+            if 0 <= age < self.ttl:
+                identity = Identity(*payload[:3])
+                self._store(identity, version, time.monotonic() + self.ttl - age)
+                with self._lock:
+                    self.session_hits += 1
+                return identity
+
+        # Cached for later requests, so never from a replica that may lag
+        with primary():
+            user = db.session.get(self.user_model, user_id)
+        with self._lock:
+            self.loads += 1
+        if user is None:
+            session.pop(self.SESSION_KEY, None)
+            return None
+        self.remember(user)
+        identity = Identity(user.id, user.name, user.email)
+        self._store(identity, version, time.monotonic() + self.ttl)
+        return identity
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.session_hits + self.loads
+            return {
+                'hits': self.hits,
+                'session_hits': self.session_hits,
+                'loads': self.loads,
+                'hit_ratio': (self.hits + self.session_hits) / lookups if lookups else 0.0,
+                'entries': len(self._identities),
+            }
@@ -0,0 +1,169 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger('quiz.requests')
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised when a request runs more SQL statements than QUERY_BUDGET allows"""
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are bucket upper bounds"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+
+    def record(self, duration_ms, db_ms, queries):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        self.total += 1
+        self.sum_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.db_ms += db_ms
+        self.queries += queries
+
+    def percentile(self, fraction):
+        if not self.total:
+            return None
+        target = fraction * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        return {
+            'requests': self.total,
+            'mean_ms': round(self.sum_ms / self.total, 2) if self.total else None,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 2),
+            'avg_db_ms': round(self.db_ms / self.total, 2) if self.total else None,
+            'avg_queries': round(self.queries / self.total, 2) if self.total else None,
+            'buckets': {
+                (f'le_{bound}' if i < len(LATENCY_BUCKETS_MS) else 'inf'): count
+                for i, (bound, count) in enumerate(zip(LATENCY_BUCKETS_MS + (None,), self.counts))
+            },
+        }
+
+
+class RequestMetrics:
+    """Per-worker latency histograms keyed by Flask endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, endpoint, duration_ms, db_ms, queries):
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[endpoint] = LatencyHistogram()
+            histogram.record(duration_ms, db_ms, queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: histogram.summary()
+                    for endpoint, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+metrics = RequestMetrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if not has_request_context():
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    g.query_count = g.get('query_count', 0) + 1
+    g.db_time_ms = g.get('db_time_ms', 0.0) + elapsed_ms
+    if elapsed_ms >= g.get('slow_query_ms', float('inf')):
+        g.setdefault('slow_queries', []).append({
+            'statement': ' '.join(statement.split())[:500],
+            'duration_ms': round(elapsed_ms, 2),
+        })
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+def init_app(app):
+    """Time every SQL statement and request, and enforce the optional QUERY_BUDGET"""
+    app.config.setdefault('QUERY_BUDGET', None)
+    app.config.setdefault('SLOW_QUERY_MS', 100)
+    app.config.setdefault('SERVER_TIMING_HEADER', True)
+    for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute),
+                           ('handle_error', _handle_error)):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.slow_query_ms = app.config['SLOW_QUERY_MS']
+
+    @app.after_request
+    def record_request_metrics(response):
+        duration_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+        count = g.get('query_count', 0)
+        db_ms = g.get('db_time_ms', 0.0)
+        slow_queries = g.get('slow_queries', [])
+        endpoint = request.endpoint or 'unmatched'
+
+        metrics.record(endpoint, duration_ms, db_ms, count)
+
+        if app.config['SERVER_TIMING_HEADER']:
+            response.headers.add('Server-Timing', f'db;dur={db_ms:.2f};desc="{count} queries"')
+            response.headers.add('Server-Timing', f'app;dur={duration_ms:.2f}')
+
+        request_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'db_ms': round(db_ms, 2),
+            'queries': count,
+            'slow_queries': slow_queries,
+            'pid': os.getpid(),
+        }))
+        for slow in slow_queries:
+            logger.warning('Slow query on %s (%.2f ms): %s', endpoint, slow['duration_ms'], slow['statement'])
+
+        budget = app.config['QUERY_BUDGET']
+        if budget is not None and count > budget:
+            logger.error('%s ran %d queries (budget %d)', endpoint, count, budget)
+            raise QueryBudgetExceeded(f'{endpoint} ran {count} queries (budget {budget})')
+        return response
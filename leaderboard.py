@@ -0,0 +1,202 @@
+import random
+from collections import Counter, namedtuple
+from flask import abort, current_app, request
+from sqlalchemy import func, or_, and_, select, insert
+from sqlalchemy.orm import joinedload, load_only
+from app import db
+from db_helpers import dialect_insert
+from models import QuizSubmission, LeaderboardBucket, User
+import partitions
+
+# Leaderboard order: highest score first, fastest time breaks ties. Matches
+# the ix_quiz_submission_leaderboard index so no sort step is needed.
+RANK_ORDER = (QuizSubmission.score.desc(), QuizSubmission.time_taken.asc(), QuizSubmission.id.asc())
+
+
+def _bucket_upsert(rows):
+    """Build an INSERT ... ON CONFLICT that adds to existing bucket counts"""
+    stmt = dialect_insert(LeaderboardBucket)
+    if stmt is None:
+        return None
+    stmt = stmt.values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=['quiz_id', 'score', 'time_taken'],
+        set_={'entries': LeaderboardBucket.entries + stmt.excluded.entries}
+    )
+
+
+def record_results(results):
+    """Count (quiz_id, score, time_taken) results in their buckets; runs in the caller's transaction"""
+    counts = Counter(tuple(result) for result in results)
+    if not counts:
+        return
+    rows = [
+        {'quiz_id': quiz_id, 'score': score, 'time_taken': time_taken, 'entries': entries}
+        for (quiz_id, score, time_taken), entries in counts.items()
+    ]
+    stmt = _bucket_upsert(rows)
+    if stmt is not None:
+        db.session.execute(stmt)
+        return
+
+    for row in rows:
+        updated = LeaderboardBucket.query.filter_by(
+            quiz_id=row['quiz_id'],
+            score=row['score'],
+            time_taken=row['time_taken']
+        ).update({LeaderboardBucket.entries: LeaderboardBucket.entries + row['entries']})
+        if not updated:
+            db.session.add(LeaderboardBucket(**row))
+
+
+def ranked_query(quiz_id):
+    return QuizSubmission.query.filter_by(quiz_id=quiz_id).order_by(*RANK_ORDER)
+
+
+# One page of the leaderboard: entries are (rank, submission) pairs and
+# next_cursor is None on the last page
+LeaderboardPage = namedtuple('LeaderboardPage', ['entries', 'next_cursor'])
+
+
+def encode_cursor(submission):
+    return f'{submission.score}:{submission.time_taken}:{submission.id}'
+
+
+def decode_cursor(cursor):
+    """Parse a cursor from encode_cursor(); raises ValueError if malformed"""
+    score, time_taken, submission_id = (int(part) for part in cursor.split(':'))
+    return score, time_taken, submission_id
+
+
+def page(quiz_id, after=None, per_page=50, user_fields=(User.name,)):
+    """Keyset page of the leaderboard starting after the ``after`` cursor.
+
+    Seeks on the leaderboard index instead of using OFFSET, so deep pages
+    cost the same as the first one. Users are loaded in the same query.
+    """
+    query = ranked_query(quiz_id).options(joinedload(QuizSubmission.user).options(load_only(*user_fields)))
+    if after:
+        score, time_taken, submission_id = decode_cursor(after)
+        query = query.filter(or_(
+            QuizSubmission.score < score,
+            and_(QuizSubmission.score == score, QuizSubmission.time_taken > time_taken),
+            and_(QuizSubmission.score == score, QuizSubmission.time_taken == time_taken,
+                 QuizSubmission.id > submission_id)
+        ))
+
+    rows = query.limit(per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    rows = rows[:per_page]
+    if not rows:
+        return LeaderboardPage([], None)
+
+    # Position of the first row = results strictly better + earlier ties
+    first = rows[0]
+    rank = rank_for(quiz_id, first.score, first.time_taken)
+    earlier_ties = db.session.query(func.count(QuizSubmission.id)).filter(
+        QuizSubmission.quiz_id == quiz_id,
+        QuizSubmission.score == first.score,
+        QuizSubmission.time_taken == first.time_taken,
+        QuizSubmission.id < first.id
+    ).scalar()
+    position = rank + earlier_ties
+
+    entries = []
+    previous = None
+    for submission in rows:
+        if previous and (submission.score, submission.time_taken) != (previous.score, previous.time_taken):
+            rank = position
+        entries.append((rank, submission))
+        previous = submission
+        position += 1
+    return LeaderboardPage(entries, next_cursor)
+
+
+def page_from_request(quiz_id, user_fields=(User.name,)):
+    """Read ``after``/``per_page`` from the query string and fetch that page"""
+    per_page = request.args.get('per_page', current_app.config['LEADERBOARD_PAGE_SIZE'], type=int)
+    per_page = max(1, min(per_page, current_app.config['LEADERBOARD_MAX_PAGE_SIZE']))
+    try:
+        return page(quiz_id, after=request.args.get('after'), per_page=per_page, user_fields=user_fields)
+    except ValueError:
+        abort(400)
+
+
+def total_submissions(quiz_id):
+    return db.session.query(func.coalesce(func.sum(LeaderboardBucket.entries), 0))\
+        .filter(LeaderboardBucket.quiz_id == quiz_id).scalar()
+
+
+def rank_for(quiz_id, score, time_taken):
+    """Rank of a (score, time) result; tied results share the same rank"""
+    better = db.session.query(func.coalesce(func.sum(LeaderboardBucket.entries), 0)).filter(
+        LeaderboardBucket.quiz_id == quiz_id,
+        or_(
+            LeaderboardBucket.score > score,
+            and_(LeaderboardBucket.score == score, LeaderboardBucket.time_taken < time_taken)
+        )
+    ).scalar()
+    return better + 1
+
+
+def submission_of(quiz_id, user_id):
+    return QuizSubmission.query.filter_by(quiz_id=quiz_id, user_id=user_id).first()
+
+
+def rank_of(quiz_id, user_id):
+    submission = submission_of(quiz_id, user_id)
+    if not submission:
+        return None
+    return rank_for(quiz_id, submission.score, submission.time_taken)
+
+
+def pick_winner(quiz_id):
+    """Highest score wins, fastest time breaks ties, then a random pick among the rest"""
+    best = LeaderboardBucket.query.filter(
+        LeaderboardBucket.quiz_id == quiz_id,
+        LeaderboardBucket.entries > 0
+    ).order_by(LeaderboardBucket.score.desc(), LeaderboardBucket.time_taken.asc()).first()
+    if not best:
+        return None
+
+    tied = QuizSubmission.query.filter_by(
+        quiz_id=quiz_id,
+        score=best.score,
+        time_taken=best.time_taken
+    ).order_by(QuizSubmission.id)
+    return tied.offset(random.randrange(best.entries)).first() or tied.first()
+
+
+def rebuild(quiz_id=None):
+    """Recompute bucket counts from QuizSubmission with one GROUP BY per partition"""
+    from app import submission_partitions
+
+    def count(*criteria):
+        submissions = select(
+            QuizSubmission.quiz_id,
+            QuizSubmission.score,
+            QuizSubmission.time_taken,
+            func.count()
+        ).where(*criteria).group_by(QuizSubmission.quiz_id, QuizSubmission.score, QuizSubmission.time_taken)
+        db.session.execute(insert(LeaderboardBucket).from_select(
+            ['quiz_id', 'score', 'time_taken', 'entries'], submissions
+        ))
+
+    buckets = LeaderboardBucket.query
+    if quiz_id is not None:
+        buckets.filter_by(quiz_id=quiz_id).delete(synchronize_session=False)
+        with submission_partitions.of_quiz(quiz_id):
+            count(QuizSubmission.quiz_id == quiz_id)
+    else:
+        buckets.delete(synchronize_session=False)
+        # A quiz that is being moved is counted from the partition it moved to
+        with partitions.archive():
+            count(submission_partitions.holds(QuizSubmission.quiz_id))
+        count(submission_partitions.holds(QuizSubmission.quiz_id))
+    db.session.commit()
+
+
+def backfill():
+    """Build buckets for submissions recorded before the bucket table existed"""
+    if LeaderboardBucket.query.first() is None and QuizSubmission.query.first() is not None:
+        rebuild()
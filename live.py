@@ -0,0 +1,346 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+# One published change: journal id (also the SSE event id), channel, event name and JSON data
+Event = namedtuple('Event', ['id', 'channel', 'name', 'data'])
+
+
+def quiz_channel(quiz_id):
+    """Channel carrying one quiz's submissions, for the admin submissions page"""
+    return f'quiz-{quiz_id}'
+
+
+# Quiz state changes (scheduled, edited, locked, published) for every quiz
+QUIZZES_CHANNEL = 'quizzes'
+
+
+def quiz_state(quiz, state):
+    """Payload of a QUIZZES_CHANNEL event for a Quiz row or snapshot"""
+    return {
+        'quiz_id': quiz.id,
+        'state': state,
+        'title': quiz.title,
+        'start_time': quiz.start_time.isoformat() + 'Z',
+        'end_time': quiz.end_time.isoformat() + 'Z',
+        'is_locked': bool(quiz.is_locked),
+        'results_published': bool(quiz.results_published),
+    }
+
+
+class Subscription:
+    """One connected client: the events of its channels, waiting to be written out"""
+
+    def __init__(self, channels, last_id, size):
+        self.channels = frozenset(channels)
+        self.last_id = last_id
+        self._size = size
+        self._events = deque()
+        self._ready = threading.Condition()
+        self.overflowed = False
+
+    def push(self, events):
+        with self._ready:
+            self._events.extend(events)
+            if len(self._events) > self._size:
+                # Too slow to keep up: drop the backlog and have the client reload instead
+                self._events.clear()
+                self.overflowed = True
+            self.last_id = events[-1].id
+            self._ready.notify()
+
+    def wait(self, timeout):
+        """Events received since the last call, waiting up to ``timeout`` seconds for one"""
+        with self._ready:
+            self._ready.wait_for(lambda: self._events or self.overflowed, timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class LiveBroker:
+    """Pushes quiz state changes and new submissions to open pages.
+
+    Write paths call ``publish()``, which appends the event to a journal (a
+    SQLite file shared by the workers on one host, like the submission
+    queue) and wakes this worker's pump thread. The pump reads new journal
+    rows at most every ``LIVE_POLL_INTERVAL`` seconds, once per worker
+    however many clients are connected, and fans them out to the
+    subscribers of each channel. Clients reconnecting with
+    ``Last-Event-ID`` are replayed what they missed from the journal, which
+    keeps ``LIVE_RETENTION`` seconds of events.
+
+    Pages long-poll unless ``LIVE_TRANSPORT`` is ``sse``. Each open stream
+    or poll holds a request thread, so serve them with threaded workers
+    (gunicorn.conf.py); ``LIVE_MAX_SUBSCRIBERS`` caps the subscribers per
+    worker and ``LIVE_STREAM_TIMEOUT`` how long a stream lasts before the
+    browser reconnects.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._subscribers = set()
+        self._last_id = None
+        self._pump = None
+        self._pump_pid = None
+        self._pruned_at = 0.0
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LIVE_TRANSPORT', 'poll')
+        app.config.setdefault('LIVE_JOURNAL_PATH', os.path.join(app.instance_path, 'live_events.db'))
+        app.config.setdefault('LIVE_POLL_INTERVAL', 0.5)
+        app.config.setdefault('LIVE_RETENTION', 300)
+        app.config.setdefault('LIVE_BUFFER_SIZE', 256)
+        app.config.setdefault('LIVE_MAX_SUBSCRIBERS', 1000)
+        app.config.setdefault('LIVE_KEEPALIVE', 15)
+        app.config.setdefault('LIVE_STREAM_TIMEOUT', 300)
+        app.config.setdefault('LIVE_LONG_POLL_WAIT', 25)
+        self.app = app
+        app.extensions['live_broker'] = self
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            path = self.app.config['LIVE_JOURNAL_PATH']
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Events are short-lived notifications; losing the last few in a crash is fine
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # AUTOINCREMENT so ids are never reused after pruning; clients resume by id
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' channel TEXT NOT NULL,'
+                ' name TEXT NOT NULL,'
+                ' data TEXT NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def publish(self, channel, name, data):
+        """Send an event to the ``channel`` subscribers of every worker; returns its id.
+
+        Live updates are best effort: a failure is logged and None is
+        returned rather than failing the write that triggered it.
+        """
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                event_id = conn.execute(
+                    'INSERT INTO events (channel, name, data, created_at) VALUES (?, ?, ?, ?)',
+                    (channel, name, json.dumps(data), now)
+                ).lastrowid
+                retention = self.app.config['LIVE_RETENTION']
+                if now - self._pruned_at > retention / 10:
+                    self._pruned_at = now
+                    conn.execute('DELETE FROM events WHERE created_at < ?', (now - retention,))
+        except sqlite3.Error:
+            logger.exception('Could not publish %s event on %s', name, channel)
+            return None
+        with self._lock:
+            self.published += 1
+        self._wakeup.set()
+        return event_id
+
+    def cursor(self):
+        """Id of the newest event; pages embed it so their stream starts where the render left off"""
+        try:
+            # sqlite_sequence keeps the last id even once pruning has emptied the table
+            row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error:
+            logger.exception('Could not read the live event journal')
+            return 0
+
+    def _read(self, after, channels=None, up_to=None):
+        query = 'SELECT id, channel, name, data FROM events WHERE id > ?'
+        params = [after]
+        if up_to is not None:
+            query += ' AND id <= ?'
+            params.append(up_to)
+        if channels is not None:
+            query += f' AND channel IN ({", ".join("?" * len(channels))})'
+            params.extend(channels)
+        rows = self._connection().execute(query + ' ORDER BY id', params).fetchall()
+        return [Event(event_id, channel, name, json.loads(data)) for event_id, channel, name, data in rows]
+
+    def subscribe(self, channels, after=None):
+        """Register a client for ``channels``; None if this worker is at LIVE_MAX_SUBSCRIBERS.
+
+        ``after`` is the last event id the client has seen; anything newer
+        that is still in the journal is queued for it first.
+        """
+        channels = tuple(channels)
+        with self._lock:
+            if len(self._subscribers) >= self.app.config['LIVE_MAX_SUBSCRIBERS']:
+                self.rejected += 1
+                return None
+            if self._last_id is None:
+                self._last_id = self.cursor()
+            # The pump delivers everything after _last_id; the journal supplies the rest
+            # (or after ``after``, if this worker's pump has not caught up with the client yet)
+            subscription = Subscription(channels, max(self._last_id, after or 0),
+                                        self.app.config['LIVE_BUFFER_SIZE'])
+            if after is not None and after < self._last_id:
+                oldest = self._connection().execute('SELECT MIN(id) FROM events').fetchone()[0]
+                if oldest is None or oldest > after + 1:
+                    # Some of what it missed has been pruned; it has to reload
+                    subscription.overflowed = True
+                else:
+                    missed = self._read(after, channels, up_to=self._last_id)
+                    if missed:
+                        subscription.push(missed)
+                subscription.last_id = self._last_id
+            self._subscribers.add(subscription)
+        self._ensure_pump()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if subscription.overflowed:
+                self.overflows += 1
+
+    def _ensure_pump(self):
+        # Threads do not survive gunicorn's fork, so start one per worker on demand
+        with self._lock:
+            if self._pump is not None and self._pump.is_alive() and self._pump_pid == os.getpid():
+                return
+            self._pump_pid = os.getpid()
+            self._pump = threading.Thread(target=self._run_pump, name='live-pump', daemon=True)
+            self._pump.start()
+
+    def _run_pump(self):
+        while True:
+            self._wakeup.wait(self.app.config['LIVE_POLL_INTERVAL'])
+            self._wakeup.clear()
+            try:
+                self.pump()
+            except Exception:
+                logger.exception('Delivering live events failed; will retry')
+
+    def pump(self):
+        """Fan new journal events out to this worker's subscribers; returns how many were read"""
+        with self._lock:
+            if not self._subscribers:
+                # Nobody listening: skip the read and catch up from the head on the next subscribe
+                self._last_id = None
+                return 0
+            last_id = self._last_id
+        events = self._read(last_id)
+        if not events:
+            return 0
+
+        with self._lock:
+            self._last_id = events[-1].id
+            subscribers = list(self._subscribers)
+        delivered = 0
+        for subscription in subscribers:
+            matching = [event for event in events
+                        if event.channel in subscription.channels and event.id > subscription.last_id]
+            if matching:
+                subscription.push(matching)
+                delivered += len(matching)
+        with self._lock:
+            self.delivered += delivered
+        return len(events)
+
+    @staticmethod
+    def _after():
+        # EventSource resends the last id it saw when it reconnects
+        after = request.headers.get('Last-Event-ID') or request.args.get('after')
+        try:
+            return int(after) if after else None
+        except ValueError:
+            return None
+
+    def _busy(self):
+        response = Response('Too many live connections', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = str(random.randint(5, 30))
+        return response
+
+    def stream(self, channels):
+        """A Server-Sent Events response for ``channels``"""
+        subscription = self.subscribe(channels, self._after())
+        if subscription is None:
+            return self._busy()
+        keepalive = self.app.config['LIVE_KEEPALIVE']
+        deadline = time.monotonic() + self.app.config['LIVE_STREAM_TIMEOUT']
+
+        # Nothing from the request is used while streaming, so the request
+        # context (and its database session) ends as soon as this returns
+        def generate():
+            try:
+                # Spread reconnects out so a restart does not bring every client back at once
+                yield f'retry: {random.randint(1000, 5000)}\n\n'
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    events = subscription.wait(min(keepalive, remaining))
+                    if subscription.overflowed:
+                        yield 'event: resync\ndata: {}\n\n'
+                        return
+                    if not events:
+                        yield ': keepalive\n\n'
+                        continue
+                    yield ''.join(
+                        f'id: {event.id}\nevent: {event.name}\ndata: {json.dumps(event.data)}\n\n'
+                        for event in events
+                    )
+            finally:
+                self.unsubscribe(subscription)
+
+        response = Response(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stop nginx-style proxies from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    def long_poll(self, channels):
+        """JSON fallback for clients without EventSource: waits up to LIVE_LONG_POLL_WAIT for events"""
+        subscription = self.subscribe(channels, self._after())
+        if subscription is None:
+            return self._busy()
+        try:
+            events = subscription.wait(self.app.config['LIVE_LONG_POLL_WAIT'])
+        finally:
+            self.unsubscribe(subscription)
+        return {
+            'events': [{'id': event.id, 'event': event.name, 'data': event.data} for event in events],
+            'last_id': subscription.last_id,
+            'resync': subscription.overflowed,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'delivered': self.delivered,
+                'overflows': self.overflows,
+                'rejected': self.rejected,
+                'last_id': self._last_id,
+            }
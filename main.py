@@ -1,4 +1,13 @@
-from app import app
+from app import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
+    # The development server sets up its own database; deployments run
+    # `flask --app main migrate` and `flask --app main seed` once instead
+    import cli
+    with app.app_context():
+        cli.migrate()
+        if cli.seed():
+            print(f"Algo admin user created with email: {cli.ADMIN_EMAIL}")
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -2,6 +2,8 @@ from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from app import db
+from partitions import SUBMISSIONS_SCHEMA
+import scoring
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -25,6 +27,8 @@ class Quiz(db.Model):
     title = db.Column(db.String(200), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
+    # Legacy two-question columns, kept as a mirror of the first two
+    # Question rows so existing databases and older readers keep working
     question1 = db.Column(db.Text, nullable=False)
     question1_options = db.Column(db.JSON, nullable=False)  # List of options (2-6)
     question1_correct = db.Column(db.Integer, nullable=False)  # Index of correct answer
@@ -40,6 +44,36 @@ class Quiz(db.Model):
     # Relationship to submissions
     submissions = db.relationship('QuizSubmission', backref='quiz', lazy=True)
     winner = db.relationship('User', foreign_keys=[winner_id])
+    questions = db.relationship('Question', backref='quiz', lazy=True, order_by='Question.position')
+    archive = db.relationship('QuizArchive', uselist=False, lazy=True)
+    
+    # Unlocked quizzes by end time, for the open-quiz cache (partial: locked
+    # quizzes are the bulk of the table and never looked up this way), and
+    # newest first for the admin dashboard
+    __table_args__ = (
+        db.Index('ix_quiz_open', end_time,
+                 sqlite_where=is_locked == False, postgresql_where=is_locked == False),
+        db.Index('ix_quiz_created_at', created_at.desc()),
+    )
+
+class Question(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)  # 0-based order within the quiz
+    text = db.Column(db.Text, nullable=False)
+    correct_option = db.Column(db.Integer, nullable=False)  # Position of the correct Option
+
+    options = db.relationship('Option', backref='question', lazy=True, order_by='Option.position')
+
+    __table_args__ = (db.UniqueConstraint('quiz_id', 'position', name='unique_quiz_question_position'),)
+
+class Option(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.String(200), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('question_id', 'position', name='unique_question_option_position'),)
 
 class Winner(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,17 +86,74 @@ class Winner(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     quiz = db.relationship('Quiz', backref='winner_showcases')
+    
+    # Active winners in carousel order
+    __table_args__ = (
+        db.Index('ix_winner_showcase', display_order,
+                 sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
 
 class QuizSubmission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
-    answer1 = db.Column(db.Integer, nullable=False)  # Index of selected answer (0-3)
-    answer2 = db.Column(db.Integer, nullable=False)  # Index of selected answer (0-3)
+    answer1 = db.Column(db.Integer, nullable=False)  # Legacy mirror of the first Answer
+    answer2 = db.Column(db.Integer, nullable=False)  # Legacy mirror of the second Answer
     time_taken = db.Column(db.Integer, nullable=False)  # Time in seconds
     score = db.Column(db.Integer, nullable=False)
     bonus_awarded = db.Column(db.Boolean, default=False)
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Unique constraint to prevent multiple submissions per user per quiz
-    __table_args__ = (db.UniqueConstraint('user_id', 'quiz_id', name='unique_user_quiz_submission'),)
+    # Unique constraint to prevent multiple submissions per user per quiz, and
+    # indexes for the leaderboard order (score desc, fastest first), a user's
+    # latest submissions (dashboard) and a quiz's submissions in id order
+    # (submission index refresh; covering with user_id). Partitioned by quiz
+    # into hot and archive tables (see partitions.py).
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'quiz_id', name='unique_user_quiz_submission'),
+        db.Index('ix_quiz_submission_leaderboard', 'quiz_id', score.desc(), 'time_taken', 'id'),
+        db.Index('ix_quiz_submission_user_recent', 'user_id', 'id'),
+        db.Index('ix_quiz_submission_quiz_recent', 'quiz_id', 'id', 'user_id'),
+        {'schema': SUBMISSIONS_SCHEMA},
+    )
+
+    @property
+    def correct_answers(self):
+        return scoring.correct_count(self.score, self.bonus_awarded)
+
+class Answer(db.Model):
+    """One selected option of a submission.
+
+    Answers point at the question's position rather than its id, so editing
+    a quiz (which rewrites its Question rows) keeps existing answer sheets
+    valid.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey(f'{SUBMISSIONS_SCHEMA}.quiz_submission.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    selected = db.Column(db.Integer, nullable=False)  # Position of the selected Option
+
+    __table_args__ = (
+        db.UniqueConstraint('submission_id', 'position', name='unique_submission_answer'),
+        {'schema': SUBMISSIONS_SCHEMA},
+    )
+
+class LeaderboardBucket(db.Model):
+    """Number of submissions per (quiz, score, time) kept up to date on submit.
+
+    Ranks and winners are answered from these few rows instead of scanning
+    every submission of the quiz.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    time_taken = db.Column(db.Integer, nullable=False)
+    entries = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('quiz_id', 'score', 'time_taken', name='unique_leaderboard_bucket'),)
+
+class QuizArchive(db.Model):
+    """A quiz whose submissions and answers live in the archive partition (see partitions.py)"""
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), primary_key=True)
+    submissions = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,320 @@
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, g, has_app_context
+from sqlalchemy import MetaData, delete, event, insert, select, text, union
+from replicas import RoutingSession
+
+# Placeholder schema of the tables partitioned by quiz (QuizSubmission and
+# Answer). It never reaches the database: every statement maps it to the
+# hot tables, or to the archive for quizzes that were archived.
+SUBMISSIONS_SCHEMA = 'submissions'
+
+# Attached SQLite database / PostgreSQL schema holding archived quizzes
+ARCHIVE_SCHEMA = 'archive'
+
+# Indexes the archive does without: archived quizzes are closed, so the
+# submission index never reads their submissions in id order
+HOT_ONLY_INDEXES = {'ix_quiz_submission_quiz_recent'}
+
+# schema_translate_map of each partition
+HOT_TABLES = {SUBMISSIONS_SCHEMA: None}
+ARCHIVE_TABLES = {SUBMISSIONS_SCHEMA: ARCHIVE_SCHEMA}
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _route_to_archive(orm_execute_state):
+    if has_app_context() and g.get('submission_partition') == ARCHIVE_SCHEMA:
+        orm_execute_state.update_execution_options(schema_translate_map=ARCHIVE_TABLES)
+        partitions = current_app.extensions.get('submission_partitions')
+        if partitions:
+            partitions.count_archive_read()
+
+
+@contextmanager
+def archive():
+    """Run the block's submission and answer queries against the archive partition"""
+    previous = g.get('submission_partition')
+    g.submission_partition = ARCHIVE_SCHEMA
+    try:
+        yield
+    finally:
+        g.submission_partition = previous
+
+
+class SubmissionPartitions:
+    """Submissions and answers partitioned by quiz into hot and archive tables.
+
+    Every quiz ever run shares QuizSubmission, so without partitions the
+    queries of the open quiz slow down as history grows. Once a quiz is
+    locked, published and ended ``SUBMISSION_ARCHIVE_AFTER_DAYS`` ago,
+    ``flask --app main archive-quizzes`` moves its submissions and answer
+    sheets into archive tables of the same shape and records it in
+    QuizArchive: on SQLite a second file (``SUBMISSION_ARCHIVE_PATH``)
+    attached to every connection, on PostgreSQL the ``archive`` schema.
+    Nothing but archive/restore writes there, and it skips the indexes only
+    open quizzes need.
+
+    The hot tables keep the open and recent quizzes only. Views of one
+    quiz (``route_by_quiz`` / ``of_quiz()``) read the partition holding it;
+    pages spanning quizzes read both (``union()`` for the dashboard history,
+    one pass each for the full export).
+    Leaderboard buckets are not partitioned, so ranks and counts of
+    archived quizzes come from them as before.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.archive_path = None
+        self._lock = threading.Lock()
+        self.archive_reads = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        app.config.setdefault('SUBMISSION_ARCHIVE_AFTER_DAYS', 7)
+        app.config.setdefault('SUBMISSION_ARCHIVE_PATH', None)
+        self.app = app
+        app.extensions['submission_partitions'] = self
+
+        with app.app_context():
+            engines = dict(db.engines)
+        primary = engines[None]
+        if primary.dialect.name == 'sqlite':
+            database = primary.url.database
+            if database in (None, '', ':memory:'):
+                self.archive_path = ':memory:'
+            else:
+                root, ext = os.path.splitext(database)
+                self.archive_path = app.config['SUBMISSION_ARCHIVE_PATH'] or f'{root}-archive{ext or ".db"}'
+        for engine in engines.values():
+            # Unless a query asks for the archive, the partitioned tables are the hot ones
+            engine.update_execution_options(schema_translate_map=HOT_TABLES)
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', self._attach)
+
+    def _attach(self, dbapi_connection, connection_record):
+        # Replicas attach the same file: only archive/restore write to it
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (self.archive_path,))
+
+    def count_archive_read(self):
+        with self._lock:
+            self.archive_reads += 1
+
+    def is_archived(self, quiz_id):
+        from app import quiz_cache
+
+        quiz = quiz_cache.get_quiz(quiz_id)
+        return quiz is not None and quiz.archived
+
+    def of_quiz(self, quiz_id):
+        """Context manager reading one quiz's submissions from the partition holding them"""
+        return archive() if self.is_archived(quiz_id) else nullcontext()
+
+    def route_by_quiz(self, view):
+        """Decorator for views of one quiz (a ``quiz_id`` argument)"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with self.of_quiz(kwargs['quiz_id']):
+                return view(*args, **kwargs)
+        return wrapper
+
+    def union(self, build):
+        """Subquery over both partitions: the UNION of ``build(table)`` for the hot table and the archive.
+
+        ``build`` gets a QuizSubmission table and returns a SELECT of its
+        rows, which may have its own ORDER BY and LIMIT. UNION rather than
+        UNION ALL: a quiz being archived or restored is briefly in both.
+        Map it back to submissions with ``aliased(QuizSubmission, ...)``.
+        """
+        from models import QuizSubmission
+
+        archived_submissions, _ = self._archive_tables()
+        parts = [build(QuizSubmission.__table__).subquery(), build(archived_submissions).subquery()]
+        return union(*(select(part) for part in parts)).subquery()
+
+    def create_archive(self):
+        """Create the archive tables and their indexes if missing (part of cli.migrate)"""
+        from app import db
+        from models import QuizSubmission, Answer
+
+        tables = [QuizSubmission.__table__, Answer.__table__]
+        with db.engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}'))
+            connection = connection.execution_options(schema_translate_map=ARCHIVE_TABLES)
+            db.metadata.create_all(connection, tables=tables)
+            for table in tables:
+                for index in table.indexes:
+                    if index.name in HOT_ONLY_INDEXES:
+                        index.drop(connection, checkfirst=True)
+                    else:
+                        index.create(connection, checkfirst=True)
+
+    @staticmethod
+    def _archive_tables():
+        # Copies of the partitioned tables that always name the archive, for
+        # statements reading one partition and writing the other
+        from models import QuizSubmission, Answer
+
+        metadata = MetaData()
+        return (QuizSubmission.__table__.to_metadata(metadata, schema=ARCHIVE_SCHEMA),
+                Answer.__table__.to_metadata(metadata, schema=ARCHIVE_SCHEMA))
+
+    def archivable(self, now=None):
+        """Ids of locked, published quizzes that ended long enough ago and are not archived yet"""
+        from models import Quiz, QuizArchive
+
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(days=self.app.config['SUBMISSION_ARCHIVE_AFTER_DAYS'])
+        rows = Quiz.query.with_entities(Quiz.id).outerjoin(QuizArchive).filter(
+            Quiz.is_locked == True, Quiz.results_published == True,
+            Quiz.end_time < cutoff, QuizArchive.quiz_id.is_(None)
+        ).order_by(Quiz.id).all()
+        return [quiz_id for quiz_id, in rows]
+
+    def archive_quiz(self, quiz_id):
+        """Copy a quiz's submissions and answers to the archive and read them from there; returns the count.
+
+        Raises ValueError if the quiz can't be archived. The hot rows stay
+        until ``drop_hot_copies()``: workers route by their quiz snapshot,
+        which may be up to QUIZ_CACHE_VERSION_CHECK seconds old. The copy
+        and the switch are separate transactions, each writing one
+        database, so an interrupted run can simply be repeated.
+        """
+        from app import db, quiz_cache
+        from models import Quiz, QuizArchive, QuizSubmission, Answer
+
+        quiz = db.session.get(Quiz, quiz_id)
+        if quiz is None:
+            raise ValueError(f'Quiz {quiz_id} does not exist.')
+        if not (quiz.is_locked and quiz.results_published):
+            raise ValueError(f'Quiz {quiz_id} must be locked and its results published first.')
+        if db.session.get(QuizArchive, quiz_id) is not None:
+            raise ValueError(f'Quiz {quiz_id} is already archived.')
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite gives a new row the largest id + 1: if this quiz held the
+            # largest, the next submission would reuse an archived id
+            newest = db.session.query(QuizSubmission.quiz_id).order_by(QuizSubmission.id.desc()).limit(1).scalar()
+            if newest == quiz_id:
+                raise ValueError(f'Quiz {quiz_id} has the newest submission; archive it once another quiz has one.')
+
+        archived_submissions, archived_answers = self._archive_tables()
+        hot_ids = select(QuizSubmission.id).where(QuizSubmission.quiz_id == quiz_id)
+        self._delete_archive_rows(quiz_id)  # Leftovers of an interrupted run
+        moved = db.session.execute(insert(archived_submissions).from_select(
+            [column.name for column in QuizSubmission.__table__.columns],
+            select(*QuizSubmission.__table__.columns).where(QuizSubmission.quiz_id == quiz_id)
+        )).rowcount
+        # Answer ids are not referenced anywhere; the archive numbers its own
+        db.session.execute(insert(archived_answers).from_select(
+            ['submission_id', 'position', 'selected'],
+            select(Answer.submission_id, Answer.position, Answer.selected).where(Answer.submission_id.in_(hot_ids))
+        ))
+        db.session.commit()
+
+        db.session.add(QuizArchive(quiz_id=quiz_id, submissions=moved))
+        db.session.commit()
+        quiz_cache.invalidate()
+        return moved
+
+    def restore_quiz(self, quiz_id):
+        """Copy an archived quiz back to the hot partition, e.g. to edit it; returns the count.
+
+        The archive rows stay until ``drop_archive_copy()``, as in archive_quiz().
+        """
+        from app import db, quiz_cache
+        from models import QuizArchive, QuizSubmission, Answer
+
+        record = db.session.get(QuizArchive, quiz_id)
+        if record is None:
+            raise ValueError(f'Quiz {quiz_id} is not archived.')
+
+        archived_submissions, archived_answers = self._archive_tables()
+        self._delete_hot_rows(quiz_id)  # Not dropped yet if it was archived moments ago
+        moved = db.session.execute(insert(QuizSubmission).from_select(
+            [column.name for column in QuizSubmission.__table__.columns],
+            select(*archived_submissions.columns).where(archived_submissions.c.quiz_id == quiz_id)
+        )).rowcount
+        db.session.execute(insert(Answer).from_select(
+            ['submission_id', 'position', 'selected'],
+            select(archived_answers.c.submission_id, archived_answers.c.position, archived_answers.c.selected)
+            .where(archived_answers.c.submission_id.in_(
+                select(archived_submissions.c.id).where(archived_submissions.c.quiz_id == quiz_id)))
+        ))
+        db.session.delete(record)
+        db.session.commit()
+        quiz_cache.invalidate()
+        return moved
+
+    def _delete_hot_rows(self, quiz_id):
+        from app import db
+        from models import QuizSubmission, Answer
+
+        db.session.execute(delete(Answer).where(Answer.submission_id.in_(
+            select(QuizSubmission.id).where(QuizSubmission.quiz_id == quiz_id))))
+        db.session.execute(delete(QuizSubmission).where(QuizSubmission.quiz_id == quiz_id))
+
+    def _delete_archive_rows(self, quiz_id):
+        from app import db
+
+        archived_submissions, archived_answers = self._archive_tables()
+        db.session.execute(delete(archived_answers).where(archived_answers.c.submission_id.in_(
+            select(archived_submissions.c.id).where(archived_submissions.c.quiz_id == quiz_id))))
+        db.session.execute(delete(archived_submissions).where(archived_submissions.c.quiz_id == quiz_id))
+
+    def drop_hot_copies(self):
+        """Delete the hot rows of archived quizzes, one quiz per transaction; returns the quiz ids"""
+        from app import db
+        from models import QuizArchive, QuizSubmission
+
+        quiz_ids = [quiz_id for quiz_id, in db.session.query(QuizArchive.quiz_id).filter(
+            select(QuizSubmission.id).where(QuizSubmission.quiz_id == QuizArchive.quiz_id).exists()
+        ).order_by(QuizArchive.quiz_id)]
+        for quiz_id in quiz_ids:
+            self._delete_hot_rows(quiz_id)
+            db.session.commit()
+        return quiz_ids
+
+    def drop_archive_copy(self, quiz_id):
+        """Delete the archive rows of a restored quiz"""
+        from app import db
+        from models import QuizArchive
+
+        if db.session.get(QuizArchive, quiz_id) is not None:
+            raise ValueError(f'Quiz {quiz_id} is archived; restore it first.')
+        self._delete_archive_rows(quiz_id)
+        db.session.commit()
+
+    def holds(self, quiz_id_column):
+        """Filter on a quiz id column keeping the quizzes whose rows the current partition holds.
+
+        For queries spanning quizzes, which must not count a quiz twice
+        while its rows are in both partitions.
+        """
+        from models import QuizArchive
+
+        archived = select(QuizArchive.quiz_id)
+        if g.get('submission_partition') == ARCHIVE_SCHEMA:
+            return quiz_id_column.in_(archived)
+        return quiz_id_column.not_in(archived)
+
+    def compact(self, vacuum=False):
+        """Refresh the archive's statistics (PostgreSQL); ``vacuum`` rewrites the SQLite file without free pages"""
+        from app import db
+
+        with db.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+            if connection.dialect.name == 'postgresql':
+                # Also marks the pages all-visible, so lookups can be index-only scans
+                connection.execute(text(f'VACUUM ANALYZE {ARCHIVE_SCHEMA}.quiz_submission, {ARCHIVE_SCHEMA}.answer'))
+            elif connection.dialect.name == 'sqlite' and vacuum:
+                connection.execute(text(f'VACUUM {ARCHIVE_SCHEMA}'))
+
+    def stats(self):
+        with self._lock:
+            return {'archive_reads': self.archive_reads}
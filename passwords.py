@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(RuntimeError):
+    """Raised when more hashes are waiting than PASSWORD_HASH_QUEUE_LIMIT allows,
+    or one waited longer than PASSWORD_HASH_TIMEOUT"""
+
+
+class PasswordHasher:
+    """Password hashing with a configurable cost, off the request thread.
+
+    ``PASSWORD_HASH_METHOD`` is any method Werkzeug understands, e.g.
+    ``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``. Hashes and checks
+    run in a pool of ``PASSWORD_HASH_WORKERS`` processes (0 runs them
+    inline), so a login burst is bounded by the pool size rather than by
+    how many request threads happen to be hashing at once. At most
+    ``PASSWORD_HASH_QUEUE_LIMIT`` hashes may be waiting; past that callers
+    get HashingBusy instead of queueing without bound, as do callers whose
+    hash is not done within ``PASSWORD_HASH_TIMEOUT`` seconds.
+
+    ``login()`` calls ``check_and_upgrade()``, which re-hashes a password
+    stored with older parameters once the user has proven they know it.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self.depth = 0
+        self.max_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        self._stored_method = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('PASSWORD_SALT_LENGTH', 16)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_LIMIT', 256)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 30)
+        self.app = app
+        app.extensions['password_hasher'] = self
+
+    @property
+    def method(self):
+        return self.app.config['PASSWORD_HASH_METHOD']
+
+    def _pool(self):
+        # Pools do not survive a fork, so each worker process starts its own
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.app.config['PASSWORD_HASH_WORKERS'])
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def shutdown(self):
+        """Stop the pool (it is restarted on next use, with the current config)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._executor_pid == os.getpid():
+            executor.shutdown()
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self.depth >= self.app.config['PASSWORD_HASH_QUEUE_LIMIT']:
+                self.rejected += 1
+                raise HashingBusy('Too many password hashes waiting')
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            executor = self._pool() if self.app.config['PASSWORD_HASH_WORKERS'] else None
+        try:
+            if executor is None:
+                return fn(*args)
+            try:
+                future = executor.submit(fn, *args)
+                return future.result(timeout=self.app.config['PASSWORD_HASH_TIMEOUT'])
+            except TimeoutError:
+                # Drop it if it has not started; the caller shows the busy message
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                raise HashingBusy('Password hash timed out')
+            except BrokenProcessPool:
+                # A killed worker breaks the whole pool; start over and answer this call inline
+                logger.warning('Password hashing pool broke, restarting it')
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                return fn(*args)
+        finally:
+            with self._lock:
+                self.depth -= 1
+                self.completed += 1
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method,
+                         self.app.config['PASSWORD_SALT_LENGTH'])
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def _stored_prefix(self):
+        """PASSWORD_HASH_METHOD as Werkzeug writes it into hashes, e.g. ``scrypt`` -> ``scrypt:32768:8:1``"""
+        method = self.method
+        if self._stored_method is None or self._stored_method[0] != method:
+            # Shorthands get Werkzeug's default parameters; a probe hash shows which
+            self._stored_method = (method, generate_password_hash('', method).split('$', 1)[0])
+        return self._stored_method[1]
+
+    def needs_rehash(self, pwhash):
+        """True if the hash was made with other parameters than PASSWORD_HASH_METHOD"""
+        return pwhash.split('$', 1)[0] != self._stored_prefix()
+
+    def check_and_upgrade(self, account, password):
+        """Verify an account's password, re-hashing it with the current parameters if needed.
+
+        Works for any model with a ``password_hash`` column; the caller
+        commits the session.
+        """
+        if not self.verify(account.password_hash, password):
+            return False
+        if self.needs_rehash(account.password_hash):
+            account.password_hash = self.hash(password)
+            with self._lock:
+                self.rehashed += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.app.config['PASSWORD_HASH_WORKERS'],
+                'method': self.method,
+                'queue_depth': self.depth,
+                'max_queue_depth': self.max_depth,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'rehashed': self.rehashed,
+            }
@@ -0,0 +1,286 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, url_for
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Without Pillow uploads are still deduplicated, just not resized
+    Image = None
+
+logger = logging.getLogger(__name__)
+# Per-view photo diagnostics, one JSON object per line; silent unless PHOTO_DEBUG is set
+debug_logger = logging.getLogger('quiz.photos')
+
+# <content hash>.<ext> originals and <content hash>-<width>w.<format> variants
+HASHED_NAME = re.compile(r'(?P<digest>[0-9a-f]{20})(-\d+w)?\.[a-z]+')
+
+MIMETYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+# What a template needs to show a photo: the fallback src and (mimetype,
+# srcset) pairs for <picture> sources, best format first
+PhotoSources = namedtuple('PhotoSources', ['src', 'sources'])
+
+# Index entry for a Winner.photo_url: whether the file is on disk, its size
+# in bytes, pixel dimensions (None if unknown) and the URL it is served from
+PhotoInfo = namedtuple('PhotoInfo', ['exists', 'path', 'size', 'width', 'height', 'url'])
+
+
+def _write_atomic(path, write):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class PhotoPipeline:
+    """Content-addressed storage and resized variants for winner photos.
+
+    Uploads are stored as ``<sha256 prefix>.<ext>``, so the same picture
+    uploaded twice is kept once. A worker pool then writes
+    ``PHOTO_WIDTHS``-wide variants in each of ``PHOTO_FORMATS`` (when
+    Pillow supports them) plus a ``<digest>.json`` manifest, off the
+    request thread. Hashed names never change content, so the static route
+    serves them with an immutable, year-long Cache-Control.
+    """
+
+    # Seconds a "no variants yet" answer is trusted before the manifest is re-read
+    MISSING_TTL = 30
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._pending = set()
+        self._manifests = {}  # digest -> manifest dict, or (None, checked_at)
+        self._index = {}  # photo_url -> PhotoInfo
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('UPLOAD_FOLDER', 'static/uploads')
+        app.config.setdefault('PHOTO_WIDTHS', (128, 256, 512))
+        app.config.setdefault('PHOTO_FORMATS', ('avif', 'webp'))
+        app.config.setdefault('PHOTO_QUALITY', 80)
+        app.config.setdefault('PHOTO_WORKERS', 2)
+        app.config.setdefault('PHOTO_CACHE_MAX_AGE', 365 * 24 * 3600)
+        app.config.setdefault('PHOTO_DEBUG', False)
+        self.app = app
+        self.upload_dir = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+        # photo_url values are relative to the static folder, e.g. "uploads/<name>"
+        self.url_prefix = os.path.relpath(self.upload_dir, app.static_folder).replace(os.sep, '/')
+        app.after_request(self._cache_headers)
+        app.jinja_env.globals['winner_photo'] = self.sources
+        app.extensions['photo_pipeline'] = self
+        # basicConfig() enables DEBUG for every logger, so opt out explicitly
+        debug_logger.setLevel(logging.DEBUG if app.config['PHOTO_DEBUG'] else logging.INFO)
+
+    @property
+    def formats(self):
+        if Image is None:
+            return ()
+        return tuple(fmt for fmt in self.app.config['PHOTO_FORMATS'] if features.check(fmt))
+
+    def save_upload(self, file):
+        """Store an uploaded FileStorage under its content hash; returns its photo_url"""
+        _, ext = os.path.splitext(file.filename)
+        return self.store(file.read(), ext.lstrip('.').lower())
+
+    def store(self, data, ext):
+        """Store image bytes under their content hash and queue the variants"""
+        digest = hashlib.sha256(data).hexdigest()[:20]
+        filename = f'{digest}.{ext}'
+        path = os.path.join(self.upload_dir, filename)
+        if not os.path.exists(path):
+            os.makedirs(self.upload_dir, exist_ok=True)
+
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+            _write_atomic(path, write)
+        self._submit(digest, path)
+        return f'{self.url_prefix}/{filename}'
+
+    def ingest(self, photo_url):
+        """Move an existing static photo into the pipeline; returns the new photo_url.
+
+        URLs that are remote, already content-addressed or missing on disk
+        are returned unchanged.
+        """
+        if not photo_url or photo_url.startswith('http') or self._digest(photo_url):
+            return photo_url
+        path = os.path.join(self.app.static_folder, photo_url)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return photo_url
+        return self.store(data, os.path.splitext(photo_url)[1].lstrip('.').lower())
+
+    def _pool(self):
+        # Threads do not survive a fork, so each worker process gets its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.app.config['PHOTO_WORKERS'],
+                                                thread_name_prefix='photo-pipeline')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _submit(self, digest, path):
+        if Image is None or os.path.exists(self._manifest_path(digest)):
+            return None
+        with self._lock:
+            if digest in self._pending:
+                return None
+            self._pending.add(digest)
+            return self._pool().submit(self._process, digest, path)
+
+    def _manifest_path(self, digest):
+        return os.path.join(self.upload_dir, f'{digest}.json')
+
+    def _process(self, digest, path):
+        try:
+            manifest = self._render_variants(digest, path)
+
+            def write(tmp_path):
+                with open(tmp_path, 'w') as f:
+                    json.dump(manifest, f)
+            _write_atomic(self._manifest_path(digest), write)
+            with self._lock:
+                self._manifests[digest] = manifest
+            # Pages rendered while the variants were pending only link the original
+            fragment_cache = self.app.extensions.get('fragment_cache')
+            if fragment_cache is not None:
+                fragment_cache.invalidate('winners')
+        except Exception:
+            logger.exception('Could not create variants of %s', path)
+        finally:
+            with self._lock:
+                self._pending.discard(digest)
+
+    def _render_variants(self, digest, path):
+        quality = self.app.config['PHOTO_QUALITY']
+        with Image.open(path) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            width, height = image.size
+
+            # Never upscale; a photo smaller than every width gets one variant at its own size
+            widths = sorted({min(w, width) for w in self.app.config['PHOTO_WIDTHS']})
+            variants = {fmt: [] for fmt in self.formats}
+            for variant_width in widths:
+                variant_height = max(1, round(height * variant_width / width))
+                resized = image.resize((variant_width, variant_height), Image.LANCZOS)
+                for fmt in variants:
+                    filename = f'{digest}-{variant_width}w.{fmt}'
+                    _write_atomic(os.path.join(self.upload_dir, filename),
+                                  lambda tmp_path: resized.save(tmp_path, format=fmt.upper(), quality=quality))
+                    variants[fmt].append((variant_width, filename))
+        return {'width': width, 'height': height, 'variants': variants}
+
+    def _digest(self, photo_url):
+        match = HASHED_NAME.fullmatch(photo_url.rsplit('/', 1)[-1])
+        return match.group('digest') if match else None
+
+    def manifest(self, digest):
+        """Variant manifest for a content hash, or None while it is being processed"""
+        with self._lock:
+            cached = self._manifests.get(digest)
+        if isinstance(cached, dict):
+            return cached
+        if cached is not None and time.monotonic() - cached[1] < self.MISSING_TTL:
+            return None
+
+        try:
+            with open(self._manifest_path(digest)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        with self._lock:
+            self._manifests[digest] = manifest if manifest is not None else (None, time.monotonic())
+        return manifest
+
+    def sources(self, photo_url):
+        """PhotoSources for a Winner.photo_url (remote URLs and legacy files pass through)"""
+        if photo_url.startswith('http'):
+            return PhotoSources(photo_url, ())
+        src = url_for('static', filename=photo_url)
+        digest = self._digest(photo_url)
+        manifest = self.manifest(digest) if digest else None
+        if not manifest:
+            return PhotoSources(src, ())
+        return PhotoSources(src, tuple(
+            (MIMETYPES[fmt], ', '.join(
+                f"{url_for('static', filename=f'{self.url_prefix}/{filename}')} {width}w"
+                for width, filename in manifest['variants'][fmt]
+            ))
+            for fmt in MIMETYPES if manifest['variants'].get(fmt)
+        ))
+
+    def _describe(self, photo_url):
+        if photo_url.startswith('http'):
+            return PhotoInfo(True, None, None, None, None, photo_url)
+        path = os.path.join(self.app.static_folder, photo_url)
+        url = f'{self.app.static_url_path}/{photo_url}'
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return PhotoInfo(False, path, None, None, None, url)
+
+        width = height = None
+        digest = self._digest(photo_url)
+        manifest = self.manifest(digest) if digest else None
+        if manifest:
+            width, height = manifest['width'], manifest['height']
+        elif Image is not None:
+            try:
+                # Only the header is read; pixels are never decoded here
+                with Image.open(path) as image:
+                    width, height = image.size
+            except Exception:
+                pass
+        return PhotoInfo(True, path, size, width, height, url)
+
+    def refresh(self, photo_urls):
+        """(Re)build index entries for these photo_urls; call after winners change"""
+        entries = {photo_url: self._describe(photo_url) for photo_url in set(photo_urls) if photo_url}
+        with self._lock:
+            self._index.update(entries)
+
+    def forget(self, photo_url):
+        with self._lock:
+            self._index.pop(photo_url, None)
+
+    def info(self, photo_url):
+        """PhotoInfo from the index; a photo added in another worker is looked up once"""
+        with self._lock:
+            info = self._index.get(photo_url)
+        if info is None:
+            info = self._describe(photo_url)
+            with self._lock:
+                self._index[photo_url] = info
+        return info
+
+    def debug(self, event, winners):
+        """Log index entries for the winners a view shows, when PHOTO_DEBUG is on"""
+        if not debug_logger.isEnabledFor(logging.DEBUG):
+            return
+        for winner in winners:
+            entry = {'event': event, 'winner_id': winner.id, 'photo_url': winner.photo_url}
+            if winner.photo_url:
+                entry.update(self.info(winner.photo_url)._asdict())
+            debug_logger.debug(json.dumps(entry))
+
+    def _cache_headers(self, response):
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            filename = (request.view_args or {}).get('filename', '')
+            if filename.startswith(self.url_prefix + '/') and self._digest(filename):
+                response.cache_control.public = True
+                response.cache_control.max_age = self.app.config['PHOTO_CACHE_MAX_AGE']
+                response.cache_control.immutable = True
+                response.cache_control.no_cache = None
+        return response
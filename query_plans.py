@@ -0,0 +1,192 @@
+"""EXPLAIN the app's hot queries and flag plans that stopped using an index.
+
+    flask --app main explain-queries     # exits 1 if any plan is flagged
+    GET /admin/query-plans               # the same report as JSON
+
+Each hot query below mirrors one the app runs on a busy path. Its plan is
+flagged for a full table scan or a separate sort step, unless the query
+declares that table or sort as expected. On PostgreSQL sequential scans
+are disabled for the EXPLAIN, so a small test database still shows
+whether an index *can* serve the query.
+"""
+import json
+import re
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import event, func, select, text
+from app import db, submission_partitions
+from partitions import ARCHIVE_TABLES
+from models import Answer, LeaderboardBucket, Question, Quiz, QuizSubmission, User, Winner
+import leaderboard
+
+# Parameters the hot queries are planned with; plans don't depend on the values
+SAMPLE = {'quiz_id': 1, 'user_id': 1, 'email': 'user@example.com', 'quiz_url': 'sample', 'score': 25,
+          'time_taken': 30, 'submission_id': 1}
+
+# One audited query: plan lines, tables read in full, sorts and whether it passed
+PlanReport = namedtuple('PlanReport', ['name', 'plan', 'scans', 'sorts', 'ok'])
+
+# name -> (statement builder, tables allowed a full scan, sort allowed)
+HOT_QUERIES = {}
+
+
+def hot_query(name, allow_scan=(), allow_sort=False):
+    """Register a function returning a statement (or ORM query) to audit"""
+    def register(build):
+        HOT_QUERIES[name] = (build, frozenset(allow_scan), allow_sort)
+        return build
+    return register
+
+
+@hot_query('login: user by email')
+def _user_by_email():
+    return select(User).where(User.email == SAMPLE['email']).limit(1)
+
+
+@hot_query('quiz cache: open quizzes')
+def _open_quizzes():
+    return select(Quiz).where(Quiz.end_time >= datetime.utcnow(), Quiz.is_locked == False)
+
+
+@hot_query('quiz cache: questions of a quiz')
+def _quiz_questions():
+    return select(Question).where(Question.quiz_id.in_([SAMPLE['quiz_id']])).order_by(Question.position)
+
+
+@hot_query('take quiz: quiz by url')
+def _quiz_by_url():
+    return select(Quiz).where(Quiz.quiz_url == SAMPLE['quiz_url']).limit(1)
+
+
+@hot_query('dashboard: recent submissions of a user', allow_sort=True)
+def _recent_submissions():
+    # Both partitions; only the few rows of the union are sorted
+    recent = submission_partitions.union(
+        lambda table: select(table).where(table.c.user_id == SAMPLE['user_id']).order_by(table.c.id.desc()).limit(6)
+    )
+    return select(recent).order_by(recent.c.id.desc()).limit(6)
+
+
+@hot_query('dashboard: active winners')
+def _showcase_winners():
+    return select(Winner).where(Winner.is_active == True).order_by(Winner.display_order)
+
+
+@hot_query('submit: submission of a user')
+def _submission_of():
+    return select(QuizSubmission).where(QuizSubmission.quiz_id == SAMPLE['quiz_id'],
+                                        QuizSubmission.user_id == SAMPLE['user_id']).limit(1)
+
+
+@hot_query('submission index: new submissions of a quiz')
+def _new_submissions():
+    return select(QuizSubmission.id, QuizSubmission.user_id).where(
+        QuizSubmission.quiz_id == SAMPLE['quiz_id'], QuizSubmission.id > SAMPLE['submission_id'])
+
+
+@hot_query('results: leaderboard page')
+def _leaderboard_page():
+    return leaderboard.ranked_query(SAMPLE['quiz_id']).join(User, QuizSubmission.user_id == User.id).limit(51)
+
+
+@hot_query('results: rank of a result')
+def _rank_for():
+    return select(func.sum(LeaderboardBucket.entries)).where(
+        LeaderboardBucket.quiz_id == SAMPLE['quiz_id'], LeaderboardBucket.score > SAMPLE['score'])
+
+
+@hot_query('results: earlier ties')
+def _earlier_ties():
+    return select(func.count(QuizSubmission.id)).where(
+        QuizSubmission.quiz_id == SAMPLE['quiz_id'], QuizSubmission.score == SAMPLE['score'],
+        QuizSubmission.time_taken == SAMPLE['time_taken'], QuizSubmission.id < SAMPLE['submission_id'])
+
+
+@hot_query('results: answer sheets')
+def _answer_sheets():
+    return select(Answer.submission_id, Answer.selected).where(Answer.submission_id.in_([SAMPLE['submission_id']]))\
+        .order_by(Answer.submission_id, Answer.position)
+
+
+@hot_query('results: archived leaderboard page')
+def _archived_leaderboard_page():
+    return _leaderboard_page().execution_options(schema_translate_map=ARCHIVE_TABLES)
+
+
+@hot_query('admin: submission counts per quiz')
+def _submission_counts():
+    return select(LeaderboardBucket.quiz_id, func.sum(LeaderboardBucket.entries)).group_by(LeaderboardBucket.quiz_id)
+
+
+@hot_query('admin: quizzes newest first')
+def _quizzes_newest_first():
+    return select(Quiz).order_by(Quiz.created_at.desc())
+
+
+# SQLite: "SCAN quiz" (3.36+) or "SCAN TABLE quiz"; index scans name the index
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+# Subqueries, whose scans read the subquery's rows rather than a table
+SQLITE_SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)$')
+
+
+def _sqlite_findings(rows):
+    plan = [row[-1] for row in rows]
+    subqueries = {match.group(1) for match in map(SQLITE_SUBQUERY.match, plan) if match}
+    scans = sorted({match.group(1) for match in map(SQLITE_SCAN.match, plan) if match} - subqueries)
+    sorts = [line for line in plan if line.startswith('USE TEMP B-TREE')]
+    return plan, scans, sorts
+
+
+def _postgresql_findings(rows):
+    scans, sorts, plan = set(), [], []
+
+    def walk(node, depth):
+        plan.append('  ' * depth + node['Node Type'] + (f" on {node['Relation Name']}" if 'Relation Name' in node else ''))
+        if node['Node Type'] == 'Seq Scan':
+            scans.add(node['Relation Name'])
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            sorts.append(f"Sort by {', '.join(node.get('Sort Key', []))}")
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    document = rows[0][0]
+    walk((json.loads(document) if isinstance(document, str) else document)[0]['Plan'], 0)
+    return plan, sorted(scans), sorts
+
+
+def explain(statement):
+    """(plan lines, fully scanned tables, sort steps) of a statement on the app's database"""
+    if hasattr(statement, 'statement'):
+        statement = statement.statement
+    with db.engine.connect() as connection:
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            prefix, findings = 'EXPLAIN QUERY PLAN ', _sqlite_findings
+        elif dialect == 'postgresql':
+            connection.execute(text('SET LOCAL enable_seqscan = off'))
+            prefix, findings = 'EXPLAIN (FORMAT JSON) ', _postgresql_findings
+        else:
+            raise RuntimeError(f'Query plans are not supported on {dialect}')
+
+        # Let SQLAlchemy compile and bind the statement, then ask for its plan instead of running it
+        def add_explain(conn, cursor, sql, parameters, context, executemany):
+            return prefix + sql, parameters
+        event.listen(connection, 'before_cursor_execute', add_explain, retval=True)
+        try:
+            # Statement options (an archive schema_translate_map) would lose to the engine's
+            rows = connection.execute(statement, execution_options=statement.get_execution_options()).all()
+        finally:
+            event.remove(connection, 'before_cursor_execute', add_explain)
+            connection.rollback()
+    return findings(rows)
+
+
+def audit():
+    """PlanReport for every hot query, in registration order"""
+    reports = []
+    for name, (build, allow_scan, allow_sort) in HOT_QUERIES.items():
+        plan, scans, sorts = explain(build())
+        ok = set(scans) <= allow_scan and (allow_sort or not sorts)
+        reports.append(PlanReport(name, plan, scans, sorts, ok))
+    return reports
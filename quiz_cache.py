@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from flask import abort
+from replicas import primary
+
+# One question of a quiz: text, tuple of option texts and the correct option's position
+QuizQuestion = namedtuple('QuizQuestion', ['text', 'options', 'correct'])
+
+
+class QuizSnapshot:
+    """Read-only copy of a Quiz row and its questions that can be shared between requests"""
+
+    COLUMNS = (
+        'id', 'title', 'start_time', 'end_time',
+        'is_locked', 'results_published', 'winner_id', 'quiz_url',
+    )
+    __slots__ = COLUMNS + ('questions', 'answer_key', 'archived')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('QuizSnapshot is read-only')
+
+    @classmethod
+    def from_model(cls, quiz):
+        """Snapshot a Quiz whose questions and options are already loaded"""
+        fields = {name: getattr(quiz, name) for name in cls.COLUMNS}
+        fields['questions'] = tuple(
+            QuizQuestion(question.text, tuple(option.text for option in question.options), question.correct_option)
+            for question in quiz.questions
+        )
+        # Preloaded once so scoring compares whole sheets against a tuple
+        fields['answer_key'] = tuple(question.correct for question in fields['questions'])
+        # Whether its submissions moved to the archive partition (only locked quizzes are archived)
+        fields['archived'] = bool(quiz.is_locked) and quiz.archive is not None
+        return cls(**fields)
+
+    def is_open(self, now):
+        return self.start_time <= now <= self.end_time and not self.is_locked
+
+
+class QuizCache:
+    """Per-worker cache of quiz snapshots.
+
+    Snapshots expire after ``QUIZ_CACHE_TTL`` seconds. Admin writes call
+    ``invalidate()``, which rewrites a shared version file; every worker
+    polls that file at most once per ``QUIZ_CACHE_VERSION_CHECK`` seconds
+    and drops its snapshots when the version changes.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._quizzes = {}  # quiz_id -> (snapshot, expires_at)
+        self._open_quizzes = None  # (snapshots, expires_at)
+        self._generation = 0
+        self._version = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    @staticmethod
+    def _question_loader():
+        from sqlalchemy.orm import selectinload
+        from models import Quiz, Question
+
+        # Questions and options in two extra queries, however many there are
+        return selectinload(Quiz.questions).selectinload(Question.options)
+
+    def init_app(self, app):
+        app.config.setdefault('QUIZ_CACHE_TTL', 30)
+        app.config.setdefault('QUIZ_CACHE_VERSION_CHECK', 1)
+        app.config.setdefault('QUIZ_CACHE_VERSION_FILE',
+                              os.path.join(app.instance_path, 'quiz_cache.version'))
+        self.ttl = app.config['QUIZ_CACHE_TTL']
+        self.version_check_interval = app.config['QUIZ_CACHE_VERSION_CHECK']
+        self.version_file = app.config['QUIZ_CACHE_VERSION_FILE']
+        os.makedirs(os.path.dirname(self.version_file), exist_ok=True)
+        app.extensions['quiz_cache'] = self
+
+    def _read_version(self):
+        try:
+            with open(self.version_file) as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def _clear(self):
+        self._quizzes.clear()
+        self._open_quizzes = None
+        self._generation += 1
+
+    def _sync_version(self):
+        """Drop local snapshots if another worker bumped the version. Caller holds the lock."""
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        version = self._read_version()
+        if self._version is not None and version != self._version:
+            self._clear()
+            self.invalidations += 1
+        self._version = version
+
+    def _store(self, generation, store):
+        # Skip the write if an invalidation happened while we were loading
+        with self._lock:
+            if generation == self._generation:
+                store(time.monotonic() + self.ttl)
+
+    def get_quiz(self, quiz_id):
+        from sqlalchemy.orm import selectinload
+        from models import Quiz
+
+        with self._lock:
+            self._sync_version()
+            entry = self._quizzes.get(quiz_id)
+            if entry and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        # A query rather than session.get(), which would skip the loader for a
+        # Quiz the request already has in its identity map
+        with primary():
+            quiz = Quiz.query.filter_by(id=quiz_id).options(
+                self._question_loader(), selectinload(Quiz.archive)).first()
+        if quiz is None:
+            return None
+        snapshot = QuizSnapshot.from_model(quiz)
+
+        def store(expires_at):
+            self._quizzes[quiz_id] = (snapshot, expires_at)
+        self._store(generation, store)
+        return snapshot
+
+    def get_quiz_or_404(self, quiz_id):
+        snapshot = self.get_quiz(quiz_id)
+        if snapshot is None:
+            abort(404)
+        return snapshot
+
+    def _open_snapshots(self, now):
+        """Snapshots of every unlocked quiz that has not ended yet"""
+        from models import Quiz
+
+        with self._lock:
+            self._sync_version()
+            entry = self._open_quizzes
+            if entry and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        # Cache every unlocked quiz that has not ended yet, so a quiz that
+        # opens between refreshes is picked up without another query. Sorted
+        # here: ORDER BY id would make SQLite scan the table in rowid order
+        # instead of using the ix_quiz_open index.
+        with primary():
+            quizzes = Quiz.query.filter(
+                Quiz.end_time >= now,
+                Quiz.is_locked == False
+            ).options(self._question_loader()).all()
+        snapshots = tuple(sorted((QuizSnapshot.from_model(quiz) for quiz in quizzes), key=lambda snapshot: snapshot.id))
+
+        def store(expires_at):
+            self._open_quizzes = (snapshots, expires_at)
+        self._store(generation, store)
+        return snapshots
+
+    def get_active_quiz(self, now=None):
+        """Return the quiz currently open for submissions, if any"""
+        now = now or datetime.utcnow()
+        for snapshot in self._open_snapshots(now):
+            if snapshot.is_open(now):
+                return snapshot
+        return None
+
+    def get_next_quiz(self, now=None):
+        """Return the unlocked quiz that opens soonest after ``now``, if any"""
+        now = now or datetime.utcnow()
+        upcoming = [snapshot for snapshot in self._open_snapshots(now) if snapshot.start_time > now]
+        return min(upcoming, key=lambda snapshot: snapshot.start_time, default=None)
+
+    def invalidate(self):
+        """Drop cached snapshots in this worker and signal the others"""
+        version = f'{time.time_ns()}-{os.getpid()}'
+        tmp_path = f'{self.version_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, self.version_file)
+        with self._lock:
+            self._clear()
+            self._version = version
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self._quizzes) + (1 if self._open_quizzes else 0),
+            }
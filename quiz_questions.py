@@ -0,0 +1,147 @@
+from sqlalchemy import delete, insert, literal, select
+from app import db
+from models import Quiz, Question, Option, QuizSubmission, Answer
+from quiz_cache import QuizQuestion
+
+MIN_OPTIONS = 2
+MAX_OPTIONS = 6
+
+
+def parse_form(form):
+    """Questions posted by the create/edit quiz forms, as a list of QuizQuestion.
+
+    Reads ``question{n}``, ``question{n}_option{i}`` and ``question{n}_correct``
+    for n = 1, 2, ... until a question is missing. Raises ValueError with a
+    message for the admin if a question is incomplete.
+    """
+    questions = []
+    n = 1
+    while form.get(f'question{n}'):
+        options = []
+        i = 1
+        while form.get(f'question{n}_option{i}'):
+            options.append(form.get(f'question{n}_option{i}'))
+            i += 1
+        if not MIN_OPTIONS <= len(options) <= MAX_OPTIONS:
+            raise ValueError(f'Question {n} needs between {MIN_OPTIONS} and {MAX_OPTIONS} options.')
+
+        correct = form.get(f'question{n}_correct', type=int)
+        if correct is None or not 0 <= correct < len(options):
+            raise ValueError(f'Question {n} needs a correct answer.')
+
+        questions.append(QuizQuestion(form.get(f'question{n}'), tuple(options), correct))
+        n += 1
+
+    if not questions:
+        raise ValueError('A quiz needs at least one question.')
+    return questions
+
+
+def _mirror_legacy_columns(quiz, questions):
+    for n in (1, 2):
+        if n <= len(questions):
+            text, options, correct = questions[n - 1]
+        else:
+            text, options, correct = '', (), 0
+        setattr(quiz, f'question{n}', text)
+        setattr(quiz, f'question{n}_options', list(options))
+        setattr(quiz, f'question{n}_correct', correct)
+
+
+def store(quiz, questions):
+    """Replace the quiz's questions and options; runs in the caller's transaction.
+
+    Questions go in with one executemany INSERT ... RETURNING and options
+    with a second executemany, so a 200-question quiz costs a few
+    statements rather than a flush per row.
+    """
+    _mirror_legacy_columns(quiz, questions)
+    db.session.flush()  # Assigns quiz.id to a new quiz
+
+    existing = select(Question.id).where(Question.quiz_id == quiz.id)
+    db.session.execute(delete(Option).where(Option.question_id.in_(existing))
+                       .execution_options(synchronize_session=False))
+    db.session.execute(delete(Question).where(Question.quiz_id == quiz.id)
+                       .execution_options(synchronize_session=False))
+
+    question_ids = db.session.scalars(
+        insert(Question).returning(Question.id, sort_by_parameter_order=True),
+        [{'quiz_id': quiz.id, 'position': position, 'text': question.text, 'correct_option': question.correct}
+         for position, question in enumerate(questions)]
+    ).all()
+    db.session.execute(insert(Option), [
+        {'question_id': question_id, 'position': position, 'text': text}
+        for question_id, question in zip(question_ids, questions)
+        for position, text in enumerate(question.options)
+    ])
+    db.session.expire(quiz, ['questions'])
+
+
+def answers_from_form(form, questions):
+    """Selected option positions from the ``answer{n}`` fields.
+
+    Returns None if any question is unanswered or the answer is not one of
+    its options.
+    """
+    answers = []
+    for n, question in enumerate(questions, 1):
+        selected = form.get(f'answer{n}', type=int)
+        if selected is None or not 0 <= selected < len(question.options):
+            return None
+        answers.append(selected)
+    return tuple(answers)
+
+
+def legacy_answer_columns(answers):
+    """Values for the answer1/answer2 mirror columns"""
+    return {
+        'answer1': answers[0] if len(answers) > 0 else 0,
+        'answer2': answers[1] if len(answers) > 1 else 0,
+    }
+
+
+def store_answers(sheets):
+    """Bulk insert answer sheets given as (submission_id, answers) pairs; runs in the caller's transaction"""
+    rows = [
+        {'submission_id': submission_id, 'position': position, 'selected': selected}
+        for submission_id, answers in sheets
+        for position, selected in enumerate(answers)
+    ]
+    if rows:
+        db.session.execute(insert(Answer), rows)
+
+
+def answer_sheets(submission_ids):
+    """Map submission id -> list of selected option positions, in one query"""
+    sheets = {submission_id: [] for submission_id in submission_ids}
+    if not sheets:
+        return sheets
+    rows = db.session.execute(
+        select(Answer.submission_id, Answer.selected)
+        .where(Answer.submission_id.in_(list(sheets)))
+        .order_by(Answer.submission_id, Answer.position)
+    )
+    for submission_id, selected in rows:
+        sheets[submission_id].append(selected)
+    return sheets
+
+
+def backfill():
+    """Move quizzes and submissions stored only in the legacy two-question columns into Question/Option/Answer"""
+    legacy = Quiz.query.filter(~Quiz.questions.any()).all()
+    if not legacy:
+        return
+
+    for quiz in legacy:
+        store(quiz, [
+            QuizQuestion(quiz.question1, tuple(quiz.question1_options), quiz.question1_correct),
+            QuizQuestion(quiz.question2, tuple(quiz.question2_options), quiz.question2_correct),
+        ])
+
+    quiz_ids = [quiz.id for quiz in legacy]
+    for position, column in enumerate((QuizSubmission.answer1, QuizSubmission.answer2)):
+        db.session.execute(insert(Answer).from_select(
+            ['submission_id', 'position', 'selected'],
+            select(QuizSubmission.id, literal(position), column).where(QuizSubmission.quiz_id.in_(quiz_ids))
+        ))
+    db.session.commit()
@@ -0,0 +1,176 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Bind key of the read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = 'replica'
+
+# Session cookie key: until when (epoch seconds) this browser reads from the primary
+STICKY_KEY = '_primary_until'
+
+
+class RoutingSession(Session):
+    """db.session class that sends the SELECTs of read-only routes to the replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            router = current_app.extensions.get('replica_router')
+            engine = router.engine_for(self, clause) if router else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _wrote_by_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _wrote_by_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _read_own_writes(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        router = current_app.extensions.get('replica_router')
+        if router and router.enabled:
+            # The replica may not have this commit yet: read from the primary until it should
+            cookie_session[STICKY_KEY] = time.time() + current_app.config['REPLICA_MAX_LAG']
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_writes(session):
+    session.info.pop('wrote', None)
+
+
+@contextmanager
+def primary():
+    """Run the block's queries on the primary, e.g. to fill a cache that later requests share"""
+    if not has_app_context():
+        yield
+        return
+    depth = g.get('replica_paused', 0)
+    g.replica_paused = depth + 1
+    try:
+        yield
+    finally:
+        g.replica_paused = depth
+
+
+def recently_changed(changed_at):
+    """Keep the rest of the request on the primary if data changed less than REPLICA_MAX_LAG seconds ago.
+
+    For pages and fragments versioned by their last change (see
+    FragmentCache.invalidate): a copy rendered from a replica that has not
+    caught up would be cached under the new version.
+    """
+    if has_app_context() and time.time() - changed_at < current_app.config.get('REPLICA_MAX_LAG', 0):
+        g.replica_stale = True
+
+
+class ReplicaRouter:
+    """Routes the reads of read-only pages to a replica of the database.
+
+    With a ``replica`` entry in SQLALCHEMY_BINDS, SELECTs issued by views
+    decorated with ``read_only`` (or inside ``reads()``) run on the replica;
+    everything else, and every flush or write statement, uses the primary.
+
+    A replica trails the primary by up to ``REPLICA_MAX_LAG`` seconds, so:
+
+    - a browser whose request committed a write reads from the primary for
+      that long (a key in the session cookie), e.g. a participant opening
+      results right after submitting, or an admin back on the dashboard
+      after creating a quiz;
+    - caches shared between requests (quiz snapshots, identities, the
+      submission index) are filled inside ``primary()``;
+    - pages and fragments whose version changed within the window are
+      rendered from the primary (``recently_changed()``).
+
+    Locally, point DATABASE_REPLICA_URL at a second SQLite file and copy the
+    primary into it with ``flask --app main sync-replica``; on PostgreSQL use
+    a streaming replica.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        app.config.setdefault('REPLICA_MAX_LAG', 5)
+        self.app = app
+        app.extensions['replica_router'] = self
+        self.enabled = REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+        if not self.enabled:
+            return
+        with app.app_context():
+            replica = db.engines[REPLICA_BIND]
+        if replica.dialect.name == 'sqlite':
+            # Refuse writes that reach the replica by mistake
+            event.listen(replica, 'connect', lambda dbapi_connection, record: dbapi_connection.execute('PRAGMA query_only = ON'))
+
+    def read_only(self, view):
+        """Decorator for views whose reads may be served by the replica"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Not reset afterwards: streamed responses keep reading after the view returns
+            g.replica_reads = True
+            return view(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def reads(self):
+        """Serve the block's reads from the replica"""
+        previous = g.get('replica_reads', False)
+        g.replica_reads = True
+        try:
+            yield
+        finally:
+            g.replica_reads = previous
+
+    def engine_for(self, session, clause):
+        """The replica engine if this statement may read from it, else None"""
+        if not self.enabled or not g.get('replica_reads') or g.get('replica_paused') or g.get('replica_stale'):
+            return None
+        if session._flushing or session.info.get('wrote') or not getattr(clause, 'is_select', False):
+            return None
+        if has_request_context() and cookie_session.get(STICKY_KEY, 0) > time.time():
+            with self._lock:
+                self.sticky_reads += 1
+            return None
+        with self._lock:
+            self.replica_reads += 1
+        return session._db.engines[REPLICA_BIND]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'replica_reads': self.replica_reads,
+                'sticky_reads': self.sticky_reads,
+            }
+
+
+def sync_sqlite(primary_path, replica_path):
+    """Copy a SQLite database over its replica file with the online backup API"""
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
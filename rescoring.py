@@ -0,0 +1,139 @@
+import logging
+from collections import defaultdict, namedtuple
+from itertools import chain
+from sqlalchemy import func, select, update
+from app import db
+from models import Quiz, QuizSubmission, Answer
+import leaderboard
+import scoring
+
+try:
+    import numpy
+except ImportError:  # Falls back to a pure Python pass
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# submissions: rows re-scored, changed: rows whose score or bonus changed,
+# winner_id: the quiz's winner afterwards (None if not locked yet)
+RescoreResult = namedtuple('RescoreResult', ['submissions', 'changed', 'winner_id'])
+
+
+def _submissions(quiz_id, chunk_size):
+    # Core execution on the session's connection skips the ORM result layer
+    return db.session.connection().execute(
+        select(QuizSubmission.id, QuizSubmission.time_taken, QuizSubmission.score,
+               func.coalesce(QuizSubmission.bonus_awarded, False))
+        .where(QuizSubmission.quiz_id == quiz_id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+
+def _answers(quiz_id, chunk_size):
+    return db.session.connection().execute(
+        select(Answer.submission_id, Answer.position, Answer.selected)
+        .join(QuizSubmission, Answer.submission_id == QuizSubmission.id)
+        .where(QuizSubmission.quiz_id == quiz_id)
+        .execution_options(yield_per=chunk_size)
+    ).partitions()
+
+
+def _rescore_numpy(quiz_id, answer_key, chunk_size):
+    """Columnar pass: one int array per column, answers counted with bincount"""
+    rows = numpy.fromiter(chain.from_iterable(_submissions(quiz_id, chunk_size)), dtype='i8').reshape(-1, 4)
+    # Sorted by id (here rather than in SQL) so answers find their row with searchsorted
+    ids, time_taken, old_score, old_bonus = rows[rows[:, 0].argsort()].T
+    key = numpy.array(answer_key or (-1,), dtype='i4')
+
+    # Answer sheets are streamed, so memory stays at one chunk of answers
+    # plus a few ints per submission whatever the number of questions
+    correct = numpy.zeros(len(ids), dtype='i8')
+    for partition in _answers(quiz_id, chunk_size):
+        # Flattening the rows lets fromiter fill the array without
+        # inspecting each Row object
+        submission_ids, positions, selected = numpy.fromiter(
+            chain.from_iterable(partition), dtype='i8', count=3 * len(partition)
+        ).reshape(-1, 3).T
+        hits = (positions < len(answer_key)) & (selected == key[numpy.minimum(positions, len(key) - 1)])
+        correct += numpy.bincount(numpy.searchsorted(ids, submission_ids[hits]), minlength=len(ids))
+
+    bonus = (correct == len(answer_key)) & (time_taken < scoring.SPEED_BONUS_SECONDS)
+    score = correct * scoring.POINTS_PER_CORRECT + bonus * scoring.SPEED_BONUS
+    changed = (score != old_score) | (bonus != old_bonus.astype(bool))
+
+    # Best (score, time) after re-scoring, for the winner check
+    top_key = None
+    if len(ids):
+        top_score = score.max()
+        top_key = (int(top_score), int(time_taken[score == top_score].min()))
+
+    # Changed rows share only a handful of (score, bonus) values
+    updates = {}
+    changed_score, changed_bonus, changed_ids = score[changed], bonus[changed], ids[changed]
+    for new_score, new_bonus in set(zip(changed_score.tolist(), changed_bonus.tolist())):
+        group = (changed_score == new_score) & (changed_bonus == new_bonus)
+        updates[(new_score, new_bonus)] = changed_ids[group].tolist()
+    return len(ids), updates, top_key
+
+
+def _rescore_python(quiz_id, answer_key, chunk_size):
+    rows = {submission_id: (time_taken, score, bonus_awarded)
+            for submission_id, time_taken, score, bonus_awarded in _submissions(quiz_id, chunk_size)}
+    correct = dict.fromkeys(rows, 0)
+    for partition in _answers(quiz_id, chunk_size):
+        for submission_id, position, selected in partition:
+            if position < len(answer_key) and selected == answer_key[position]:
+                correct[submission_id] += 1
+
+    updates = defaultdict(list)
+    top_key = None
+    for submission_id, (time_taken, old_score, old_bonus) in rows.items():
+        bonus = correct[submission_id] == len(answer_key) and time_taken < scoring.SPEED_BONUS_SECONDS
+        score = correct[submission_id] * scoring.POINTS_PER_CORRECT + (scoring.SPEED_BONUS if bonus else 0)
+        if (score, bonus) != (old_score, bool(old_bonus)):
+            updates[(score, bonus)].append(submission_id)
+        if top_key is None or (score, -time_taken) > (top_key[0], -top_key[1]):
+            top_key = (score, time_taken)
+    return len(rows), updates, top_key
+
+
+def rescore_quiz(quiz_id, chunk_size=5000):
+    """Recompute every submission's score and bonus from its stored answers.
+
+    Used after an admin corrects the answer key. Scores are computed in one
+    columnar pass (NumPy when installed), only rows that changed are written
+    back with one ``UPDATE ... WHERE id IN (...)`` per new (score, bonus) and
+    chunk of ids, and the leaderboard buckets are rebuilt with one GROUP BY. A locked quiz keeps its winner if they are
+    still tied for first, otherwise a new one is picked the same way
+    lock_quiz does. Commits.
+    """
+    quiz = db.session.get(Quiz, quiz_id)
+    answer_key = tuple(question.correct_option for question in quiz.questions)
+
+    rescore = _rescore_numpy if numpy is not None else _rescore_python
+    total, updates, top_key = rescore(quiz_id, answer_key, chunk_size)
+
+    # One UPDATE ... WHERE id IN (...) per new (score, bonus) and chunk of ids,
+    # instead of a statement (or executemany parameter set) per row
+    changed = 0
+    for (score, bonus_awarded), submission_ids in updates.items():
+        changed += len(submission_ids)
+        for start in range(0, len(submission_ids), chunk_size):
+            db.session.execute(
+                update(QuizSubmission)
+                .where(QuizSubmission.id.in_(submission_ids[start:start + chunk_size]))
+                .values(score=score, bonus_awarded=bonus_awarded)
+                .execution_options(synchronize_session=False)
+            )
+    # Ranks come from the buckets, so this re-ranks the quiz (and commits)
+    leaderboard.rebuild(quiz_id)
+
+    if quiz.is_locked:
+        winner = leaderboard.submission_of(quiz_id, quiz.winner_id) if quiz.winner_id else None
+        if winner is None or (winner.score, winner.time_taken) != top_key:
+            winner = leaderboard.pick_winner(quiz_id)
+            quiz.winner_id = winner.user_id if winner else None
+            db.session.commit()
+
+    logger.info('Re-scored quiz %s: %d submissions, %d changed', quiz_id, total, changed)
+    return RescoreResult(total, changed, quiz.winner_id)
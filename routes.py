@@ -1,20 +1,38 @@
-from flask import render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session, make_response
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from app import app, db
+from sqlalchemy import select
+from sqlalchemy.orm import aliased, selectinload
+from app import db, quiz_cache, submission_queue, submission_index, photo_pipeline, password_hasher, identity_cache, live_broker, replica_router, submission_partitions
 from models import User, Quiz, QuizSubmission, Winner
 from forms import LoginForm, RegisterForm, QuizSubmissionForm
+from passwords import HashingBusy
+import http_cache
+import leaderboard
+import live
+import quiz_questions
+import scoring
+import submissions
 import random
 
-@app.route('/')
+bp = Blueprint('main', __name__)
+
+def find_submission(user_id, quiz_id):
+    """Stored submission, or one still waiting in the write-behind queue"""
+    submission = QuizSubmission.query.filter_by(
+        user_id=user_id,
+        quiz_id=quiz_id
+    ).first()
+    return submission or submission_queue.pending(user_id, quiz_id)
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = LoginForm()
     if form.validate_on_submit():
@@ -23,26 +41,33 @@ def login():
             session['admin_logged_in'] = True
             session['admin_user'] = 'Algo admin'
             flash('Admin login successful!', 'success')
-            return redirect(url_for('admin_dashboard'))
+            return redirect(url_for('admin.admin_dashboard'))
         
         # Regular user login
         user = User.query.filter_by(email=form.email.data).first()
-        if user and check_password_hash(user.password_hash, form.password.data):
+        try:
+            valid = user and password_hasher.check_and_upgrade(user, form.password.data)
+        except HashingBusy:
+            flash('Too many logins right now, please try again in a moment.', 'warning')
+            return render_template('login.html', form=form), 503
+        if valid:
+            db.session.commit()  # Saves a re-hashed password
             login_user(user)
+            identity_cache.remember(user)
             flash('Login successful!', 'success')
             next_page = request.args.get('quiz')
             if next_page:
-                return redirect(url_for('take_quiz', quiz_id=next_page))
-            return redirect(url_for('dashboard'))
+                return redirect(url_for('main.take_quiz', quiz_id=next_page))
+            return redirect(url_for('main.dashboard'))
         else:
             flash('Invalid email or password', 'danger')
     
     return render_template('login.html', form=form)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = RegisterForm()
     if form.validate_on_submit():
@@ -50,229 +75,295 @@ def register():
         existing_user = User.query.filter_by(email=form.email.data).first()
         if existing_user:
             flash('Email already registered. Please login instead.', 'danger')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
+        
+        try:
+            password_hash = password_hasher.hash(form.password.data)
+        except HashingBusy:
+            flash('Too many sign-ups right now, please try again in a moment.', 'warning')
+            return render_template('register.html', form=form), 503
         
         # Create new user
         user = User(
             name=form.name.data,
             email=form.email.data,
-            password_hash=generate_password_hash(form.password.data)
+            password_hash=password_hash
         )
         db.session.add(user)
         db.session.commit()
         
         login_user(user)
+        identity_cache.remember(user)
         flash('Registration successful! Welcome to Quiz Competition!', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     return render_template('register.html', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
+    identity_cache.forget()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+def showcase_winners():
+    """Active winners for the dashboard carousel; only called when the cached fragment is stale"""
+    with replica_router.reads():
+        winners = Winner.query.filter_by(is_active=True)\
+            .options(selectinload(Winner.quiz).load_only(Quiz.title))\
+            .order_by(Winner.display_order).all()
+    photo_pipeline.debug('dashboard', winners)
+    return winners
+
+@bp.route('/dashboard')
 @login_required
 def dashboard():
     # Get current active quiz
-    now = datetime.utcnow()
-    active_quiz = Quiz.query.filter(
-        Quiz.start_time <= now,
-        Quiz.end_time >= now,
-        Quiz.is_locked == False
-    ).first()
+    active_quiz = quiz_cache.get_active_quiz()
     
-    # Get user's past submissions
-    past_submissions = QuizSubmission.query.filter_by(user_id=current_user.id).all()
+    # Get user's six most recent submissions (oldest first), with their
+    # quizzes: one query over the hot and archived partitions
+    recent = submission_partitions.union(
+        lambda table: select(table).where(table.c.user_id == current_user.id).order_by(table.c.id.desc()).limit(6)
+    )
+    submission = aliased(QuizSubmission, recent)
+    past_submissions = db.session.query(submission)\
+        .options(selectinload(submission.quiz).load_only(Quiz.title, Quiz.results_published))\
+        .order_by(submission.id.desc()).limit(6).all()
+    past_submissions.reverse()
     
     # Check if user has already submitted for active quiz
     already_submitted = False
     if active_quiz:
-        already_submitted = QuizSubmission.query.filter_by(
-            user_id=current_user.id,
-            quiz_id=active_quiz.id
-        ).first() is not None
-    
-    # Get winners for showcase
-    from models import Winner
-    winners = Winner.query.filter_by(is_active=True).order_by(Winner.display_order).all()
-    
-    # Debug: Print winners info
-    print(f"Found {len(winners)} winners")
-    for winner in winners:
-        print(f"Winner: {winner.name}, Photo: {winner.photo_url}")
-        if winner.photo_url:
-            import os
-            photo_path = os.path.join(app.root_path, 'static', winner.photo_url)
-            exists = os.path.exists(photo_path)
-            print(f"  File exists at {photo_path}: {exists}")
-            if exists:
-                file_size = os.path.getsize(photo_path)
-                print(f"  File size: {file_size} bytes")
+        already_submitted = submission_index.has_submitted(active_quiz.id, current_user.id)
     
     return render_template('dashboard.html', 
                          active_quiz=active_quiz, 
+                         # Lets the page reload itself when the next quiz opens
+                         next_quiz=None if active_quiz else quiz_cache.get_next_quiz(),
                          past_submissions=past_submissions,
                          already_submitted=already_submitted,
-                         winners=winners)
+                         load_winners=showcase_winners,
+                         live_cursor=live_broker.cursor())
 
-@app.route('/q/<quiz_url>')
+@bp.route('/q/<quiz_url>')
 def direct_quiz_access(quiz_url):
     quiz = Quiz.query.filter_by(quiz_url=quiz_url).first_or_404()
     
     if not current_user.is_authenticated:
-        return redirect(url_for('login', quiz=quiz.id))
+        return redirect(url_for('main.login', quiz=quiz.id))
     
-    return redirect(url_for('take_quiz', quiz_id=quiz.id))
+    return redirect(url_for('main.take_quiz', quiz_id=quiz.id))
 
-@app.route('/quiz/<int:quiz_id>')
+@bp.route('/quiz/<int:quiz_id>')
 @login_required
 def take_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
+    quiz = quiz_cache.get_quiz_or_404(quiz_id)
     
     # Check if quiz is active
     now = datetime.utcnow()
     if now < quiz.start_time:
         flash('Quiz has not started yet.', 'warning')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if now > quiz.end_time or quiz.is_locked:
         flash('Quiz has ended.', 'warning')
-        return redirect(url_for('dashboard'))
-    
-    # Check if user has already submitted
-    existing_submission = QuizSubmission.query.filter_by(
-        user_id=current_user.id,
-        quiz_id=quiz_id
-    ).first()
+        return redirect(url_for('main.dashboard'))
     
-    if existing_submission:
+    # Check if user has already submitted (in-memory index, no query)
+    if submission_index.has_submitted(quiz_id, current_user.id):
         flash('You have already submitted this quiz.', 'info')
-        return redirect(url_for('quiz_submitted', quiz_id=quiz_id))
+        return redirect(url_for('main.quiz_submitted', quiz_id=quiz_id))
     
     form = QuizSubmissionForm()
     return render_template('quiz.html', quiz=quiz, form=form)
 
-@app.route('/quiz/<int:quiz_id>/submit', methods=['POST'])
+@bp.route('/quiz/<int:quiz_id>/submit', methods=['POST'])
 @login_required
 def submit_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
+    quiz = quiz_cache.get_quiz_or_404(quiz_id)
     
-    # Check if quiz is still active
+    # Check if quiz is still active; the snapshot may be stale, so the
+    # quiz row is checked again when the submission is written
     now = datetime.utcnow()
     if now > quiz.end_time or quiz.is_locked:
         flash('Quiz submission time has ended.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
-    # Check if user has already submitted
-    existing_submission = QuizSubmission.query.filter_by(
-        user_id=current_user.id,
-        quiz_id=quiz_id
-    ).first()
-    
-    if existing_submission:
+    # Queued submissions are only deduplicated against the database here;
+    # direct inserts detect duplicates in the INSERT itself
+    if submission_queue.enabled and find_submission(current_user.id, quiz_id):
         flash('You have already submitted this quiz.', 'warning')
-        return redirect(url_for('quiz_submitted', quiz_id=quiz_id))
+        return redirect(url_for('main.quiz_submitted', quiz_id=quiz_id))
     
     form = QuizSubmissionForm()
     if form.validate_on_submit():
-        # Calculate score
-        score = 0
-        correct_answers = 0
+        answers = quiz_questions.answers_from_form(request.form, quiz.questions)
+        if answers is None:
+            flash('Please answer every question before submitting.', 'danger')
+            return render_template('quiz.html', quiz=quiz, form=form)
         
-        if form.answer1.data == quiz.question1_correct:
-            score += 10
-            correct_answers += 1
+        # Score the whole sheet against the cached answer key
+        score, bonus_awarded = scoring.score_sheet(quiz.answer_key, answers, form.time_taken.data)
         
-        if form.answer2.data == quiz.question2_correct:
-            score += 10
-            correct_answers += 1
+        # Create submission
+        submission = {
+            'user_id': current_user.id,
+            'quiz_id': quiz_id,
+            'time_taken': form.time_taken.data,
+            'score': score,
+            'bonus_awarded': bonus_awarded,
+            'submitted_at': datetime.utcnow(),
+            'answers': answers,
+            **quiz_questions.legacy_answer_columns(answers),
+        }
         
-        # Check for bonus (both correct and under 1 minute)
-        bonus_awarded = False
-        if correct_answers == 2 and form.time_taken.data < 60:
-            score += 5
-            bonus_awarded = True
+        try:
+            if submission_queue.enabled:
+                # Acknowledge now; the background writer inserts it with its next batch
+                inserted = submission_queue.enqueue(submission)
+            else:
+                inserted = submissions.insert_submission(submission)
+                db.session.commit()
+        except submissions.QuizClosed:
+            db.session.rollback()
+            flash('Quiz submission time has ended.', 'danger')
+            return redirect(url_for('main.dashboard'))
         
-        # Create submission
-        submission = QuizSubmission(
-            user_id=current_user.id,
-            quiz_id=quiz_id,
-            answer1=form.answer1.data,
-            answer2=form.answer2.data,
-            time_taken=form.time_taken.data,
-            score=score,
-            bonus_awarded=bonus_awarded
-        )
+        submission_index.mark(quiz_id, current_user.id)
+        if not inserted:
+            flash('You have already submitted this quiz.', 'warning')
+            return redirect(url_for('main.quiz_submitted', quiz_id=quiz_id))
         
-        db.session.add(submission)
-        db.session.commit()
+        # Admins watching the submissions page get the new row pushed to them
+        live_broker.publish(live.quiz_channel(quiz_id), 'submission', {
+            'user_id': current_user.id,
+            'name': current_user.name,
+            'email': current_user.email,
+            'score': score,
+            'correct_answers': scoring.correct_count(score, bonus_awarded),
+            'time_taken': submission['time_taken'],
+            'bonus_awarded': bonus_awarded,
+            'submitted_at': submission['submitted_at'].isoformat() + 'Z',
+        })
         
         flash('Quiz submitted successfully!', 'success')
-        return redirect(url_for('quiz_submitted', quiz_id=quiz_id))
+        return redirect(url_for('main.quiz_submitted', quiz_id=quiz_id))
     
     return render_template('quiz.html', quiz=quiz, form=form)
 
-@app.route('/quiz/<int:quiz_id>/submitted')
+@bp.route('/quiz/<int:quiz_id>/submitted')
 @login_required
+@submission_partitions.route_by_quiz
 def quiz_submitted(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     
     # Get user's submission
-    submission = QuizSubmission.query.filter_by(
-        user_id=current_user.id,
-        quiz_id=quiz_id
-    ).first()
+    submission = find_submission(current_user.id, quiz_id)
     
     if not submission:
         flash('No submission found for this quiz.', 'warning')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
-    return render_template('quiz_submitted.html', quiz=quiz, submission=submission)
+    return render_template('quiz_submitted.html', quiz=quiz, submission=submission,
+                         live_cursor=live_broker.cursor())
 
-@app.route('/results/<int:quiz_id>')
-def view_results(quiz_id):
+@bp.route('/live')
+@login_required
+def live_updates():
+    """Quiz state changes as Server-Sent Events (?format=json long-polls instead)"""
+    if request.args.get('format') == 'json':
+        return live_broker.long_poll([live.QUIZZES_CHANNEL])
+    return live_broker.stream([live.QUIZZES_CHANNEL])
+
+def render_results_page(quiz_id):
+    """The results page for the current viewer (also used for the pre-rendered snapshot)"""
     quiz = Quiz.query.get_or_404(quiz_id)
     
+    # Rank of the logged-in participant, if they took part
+    user_rank = None
+    if current_user.is_authenticated:
+        user_rank = leaderboard.rank_of(quiz_id, current_user.id)
+    
+    winner_submission = None
+    if quiz.winner_id:
+        winner_submission = leaderboard.submission_of(quiz_id, quiz.winner_id)
+    
+    return render_template('results.html', quiz=quiz,
+                         questions=quiz_cache.get_quiz_or_404(quiz_id).questions,
+                         # The leaderboard page is only fetched if its cached fragment is stale
+                         load_results=lambda: leaderboard.page_from_request(quiz_id),
+                         user_rank=user_rank,
+                         winner_submission=winner_submission)
+
+def write_results_snapshot(quiz_id):
+    """Pre-render the anonymous results page to RESULTS_SNAPSHOT_DIR, if snapshots are enabled"""
+    if not current_app.config['RESULTS_SNAPSHOT_DIR']:
+        return
+    # A fresh app context as well, so nothing of the admin's request (g, session) leaks in
+    app = current_app._get_current_object()
+    with app.app_context(), app.test_request_context(url_for('main.view_results', quiz_id=quiz_id)):
+        page = http_cache.validators('results', quiz_id)
+        with submission_partitions.of_quiz(quiz_id):
+            html = render_results_page(quiz_id)
+        http_cache.write_snapshot(f'results-{quiz_id}', page, html)
+
+@bp.route('/results/<int:quiz_id>')
+@replica_router.read_only
+@submission_partitions.route_by_quiz
+def view_results(quiz_id):
+    wants_json = request.args.get('format') == 'json'
+    
     # Check if results are published
-    if not quiz.results_published:
+    if not quiz_cache.get_quiz_or_404(quiz_id).results_published:
+        if wants_json:
+            return {'error': 'Results are not yet published for this quiz.'}, 404
         flash('Results are not yet published for this quiz.', 'info')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
-    # Get all submissions for leaderboard
-    submissions = QuizSubmission.query.filter_by(quiz_id=quiz_id)\
-        .order_by(QuizSubmission.score.desc(), QuizSubmission.time_taken.asc())\
-        .all()
+    # Published results only change when admins edit or re-publish, which
+    # bumps the page version: answer revalidations with 304 before any query
+    page = http_cache.validators('results', quiz_id)
+    response = http_cache.not_modified(page)
+    if response is None and not request.args:
+        response = http_cache.snapshot_response(f'results-{quiz_id}', page)
+    if response is not None:
+        return response
     
-    return render_template('results.html', quiz=quiz, submissions=submissions)
+    if wants_json:
+        # One keyset page of the leaderboard
+        results = leaderboard.page_from_request(quiz_id)
+        sheets = quiz_questions.answer_sheets([submission.id for _, submission in results.entries])
+        return http_cache.apply(make_response({
+            'entries': [{
+                'rank': rank,
+                'name': submission.user.name,
+                'score': submission.score,
+                'correct_answers': submission.correct_answers,
+                'time_taken': submission.time_taken,
+                'bonus_awarded': submission.bonus_awarded,
+                'answers': sheets[submission.id],
+            } for rank, submission in results.entries],
+            'next_cursor': results.next_cursor,
+        }), page)
+    
+    return http_cache.apply(make_response(render_results_page(quiz_id)), page)
 
-@app.route('/winner/<int:winner_id>')
+@bp.route('/winner/<int:winner_id>')
 def winner_landing(winner_id):
+    page = http_cache.validators('winners', winner_id)
+    response = http_cache.not_modified(page)
+    if response is not None:
+        return response
+    
     winner = Winner.query.get_or_404(winner_id)
     
-    # Debug winner data
-    print(f"Loading winner landing for: {winner.name}")
-    print(f"Photo URL: {winner.photo_url}")
-    if winner.photo_url:
-        import os
-        photo_path = os.path.join(app.root_path, 'static', winner.photo_url)
-        exists = os.path.exists(photo_path)
-        print(f"Photo file exists: {exists} at {photo_path}")
-        
-        # Generate the full URL that will be used
-        from flask import url_for
-        if winner.photo_url.startswith('http'):
-            full_url = winner.photo_url
-        else:
-            full_url = url_for('static', filename=winner.photo_url)
-        print(f"Generated URL: {full_url}")
+    photo_pipeline.debug('winner_landing', [winner])
     
-    return render_template('winner_landing.html', winner=winner)
+    return http_cache.apply(make_response(render_template('winner_landing.html', winner=winner)), page)
 
-@app.route('/test-images')
+@bp.route('/test-images')
 def test_images():
     """Test route to check image accessibility"""
     winners = Winner.query.filter_by(is_active=True).all()
@@ -288,16 +379,9 @@ def test_images():
         }
         
         if winner.photo_url:
-            import os
-            from flask import url_for
-            photo_path = os.path.join(app.root_path, 'static', winner.photo_url)
-            result['file_exists'] = os.path.exists(photo_path)
-            result['full_path'] = photo_path
-            
-            if winner.photo_url.startswith('http'):
-                result['generated_url'] = winner.photo_url
-            else:
-                result['generated_url'] = url_for('static', filename=winner.photo_url)
+            info = photo_pipeline.info(winner.photo_url)
+            result.update(file_exists=info.exists, full_path=info.path, generated_url=info.url,
+                          size=info.size, width=info.width, height=info.height)
         
         results.append(result)
     
@@ -0,0 +1,22 @@
+from operator import eq
+
+POINTS_PER_CORRECT = 10
+SPEED_BONUS = 5
+SPEED_BONUS_SECONDS = 60  # All answers correct in less than this earns the bonus
+
+
+def score_sheet(answer_key, answers, time_taken):
+    """Score one answer sheet against a quiz's answer key; returns (score, bonus_awarded).
+
+    ``answer_key`` and ``answers`` are equal-length sequences of option
+    positions. The comparison is a single ``map(eq, ...)`` pass in C, so a
+    200-question sheet costs the same handful of calls as a 2-question one.
+    """
+    correct = sum(map(eq, answer_key, answers))
+    bonus_awarded = correct == len(answer_key) and time_taken < SPEED_BONUS_SECONDS
+    return correct * POINTS_PER_CORRECT + (SPEED_BONUS if bonus_awarded else 0), bonus_awarded
+
+
+def correct_count(score, bonus_awarded):
+    """Number of correct answers behind a stored score"""
+    return (score - (SPEED_BONUS if bonus_awarded else 0)) // POINTS_PER_CORRECT
@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+import time
+from sqlalchemy import event
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are only serialized within a worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Leading keywords of statements that take SQLite's write lock
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class SQLiteTuning:
+    """Connection settings and write serialization for SQLite databases.
+
+    Every new connection gets ``SQLITE_JOURNAL_MODE`` (WAL by default, so
+    readers never wait for a writer or the other way round),
+    ``SQLITE_SYNCHRONOUS`` and ``SQLITE_BUSY_TIMEOUT``. In WAL mode NORMAL
+    only fsyncs at checkpoints: a power cut can lose the last commits but
+    never corrupts the file; use FULL where every acknowledged submission
+    must survive one.
+
+    SQLite still allows one writer at a time, and a writer that finds the
+    database locked sleeps and retries with growing delays, so a burst of
+    concurrent submissions ends in long tails and "database is locked"
+    errors. With ``SQLITE_SERIALIZE_WRITES`` a connection to the main
+    database about to write first takes a writer lock shared by the workers
+    on the host (a thread lock plus ``flock`` on a file next to the
+    database) and keeps it until it is returned to the pool, after its
+    commit or rollback. Threads of a worker queue on the lock, workers
+    check it every few milliseconds (SQLite backs off to 100ms sleeps), and
+    reads never take it. A writer that waits longer than the busy timeout
+    goes ahead without the lock and falls back to SQLite's own retrying.
+
+    Other databases are left untouched.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.lock_path = None
+        self._lock_file = None
+        self._lock_file_pid = None
+        self.writes = 0
+        self.waits = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.timeouts = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        app.config.setdefault('SQLITE_JOURNAL_MODE', 'wal')
+        app.config.setdefault('SQLITE_SYNCHRONOUS', 'normal')
+        app.config.setdefault('SQLITE_BUSY_TIMEOUT', 5000)
+        app.config.setdefault('SQLITE_SERIALIZE_WRITES', True)
+        self.app = app
+        app.extensions['sqlite_tuning'] = self
+
+        # Flask-SQLAlchemy creates its engines in init_app; nothing connects here
+        with app.app_context():
+            engines = dict(db.engines)
+        for bind_key, engine in engines.items():
+            if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                self._tune(engine, primary=bind_key is None)
+
+    def _tune(self, engine, primary):
+        event.listen(engine, 'connect', self._set_pragmas)
+        # Only the main database is written to by the app
+        if primary and self.app.config['SQLITE_SERIALIZE_WRITES']:
+            self.lock_path = f'{engine.url.database}.write-lock'
+            event.listen(engine, 'before_cursor_execute', self._before_write)
+            event.listen(engine.pool, 'checkin', self._after_transaction)
+
+    def _set_pragmas(self, dbapi_connection, connection_record):
+        config = self.app.config
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}")
+            mode = config['SQLITE_JOURNAL_MODE']
+            if mode:
+                cursor.execute(f'PRAGMA journal_mode = {mode}')
+                actual = cursor.fetchone()[0]
+                if actual.lower() != mode.lower():
+                    # e.g. WAL on a network file system; the database still works
+                    logger.warning('SQLite journal_mode is %s, not %s', actual, mode)
+            if config['SQLITE_SYNCHRONOUS']:
+                cursor.execute(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+        finally:
+            cursor.close()
+
+    def _before_write(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get('sqlite_write_lock') is not None:
+            return
+        if not statement.lstrip().upper().startswith(WRITE_STATEMENTS):
+            return
+        conn.info['sqlite_write_lock'] = self._acquire()
+
+    def _after_transaction(self, dbapi_connection, connection_record):
+        # Returned to the pool, so its transaction has been committed or rolled back
+        if connection_record is not None and connection_record.info.pop('sqlite_write_lock', None):
+            self._release()
+
+    def _file(self):
+        # The descriptor is not shared with forked workers, or they would share the lock
+        if self._lock_file is None or self._lock_file_pid != os.getpid():
+            self._lock_file = open(self.lock_path, 'a+')
+            self._lock_file_pid = os.getpid()
+        return self._lock_file
+
+    def _acquire(self):
+        """Take the writer lock; returns True, or False if it timed out and the write goes ahead anyway"""
+        started = time.perf_counter()
+        deadline = started + self.app.config['SQLITE_BUSY_TIMEOUT'] / 1000
+        acquired = self._lock.acquire(timeout=max(0.0, deadline - started))
+        if acquired and fcntl is not None:
+            acquired = self._flock(deadline)
+            if not acquired:
+                self._lock.release()
+
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self.writes += 1
+            if waited_ms >= 1:
+                self.waits += 1
+                self.wait_ms += waited_ms
+                self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+            if not acquired:
+                self.timeouts += 1
+        if not acquired:
+            logger.warning('Waited %.0f ms for the SQLite writer lock; writing without it', waited_ms)
+        return acquired
+
+    def _flock(self, deadline):
+        lock_file = self._file()
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                # Held by another worker; its transaction is usually a few milliseconds
+                if time.perf_counter() + delay > deadline:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
+
+    def _release(self):
+        if fcntl is not None:
+            fcntl.flock(self._file(), fcntl.LOCK_UN)
+        self._lock.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'writes': self.writes,
+                'waits': self.waits,
+                'wait_ms': round(self.wait_ms, 1),
+                'max_wait_ms': round(self.max_wait_ms, 1),
+                'timeouts': self.timeouts,
+            }
@@ -0,0 +1,89 @@
+// Live updates: quiz state changes and new submissions from the server, by
+// long polling or, with LIVE_TRANSPORT=sse, over Server-Sent Events
+window.LiveUpdates = (function() {
+    // Reload after a random delay so clients seeing the same event don't all hit the server at once
+    function reloadSoon(maxDelayMs) {
+        setTimeout(function() {
+            window.location.reload();
+        }, Math.random() * (maxDelayMs || 5000));
+    }
+
+    // Reload shortly after an ISO timestamp (a quiz opening or closing), if it is within a day
+    function reloadAt(isoTime) {
+        let delay = Date.parse(isoTime) - Date.now();
+        if (delay < 24 * 60 * 60 * 1000) {
+            setTimeout(function() {
+                reloadSoon(3000);
+            }, Math.max(0, delay));
+        }
+    }
+
+    // handlers maps event names ("quiz", "submission") to functions taking the event data;
+    // transport is "sse" to stream (where the browser supports it), anything else long-polls
+    function connect(url, after, handlers, transport) {
+        let lastId = after;
+
+        function dispatch(name, data) {
+            if (name === 'resync') {
+                // Missed too much to patch the page; start over
+                reloadSoon(5000);
+            } else if (handlers[name]) {
+                handlers[name](data);
+            }
+        }
+
+        function retryLater(start) {
+            setTimeout(start, 5000 + Math.random() * 25000);
+        }
+
+        function listen() {
+            let source = new EventSource(url + '?after=' + lastId);
+            Object.keys(handlers).concat(['resync']).forEach(function(name) {
+                source.addEventListener(name, function(e) {
+                    if (e.lastEventId) {
+                        lastId = e.lastEventId;
+                    }
+                    dispatch(name, JSON.parse(e.data));
+                });
+            });
+            source.addEventListener('error', function() {
+                // The browser reconnects by itself unless the server refused (e.g. 503)
+                if (source.readyState === EventSource.CLOSED) {
+                    retryLater(listen);
+                }
+            });
+        }
+
+        function poll() {
+            fetch(url + '?format=json&after=' + lastId, {credentials: 'same-origin'})
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(response.status);
+                    }
+                    return response.json();
+                })
+                .then(function(body) {
+                    if (body.resync) {
+                        dispatch('resync', {});
+                        return;
+                    }
+                    body.events.forEach(function(event) {
+                        dispatch(event.event, event.data);
+                    });
+                    lastId = body.last_id;
+                    poll();
+                })
+                .catch(function() {
+                    retryLater(poll);
+                });
+        }
+
+        if (transport === 'sse' && window.EventSource) {
+            listen();
+        } else {
+            poll();
+        }
+    }
+
+    return {connect: connect, reloadSoon: reloadSoon, reloadAt: reloadAt};
+})();
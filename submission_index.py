@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from replicas import primary
+
+
+class UserBitmap:
+    """Set of user ids stored one bit per id (a million users is ~125 KB)"""
+
+    __slots__ = ('_bits', 'count')
+
+    def __init__(self):
+        self._bits = bytearray()
+        self.count = 0
+
+    def add(self, user_id):
+        byte, bit = divmod(user_id, 8)
+        if byte >= len(self._bits):
+            # Grow geometrically so warming in id order stays linear
+            self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits))))
+        mask = 1 << bit
+        if not self._bits[byte] & mask:
+            self._bits[byte] |= mask
+            self.count += 1
+
+    def __contains__(self, user_id):
+        byte, bit = divmod(user_id, 8)
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << bit))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+
+class _QuizEntry:
+    __slots__ = ('bitmap', 'high_water', 'refreshed_at')
+
+    def __init__(self):
+        self.bitmap = UserBitmap()
+        self.high_water = 0
+        self.refreshed_at = 0.0
+
+
+class SubmissionIndex:
+    """Per-worker "has this user submitted?" bitmaps for the open quizzes.
+
+    A quiz's bitmap is warmed from QuizSubmission on first use, then kept
+    current by submit_quiz in this worker and by an incremental
+    ``id > high_water`` query at most once per ``SUBMISSION_INDEX_REFRESH``
+    seconds for submissions written by other workers. A hit is always
+    correct because submissions are never removed; a miss can lag by the
+    refresh interval, which the ON CONFLICT insert in submit_quiz covers.
+    """
+
+    # Ids re-read on each refresh, for rows committed out of id order
+    REFRESH_OVERLAP = 256
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._quizzes = OrderedDict()  # quiz_id -> _QuizEntry, least recently used first
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUBMISSION_INDEX_REFRESH', 1.0)
+        app.config.setdefault('SUBMISSION_INDEX_MAX_QUIZZES', 4)
+        self.refresh_interval = app.config['SUBMISSION_INDEX_REFRESH']
+        self.max_quizzes = app.config['SUBMISSION_INDEX_MAX_QUIZZES']
+        app.extensions['submission_index'] = self
+
+    def _load(self, quiz_id, entry, after_id):
+        from app import db
+        from models import QuizSubmission
+
+        with primary():
+            rows = db.session.query(QuizSubmission.id, QuizSubmission.user_id).filter(
+                QuizSubmission.quiz_id == quiz_id,
+                QuizSubmission.id > after_id
+            ).execution_options(yield_per=10000)
+            for submission_id, user_id in rows:
+                entry.bitmap.add(user_id)
+                if submission_id > entry.high_water:
+                    entry.high_water = submission_id
+        entry.refreshed_at = time.monotonic()
+
+    def _entry(self, quiz_id):
+        # Loading under the lock means one warm-up query per quiz, not one per thread
+        with self._lock:
+            entry = self._quizzes.get(quiz_id)
+            if entry is None:
+                entry = _QuizEntry()
+                self._load(quiz_id, entry, 0)
+                self._quizzes[quiz_id] = entry
+                while len(self._quizzes) > self.max_quizzes:
+                    self._quizzes.popitem(last=False)
+            else:
+                self._quizzes.move_to_end(quiz_id)
+                if time.monotonic() - entry.refreshed_at >= self.refresh_interval:
+                    self._load(quiz_id, entry, max(0, entry.high_water - self.REFRESH_OVERLAP))
+            return entry
+
+    def has_submitted(self, quiz_id, user_id):
+        return user_id in self._entry(quiz_id).bitmap
+
+    def mark(self, quiz_id, user_id):
+        """Record a submission made by this worker"""
+        with self._lock:
+            entry = self._quizzes.get(quiz_id)
+            if entry is not None:
+                entry.bitmap.add(user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                str(quiz_id): {'users': len(entry.bitmap), 'bytes': entry.bitmap.nbytes}
+                for quiz_id, entry in self._quizzes.items()
+            }
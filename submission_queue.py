@@ -0,0 +1,330 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+try:
+    import fcntl
+except ImportError:  # Windows: enqueues and lock_quiz are only serialized within a worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+QUEUE_COLUMNS = ('quiz_id', 'user_id', 'answer1', 'answer2', 'time_taken',
+                 'score', 'bonus_awarded', 'submitted_at', 'answers')
+
+# Errors that say nothing about the rows (database down or locked): the
+# batch stays queued and is retried whole
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+# Stand-in for a QuizSubmission row that is still waiting in the queue
+PendingSubmission = namedtuple('PendingSubmission', QUEUE_COLUMNS)
+
+
+def _decode(row):
+    """QUEUE_COLUMNS row -> dict of QuizSubmission columns plus answers"""
+    values = dict(zip(QUEUE_COLUMNS, row))
+    values['bonus_awarded'] = bool(values['bonus_awarded'])
+    values['submitted_at'] = datetime.fromisoformat(values['submitted_at'])
+    if values['answers'] is None:
+        values['answers'] = (values['answer1'], values['answer2'])
+    else:
+        values['answers'] = tuple(int(selected) for selected in values['answers'].split(',') if selected)
+    return values
+
+
+class SubmissionQueue:
+    """Write-behind ingestion for quiz submissions.
+
+    With ``SUBMISSION_INGESTION = 'batched'`` submit_quiz scores the answers
+    and appends them to a local SQLite queue file (durable across restarts,
+    shared by the workers on one host) instead of committing to the main
+    database. A background thread per worker drains the queue every
+    ``SUBMISSION_FLUSH_INTERVAL`` seconds, or as soon as
+    ``SUBMISSION_BATCH_SIZE`` rows are waiting, with one multi-row
+    ``INSERT ... ON CONFLICT DO NOTHING`` per batch. The queue has its own
+    (quiz_id, user_id) unique key and the insert keeps
+    unique_user_quiz_submission authoritative, so replaying a batch after a
+    crash never creates duplicates. When a batch fails for a reason other
+    than the database being unavailable, its rows are retried one by one
+    and those that still fail move to a ``failed`` table (counted in
+    /admin/metrics), so one bad row cannot hold up the rest of the queue.
+
+    Enqueues (with their check that the quiz is open) and flushes hold a
+    shared ``flock`` on a file next to the queue; lock_quiz locks the quiz
+    and writes its queued rows inside ``closing()``, which holds it
+    exclusively. A row is therefore either queued before the lock, and
+    written before the winner is picked, or refused: nothing acknowledged
+    is dropped later.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.RLock()
+        self._writer = None
+        self._writer_pid = None
+        self._since_flush = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUBMISSION_INGESTION', 'direct')
+        app.config.setdefault('SUBMISSION_BATCH_SIZE', 500)
+        app.config.setdefault('SUBMISSION_FLUSH_INTERVAL', 0.5)
+        app.config.setdefault('SUBMISSION_QUEUE_PATH',
+                              os.path.join(app.instance_path, 'submission_queue.db'))
+        self.app = app
+        app.extensions['submission_queue'] = self
+        if self.enabled:
+            os.makedirs(os.path.dirname(app.config['SUBMISSION_QUEUE_PATH']), exist_ok=True)
+            self._connection()
+            atexit.register(self._flush_at_exit)
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['SUBMISSION_INGESTION'] == 'batched'
+
+    @property
+    def batch_size(self):
+        # Stay under SQLite's limit on bound parameters per statement
+        return max(1, min(self.app.config['SUBMISSION_BATCH_SIZE'], 3000))
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.app.config['SUBMISSION_QUEUE_PATH'], timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pending ('
+                ' id INTEGER PRIMARY KEY,'
+                ' quiz_id INTEGER NOT NULL,'
+                ' user_id INTEGER NOT NULL,'
+                ' answer1 INTEGER NOT NULL,'
+                ' answer2 INTEGER NOT NULL,'
+                ' time_taken INTEGER NOT NULL,'
+                ' score INTEGER NOT NULL,'
+                ' bonus_awarded INTEGER NOT NULL,'
+                ' submitted_at TEXT NOT NULL,'
+                ' answers TEXT,'
+                ' UNIQUE (quiz_id, user_id))'
+            )
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS failed ('
+                f' id INTEGER PRIMARY KEY, {", ".join(QUEUE_COLUMNS)},'
+                f' error TEXT NOT NULL, failed_at TEXT NOT NULL)'
+            )
+            try:
+                # Queue files created before answer sheets were stored
+                conn.execute('ALTER TABLE pending ADD COLUMN answers TEXT')
+            except sqlite3.OperationalError:
+                pass
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, submission):
+        """Queue a scored submission (dict of QuizSubmission columns).
+
+        Returns False if this user already has a submission queued; raises
+        submissions.QuizClosed if the quiz row says it is locked or ended.
+        """
+        import submissions
+
+        submitted_at = submission.get('submitted_at') or datetime.utcnow()
+        values = (
+            submission['quiz_id'], submission['user_id'], submission['answer1'], submission['answer2'],
+            submission['time_taken'], submission['score'], int(bool(submission['bonus_awarded'])),
+            submitted_at.isoformat(),
+            ','.join(map(str, submission['answers'])),
+        )
+        conn = self._connection()
+        # Shared with other enqueues and flushes; closing() waits for it
+        with self._locked(exclusive=False):
+            if not submissions.is_open(submission['quiz_id'], submitted_at):
+                raise submissions.QuizClosed(submission['quiz_id'])
+            try:
+                with conn:
+                    conn.execute(f'INSERT INTO pending ({", ".join(QUEUE_COLUMNS)}) VALUES ({", ".join("?" * len(QUEUE_COLUMNS))})', values)
+            except sqlite3.IntegrityError:
+                return False
+
+        self._ensure_writer()
+        self._since_flush += 1
+        if self._since_flush >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def pending(self, user_id, quiz_id):
+        """Queued, not yet flushed submission for this user and quiz, if any"""
+        if not self.enabled:
+            return None
+        row = self._connection().execute(
+            f'SELECT {", ".join(QUEUE_COLUMNS)} FROM pending WHERE quiz_id = ? AND user_id = ?',
+            (quiz_id, user_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return PendingSubmission(**_decode(row))
+
+    def depth(self):
+        if not self.enabled:
+            return 0
+        return self._connection().execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def failed(self):
+        """Number of queued submissions set aside because inserting them failed"""
+        if not self.enabled:
+            return 0
+        return self._connection().execute('SELECT COUNT(*) FROM failed').fetchone()[0]
+
+    def flush(self, quiz_id=None):
+        """Drain the queue (or one quiz's rows) into QuizSubmission; returns rows flushed"""
+        if not self.enabled:
+            return 0
+        with self._flush_lock, self._locked(exclusive=False):
+            return self._drain(quiz_id)
+
+    @contextmanager
+    def closing(self, quiz_id):
+        """Lock a quiz in the block, then write its queued rows before any other flush.
+
+        Every worker's enqueues and flushes wait until the block has
+        committed the lock and the rows queued so far are written, even
+        though the quiz is locked by then; later enqueues see the lock and
+        are refused.
+        """
+        if not self.enabled:
+            yield
+            return
+        with self._flush_lock, self._locked(exclusive=True):
+            yield
+            self._drain(quiz_id, closing=quiz_id)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        if fcntl is None:
+            # Only enqueues and flushes of this worker are kept apart
+            with self._flush_lock:
+                yield
+            return
+        lock_file = self._file()
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file(self):
+        # flock locks belong to the open file: one per thread, so threads of a
+        # worker exclude each other, and none shared with forked workers
+        lock_file = getattr(self._local, 'lock_file', None)
+        if lock_file is None or getattr(self._local, 'lock_file_pid', None) != os.getpid():
+            lock_file = open(f"{self.app.config['SUBMISSION_QUEUE_PATH']}.flush-lock", 'a+')
+            self._local.lock_file = lock_file
+            self._local.lock_file_pid = os.getpid()
+        return lock_file
+
+    def _drain(self, quiz_id, closing=None):
+        flushed = 0
+        self._since_flush = 0
+        while True:
+            batch = self._flush_batch(quiz_id, closing)
+            flushed += batch
+            if batch < self.batch_size:
+                return flushed
+
+    def _flush_batch(self, quiz_id, closing):
+        conn = self._connection()
+        query = f'SELECT id, {", ".join(QUEUE_COLUMNS)} FROM pending'
+        params = []
+        if quiz_id is not None:
+            query += ' WHERE quiz_id = ?'
+            params.append(quiz_id)
+        rows = conn.execute(query + ' ORDER BY id LIMIT ?', params + [self.batch_size]).fetchall()
+        if not rows:
+            return 0
+
+        try:
+            inserted = self._insert([_decode(row[1:]) for row in rows], closing)
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception:
+            logger.exception('Flushing %d queued submissions failed; retrying them one by one', len(rows))
+            inserted = self._retry_rows(rows, closing)
+        else:
+            # Only now forget the rows; a crash before this point replays the
+            # batch and ON CONFLICT DO NOTHING skips what was already written
+            with conn:
+                conn.executemany('DELETE FROM pending WHERE id = ?', [(row[0],) for row in rows])
+        if inserted < len(rows):
+            logger.warning('Dropped %d duplicate, late or failed queued submissions', len(rows) - inserted)
+        return len(rows)
+
+    def _insert(self, values, closing):
+        import submissions
+        from app import db
+
+        with self.app.app_context():
+            try:
+                inserted = submissions.insert_submissions(values, closing=closing)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        return inserted
+
+    def _retry_rows(self, rows, closing):
+        """Insert a failed batch row by row, moving rows that fail again to the failed table"""
+        conn = self._connection()
+        inserted = 0
+        for row in rows:
+            try:
+                inserted += self._insert([_decode(row[1:])], closing)
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as error:
+                logger.exception('Queued submission %d failed again; moved to the failed table', row[0])
+                with conn:
+                    conn.execute(
+                        f'INSERT INTO failed ({", ".join(QUEUE_COLUMNS)}, error, failed_at) '
+                        f'VALUES ({", ".join("?" * (len(QUEUE_COLUMNS) + 2))})',
+                        tuple(row[1:]) + (repr(error), datetime.utcnow().isoformat())
+                    )
+                    conn.execute('DELETE FROM pending WHERE id = ?', (row[0],))
+                continue
+            with conn:
+                conn.execute('DELETE FROM pending WHERE id = ?', (row[0],))
+        return inserted
+
+    def _ensure_writer(self):
+        # Threads do not survive gunicorn's fork, so start one per worker on demand
+        if self._writer is not None and self._writer.is_alive() and self._writer_pid == os.getpid():
+            return
+        self._writer_pid = os.getpid()
+        self._writer = threading.Thread(target=self._run_writer, name='submission-writer', daemon=True)
+        self._writer.start()
+
+    def _run_writer(self):
+        interval = self.app.config['SUBMISSION_FLUSH_INTERVAL']
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing queued submissions failed; will retry')
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not flush queued submissions at exit; they stay queued')
@@ -0,0 +1,111 @@
+import logging
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from app import db
+from db_helpers import dialect_insert
+from models import Quiz, QuizSubmission
+import leaderboard
+import quiz_questions
+
+logger = logging.getLogger(__name__)
+
+
+class QuizClosed(Exception):
+    """Raised by insert_submission when the quiz was locked or had ended"""
+
+
+def insert_submissions(values, closing=None):
+    """Multi-row insert of scored submissions, skipping users who already submitted.
+
+    Each value is a dict of QuizSubmission columns plus ``answers``, the
+    selected option positions. Answer rows and leaderboard buckets are
+    written for the rows actually inserted. Rows for quizzes that are
+    locked or ended before the row was submitted are dropped, except rows
+    of ``closing``, the quiz lock_quiz is locking (see
+    SubmissionQueue.closing). Runs in the caller's transaction and returns
+    the number of inserted rows.
+    """
+    inserted, closed = _insert(values, closing)
+    if closed:
+        logger.warning('Dropped %d submissions to closed quizzes', closed)
+    return len(inserted)
+
+
+def _insert(values, closing=None):
+    """insert_submissions(); returns the inserted rows and the number dropped as closed"""
+    answers = {(record['user_id'], record['quiz_id']): record['answers'] for record in values}
+    submitted_at = {(record['user_id'], record['quiz_id']): record['submitted_at'] for record in values}
+    rows = [{key: value for key, value in record.items() if key != 'answers'} for record in values]
+
+    stmt = dialect_insert(QuizSubmission)
+    if stmt is not None:
+        stmt = stmt.values(rows).on_conflict_do_nothing(
+            index_elements=['user_id', 'quiz_id']
+        ).returning(QuizSubmission.id, QuizSubmission.user_id, QuizSubmission.quiz_id,
+                    QuizSubmission.score, QuizSubmission.time_taken)
+        inserted = db.session.execute(stmt).all()
+    else:
+        inserted = []
+        for record in rows:
+            try:
+                with db.session.begin_nested():
+                    submission = QuizSubmission(**record)
+                    db.session.add(submission)
+                inserted.append((submission.id, record['user_id'], record['quiz_id'],
+                                 record['score'], record['time_taken']))
+            except IntegrityError:
+                pass
+    inserted, closed = _drop_closed(inserted, submitted_at, closing)
+
+    quiz_questions.store_answers(
+        (submission_id, answers[(user_id, quiz_id)])
+        for submission_id, user_id, quiz_id, _, _ in inserted
+    )
+    leaderboard.record_results((quiz_id, score, time_taken) for _, _, quiz_id, score, time_taken in inserted)
+    return inserted, closed
+
+
+def _drop_closed(inserted, submitted_at, closing):
+    """Delete the just inserted rows of quizzes that are closed; returns the rest and the number deleted.
+
+    The quiz rows are read after the INSERT, in its transaction: SQLite
+    then holds the write lock, and FOR SHARE on PostgreSQL makes lock_quiz
+    wait for this commit, so a quiz cannot be locked between this check
+    and the commit. Quiz snapshots may be stale; this check is not.
+    """
+    if not inserted:
+        return inserted, 0
+    quiz_ids = {quiz_id for _, _, quiz_id, _, _ in inserted}
+    quizzes = {quiz_id: (is_locked, end_time) for quiz_id, is_locked, end_time in db.session.execute(
+        select(Quiz.id, Quiz.is_locked, Quiz.end_time).where(Quiz.id.in_(quiz_ids)).with_for_update(read=True)
+    )}
+
+    def is_closed(row):
+        submission_id, user_id, quiz_id, _, _ = row
+        is_locked, end_time = quizzes.get(quiz_id, (True, None))
+        return (is_locked and quiz_id != closing) or submitted_at[(user_id, quiz_id)] > end_time
+
+    closed = {row[0] for row in inserted if is_closed(row)}
+    if not closed:
+        return inserted, 0
+    db.session.execute(delete(QuizSubmission).where(QuizSubmission.id.in_(closed)))
+    return [row for row in inserted if row[0] not in closed], len(closed)
+
+
+def is_open(quiz_id, at):
+    """Whether the quiz row (not a snapshot) still accepts a submission made at ``at``"""
+    quiz = db.session.execute(select(Quiz.is_locked, Quiz.end_time).where(Quiz.id == quiz_id)).first()
+    return quiz is not None and not quiz.is_locked and at <= quiz.end_time
+
+
+def insert_submission(values):
+    """Insert one scored submission; returns False if the user had already submitted.
+
+    A single INSERT ... ON CONFLICT DO NOTHING RETURNING replaces the old
+    SELECT-then-INSERT, so double submits neither race nor raise. Raises
+    QuizClosed if the quiz was locked or had ended by then.
+    """
+    inserted, closed = _insert([values])
+    if closed:
+        raise QuizClosed(values['quiz_id'])
+    return len(inserted) == 1
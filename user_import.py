@@ -0,0 +1,270 @@
+import csv
+import io
+import json
+import os
+import re
+import secrets
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache, partial
+from email_validator import validate_email, EmailNotValidError
+from flask import current_app
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from app import db
+from db_helpers import dialect_insert
+from models import User
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Same limits as RegisterForm
+NAME_LENGTH = (2, 100)
+PASSWORD_MIN_LENGTH = 6
+EMAIL_MAX_LENGTH = 120
+
+# A rejected input row: line number in the file, email as given and why
+Reject = namedtuple('Reject', ['line', 'email', 'reason'])
+
+
+def format_for(filename, default='csv'):
+    """Import format implied by a file name (``.jsonl``/``.ndjson`` or CSV)"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return 'jsonl' if extension in ('.jsonl', '.ndjson') else default
+
+
+def read_records(stream, fmt):
+    """Yield (line, record) pairs from a binary CSV or JSONL stream without loading it whole.
+
+    CSV files need a header row naming ``name``, ``email`` and optionally
+    ``password`` columns (any case, any order, other columns ignored).
+    A line that cannot be parsed yields a None record.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        reader.fieldnames = [(field or '').strip().lower() for field in reader.fieldnames or []]
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            record = None
+        yield line, record if isinstance(record, dict) else None
+
+
+class ImportReport:
+    """Running totals of an import; the first ``keep_rejects`` rejects are kept for display"""
+
+    def __init__(self, keep_rejects=100):
+        self.started = time.monotonic()
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.rejects = []
+        self.keep_rejects = keep_rejects
+
+    def reject(self, line, email, reason):
+        rejected = Reject(line, email, reason)
+        self.rejected += 1
+        if len(self.rejects) < self.keep_rejects:
+            self.rejects.append(rejected)
+        return rejected
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def as_dict(self):
+        return {
+            'read': self.read,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'seconds': round(self.elapsed, 2),
+            'users_per_second': round(self.imported / self.elapsed, 1) if self.elapsed else None,
+        }
+
+
+# Plain dot-atom local parts, which nearly every corporate address is; anything
+# else gets email_validator's full check
+SIMPLE_LOCAL_PART = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+
+
+@lru_cache(maxsize=1024)
+def _valid_domain(domain):
+    # An import has a handful of domains; the IDNA checks are the slow part of validate_email
+    try:
+        validate_email(f'user@{domain}', check_deliverability=False)
+        return True
+    except EmailNotValidError:
+        return False
+
+
+def _valid_email(email):
+    local, _, domain = email.rpartition('@')
+    if local and len(local) <= 64 and SIMPLE_LOCAL_PART.fullmatch(local):
+        return _valid_domain(domain)
+    try:
+        validate_email(email, check_deliverability=False)
+        return True
+    except EmailNotValidError:
+        return False
+
+
+def _validate(record, generate_passwords):
+    """(name, email, password, generated) for a good record, or a reason string"""
+    if record is None:
+        return 'unreadable line'
+    name = str(record.get('name') or '').strip()
+    email = str(record.get('email') or '').strip()
+    password = str(record.get('password') or '')
+
+    if not NAME_LENGTH[0] <= len(name) <= NAME_LENGTH[1]:
+        return f'name must be {NAME_LENGTH[0]}-{NAME_LENGTH[1]} characters'
+    if len(email) > EMAIL_MAX_LENGTH:
+        return 'email too long'
+    if not _valid_email(email):
+        return 'invalid email'
+    if not password:
+        if not generate_passwords:
+            return 'missing password'
+        return name, email, secrets.token_urlsafe(9), True
+    if len(password) < PASSWORD_MIN_LENGTH:
+        return f'password shorter than {PASSWORD_MIN_LENGTH} characters'
+    return name, email, password, False
+
+
+def _insert_batch(rows):
+    """Batched insert of users, skipping emails registered meanwhile; returns the inserted emails.
+
+    Rows are passed as executemany parameters rather than one huge VALUES
+    clause, so SQLAlchemy compiles the statement once and sends it in
+    multi-row batches ("insertmanyvalues") with RETURNING.
+    """
+    table = User.__table__
+    stmt = dialect_insert(table)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=['email']).returning(table.c.email)
+        inserted = set(db.session.execute(stmt, rows).scalars())
+    else:
+        db.session.execute(insert(table), rows)
+        inserted = {row['email'] for row in rows}
+    db.session.commit()
+    return inserted
+
+
+def iter_import(records, batch_size=None, workers=None, hash_method=None, generate_passwords=False,
+                on_reject=None, on_created=None):
+    """Create users from (line, record) pairs, e.g. from read_records(), yielding the ImportReport after each batch.
+
+    Records are validated and checked against emails already in the file
+    and, one ``IN`` query per batch, in the database. Passwords are hashed
+    in a pool of ``workers`` processes (default USER_IMPORT_WORKERS; 0
+    hashes inline) while the previous batch of ``batch_size`` users
+    (default USER_IMPORT_BATCH_SIZE) is inserted with one multi-row
+    ``INSERT ... ON CONFLICT DO NOTHING``, so a user registering during the
+    import is skipped rather than failing the batch.
+
+    ``hash_method`` defaults to PASSWORD_HASH_METHOD; a cheaper one speeds
+    up large imports, and check_and_upgrade() re-hashes each password with
+    the current method at the user's first login.
+
+    Callbacks: ``on_reject(reject)`` per rejected row and
+    ``on_created(name, email, password)`` per user created with a
+    generated password.
+    """
+    config = current_app.config
+    if workers is None:
+        workers = config['USER_IMPORT_WORKERS']
+    # Stay under SQLite's limit on bound parameters per statement (four per user)
+    batch_size = max(1, min(batch_size or config['USER_IMPORT_BATCH_SIZE'], 5000))
+    hasher = partial(generate_password_hash, method=hash_method or config['PASSWORD_HASH_METHOD'],
+                     salt_length=config['PASSWORD_SALT_LENGTH'])
+    report = ImportReport()
+    seen = set()
+
+    def reject(line, email, reason):
+        rejected = report.reject(line, email, reason)
+        if on_reject:
+            on_reject(rejected)
+
+    def prepare(batch):
+        """Drop emails that are already registered and start hashing the rest"""
+        existing = set(db.session.scalars(select(User.email).where(User.email.in_([entry[2] for entry in batch]))))
+        accepted = []
+        for entry in batch:
+            if entry[2] in existing:
+                reject(entry[0], entry[2], 'already registered')
+            else:
+                accepted.append(entry)
+        passwords = [entry[3] for entry in accepted]
+        if pool is None:
+            return accepted, map(hasher, passwords)
+        # Executor.map submits everything now; results are collected in finish()
+        return accepted, pool.map(hasher, passwords, chunksize=max(1, len(passwords) // (workers * 4)))
+
+    def finish(accepted, hashes):
+        now = datetime.utcnow()
+        rows = [{'name': name, 'email': email, 'password_hash': password_hash, 'created_at': now}
+                for (_, name, email, _, _), password_hash in zip(accepted, hashes)]
+        inserted = _insert_batch(rows) if rows else set()
+        for line, name, email, password, generated in accepted:
+            if email not in inserted:
+                reject(line, email, 'already registered')
+            elif generated and on_created:
+                on_created(name, email, password)
+        report.imported += len(inserted)
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+    try:
+        batch = []
+        in_flight = None
+        for line, record in records:
+            report.read += 1
+            checked = _validate(record, generate_passwords)
+            email = str((record or {}).get('email') or '').strip()
+            if isinstance(checked, str):
+                reject(line, email, checked)
+                continue
+            if email in seen:
+                reject(line, email, 'duplicate in file')
+                continue
+            seen.add(email)
+            batch.append((line, *checked))
+
+            if len(batch) >= batch_size:
+                # Hash this batch while the previous one is written
+                prepared = prepare(batch)
+                batch = []
+                if in_flight:
+                    finish(*in_flight)
+                    yield report
+                in_flight = prepared
+
+        if batch:
+            prepared = prepare(batch)
+            if in_flight:
+                finish(*in_flight)
+                yield report
+            in_flight = prepared
+        if in_flight:
+            finish(*in_flight)
+        yield report
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def import_users(records, on_progress=None, **options):
+    """Run iter_import() to the end, calling ``on_progress(report)`` after each batch; returns the report"""
+    report = None
+    for report in iter_import(records, **options):
+        if on_progress:
+            on_progress(report)
+    return report